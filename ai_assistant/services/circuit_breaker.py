@@ -0,0 +1,207 @@
+"""
+Circuit Breaker - プロバイダーごとのサーキットブレーカーと健全性スコア
+障害中のプロバイダーをすぐにスキップし、定期的に試行して復旧を確認する
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+@dataclass
+class CircuitBreakerConfig:
+    """サーキットブレーカーの設定"""
+    enabled: bool = True
+    window: float = 60.0  # 集計するローリングウィンドウ (seconds)
+    min_calls: int = 10  # 判定に必要な最小呼び出し数
+    error_rate_threshold: float = 0.5
+    slow_call_threshold: float = 20.0  # これより遅い呼び出しは失敗として数える (seconds)
+    open_duration: float = 30.0  # オープン後に試行を再開するまでの時間 (seconds)
+    redis_url: Optional[str] = None  # 指定するとワーカー間でオープン状態を共有する
+    redis_refresh_interval: float = 1.0  # Redisの状態を読み直す間隔 (seconds)
+
+
+class RedisCircuitStore:
+    """ワーカー間で共有するオープン状態（Redisのキーの有無で表す）"""
+
+    key_prefix = "sister_ai:circuit:"
+
+    def __init__(self, redis_url: str):
+        import redis
+
+        self.client = redis.Redis.from_url(redis_url, socket_timeout=0.05, socket_connect_timeout=0.05)
+
+    def mark_open(self, name: str, seconds: float):
+        try:
+            self.client.set(self.key_prefix + name, "1", px=int(seconds * 1000))
+        except Exception as e:
+            logger.debug(f"Circuit state write failed ({name}): {e}")
+
+    def clear(self, name: str):
+        try:
+            self.client.delete(self.key_prefix + name)
+        except Exception as e:
+            logger.debug(f"Circuit state clear failed ({name}): {e}")
+
+    def open_remaining(self, name: str) -> float:
+        """オープン状態の残り秒数（クローズなら0）"""
+        try:
+            remaining = self.client.pttl(self.key_prefix + name)
+        except Exception as e:
+            logger.debug(f"Circuit state read failed ({name}): {e}")
+            return 0.0
+        return remaining / 1000 if remaining and remaining > 0 else 0.0
+
+
+class CircuitBreaker:
+    """1プロバイダー分のサーキットブレーカー
+
+    - closed: 通常どおり呼び出す。ウィンドウ内のエラー率が閾値を超えたら open
+    - open: 呼び出さずにスキップする。open_duration 経過後に1回だけ試行を許可 (half_open)
+    - half_open: 試行が成功すれば closed、失敗すれば再び open
+    """
+
+    def __init__(self, name: str, config: Optional[CircuitBreakerConfig] = None,
+                 store: Optional[RedisCircuitStore] = None):
+        self.name = name
+        self.config = config or CircuitBreakerConfig()
+        self.store = store
+        self.state = CLOSED
+
+        self._calls: Deque[Tuple[float, bool, float]] = deque()  # (時刻, 成功, レイテンシ)
+        self._next_probe_at = 0.0
+        self._remote_checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """呼び出してよいかを判定"""
+        if not self.config.enabled:
+            return True
+
+        now = time.monotonic()
+        self._sync_remote(now)
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if now >= self._next_probe_at:
+                # 定期的に1回だけ試行する（結果が返らなくても次の周期でまた試す）
+                self.state = HALF_OPEN
+                self._next_probe_at = now + self.config.open_duration
+                logger.info(f"Circuit half-open, probing {self.name}")
+                return True
+        metrics.increment("sister_ai_circuit_rejected_total", provider=self.name)
+        return False
+
+    def record_success(self, latency: float):
+        """成功した呼び出しを記録"""
+        if latency > self.config.slow_call_threshold:
+            self.record_failure(latency)
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            self._calls.append((now, True, latency))
+            self._prune(now)
+            closing = self.state != CLOSED
+            if closing:
+                self.state = CLOSED
+                self._calls.clear()
+        if closing:
+            logger.info(f"Circuit closed: {self.name} recovered")
+            if self.store:
+                self.store.clear(self.name)
+
+    def record_failure(self, latency: float = 0.0):
+        """失敗した呼び出しを記録"""
+        with self._lock:
+            now = time.monotonic()
+            self._calls.append((now, False, latency))
+            self._prune(now)
+            opening = self.state == HALF_OPEN or (
+                self.state == CLOSED and self._should_open()
+            )
+            if opening:
+                self.state = OPEN
+                self._next_probe_at = now + self.config.open_duration
+        if opening:
+            logger.warning(f"Circuit opened: skipping {self.name} for {self.config.open_duration}s")
+            metrics.increment("sister_ai_circuit_opened_total", provider=self.name)
+            if self.store:
+                self.store.mark_open(self.name, self.config.open_duration)
+
+    def health(self) -> Dict[str, Any]:
+        """健全性スコア (0〜1) と集計値"""
+        with self._lock:
+            self._prune(time.monotonic())
+            calls = list(self._calls)
+            state = self.state
+
+        error_rate = sum(1 for _, ok, _ in calls if not ok) / len(calls) if calls else 0.0
+        latencies = sorted(latency for _, ok, latency in calls if ok)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else None
+
+        score = 0.0 if state == OPEN else 1.0 - error_rate
+        if p95 is not None:
+            score *= min(1.0, self.config.slow_call_threshold / max(p95 * 2, 1e-3))
+        return {
+            "state": state,
+            "score": round(score, 3),
+            "calls": len(calls),
+            "error_rate": round(error_rate, 3),
+            "p95_latency": p95,
+        }
+
+    def _should_open(self) -> bool:
+        if len(self._calls) < self.config.min_calls:
+            return False
+        failures = sum(1 for _, ok, _ in self._calls if not ok)
+        return failures / len(self._calls) >= self.config.error_rate_threshold
+
+    def _prune(self, now: float):
+        cutoff = now - self.config.window
+        while self._calls and self._calls[0][0] < cutoff:
+            self._calls.popleft()
+
+    def _sync_remote(self, now: float):
+        """他のワーカーがオープンにした状態を取り込む"""
+        if self.store is None or now - self._remote_checked_at < self.config.redis_refresh_interval:
+            return
+        self._remote_checked_at = now
+        remaining = self.store.open_remaining(self.name)
+        with self._lock:
+            if remaining and self.state == CLOSED:
+                self.state = OPEN
+                self._next_probe_at = now + remaining
+                logger.info(f"Circuit opened by another worker: {self.name}")
+
+
+class CircuitBreakerRegistry:
+    """プロバイダー名ごとのサーキットブレーカー"""
+
+    def __init__(self, config: Optional[CircuitBreakerConfig] = None):
+        self.config = config or CircuitBreakerConfig()
+        self.store = RedisCircuitStore(self.config.redis_url) if self.config.redis_url else None
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            if name not in self._breakers:
+                self._breakers[name] = CircuitBreaker(name, self.config, self.store)
+            return self._breakers[name]
+
+    def health(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.name: breaker.health() for breaker in breakers}
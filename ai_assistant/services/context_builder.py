@@ -0,0 +1,154 @@
+"""
+Context Builder - プロバイダー呼び出し用のコンテキストウィンドウ構築
+システムプロンプト・会話履歴・今回のメッセージをトークン予算内に収める
+"""
+
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from .sister_ai import ChatMessage
+
+# モデルごとの入力トークン予算（出力分は別途差し引く）
+DEFAULT_TOKEN_BUDGETS: Dict[str, int] = {
+    "claude-3-sonnet-20240229": 12000,
+    "claude-3-haiku-20240307": 12000,
+    "gpt-4": 7000,
+    "gpt-3.5-turbo": 3500,
+}
+
+TRUNCATION_MARKER = "\n...（省略）...\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """トークン数の高速な概算
+
+    英数字は約4文字で1トークン、日本語などの非ASCII文字は1文字1トークン前後になる。
+    UTF-8のバイト長との差から非ASCII文字数を推定し、文字列の走査をCレベルで済ませる。
+    """
+    if not text:
+        return 0
+    length = len(text)
+    non_ascii = min(length, (len(text.encode("utf-8")) - length) // 2)
+    return non_ascii + (length - non_ascii + 3) // 4 + 1
+
+
+def truncate_to_tokens(text: str, max_tokens: int, keep: str = "both") -> str:
+    """テキストを max_tokens 以内に切り詰める
+
+    keep="head" は先頭、"tail" は末尾、"both" は先頭と末尾を残して中央を省略する。
+    """
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+
+    marker_tokens = estimate_tokens(TRUNCATION_MARKER)
+    chars_per_token = len(text) / tokens
+    keep_chars = max(0, int((max_tokens - marker_tokens) * chars_per_token))
+
+    if keep == "head":
+        return text[:keep_chars] + TRUNCATION_MARKER
+    if keep == "tail":
+        return TRUNCATION_MARKER + text[len(text) - keep_chars:]
+    head = keep_chars // 2
+    tail = keep_chars - head
+    return text[:head] + TRUNCATION_MARKER + text[len(text) - tail:]
+
+
+@dataclass
+class ContextWindow:
+    """プロバイダーに送るコンテキスト"""
+    system: str
+    messages: List[Dict[str, str]] = field(default_factory=list)
+    tokens: int = 0
+    dropped_turns: int = 0
+    truncated: bool = False
+
+
+class ContextBuilder:
+    """トークン予算に合わせてコンテキストを組み立てる
+
+    - システムプロンプトと今回のメッセージは必ず含める（大きすぎる場合は中央を省略）
+    - 履歴は新しい順に詰め、入りきらない古いターンから切り詰め・削除する
+    - 1ターンあたりの上限を設け、過去に貼られた巨大なコードが予算を占有しないようにする
+    """
+
+    def __init__(
+        self,
+        budgets: Optional[Dict[str, int]] = None,
+        default_budget: int = 4000,
+        max_turn_ratio: float = 0.25,
+        min_turn_tokens: int = 64,
+    ):
+        self.budgets = {**DEFAULT_TOKEN_BUDGETS, **(budgets or {})}
+        self.default_budget = default_budget
+        self.max_turn_ratio = max_turn_ratio
+        self.min_turn_tokens = min_turn_tokens
+
+    def budget_for(self, model: str) -> int:
+        """モデルの入力トークン予算"""
+        return self.budgets.get(model, self.default_budget)
+
+    def build(
+        self,
+        model: str,
+        system_prompt: str,
+        history: List["ChatMessage"],
+        message: str,
+        max_output_tokens: int = 0,
+    ) -> ContextWindow:
+        """コンテキストウィンドウを構築"""
+        budget = max(self.budget_for(model) - max_output_tokens, self.min_turn_tokens)
+        window = ContextWindow(system=system_prompt)
+
+        system_tokens = estimate_tokens(system_prompt)
+        message_budget = max(budget - system_tokens, self.min_turn_tokens)
+        if estimate_tokens(message) > message_budget:
+            message = truncate_to_tokens(message, message_budget)
+            window.truncated = True
+        remaining = budget - system_tokens - estimate_tokens(message)
+
+        # 新しいターンから順に詰める
+        max_turn_tokens = max(int(budget * self.max_turn_ratio), self.min_turn_tokens)
+        turns: List[Dict[str, str]] = []
+        candidates = [m for m in history if m.role in ("user", "assistant")]
+        for index in range(len(candidates) - 1, -1, -1):
+            hist_msg = candidates[index]
+            content = hist_msg.content
+            limit = min(max_turn_tokens, remaining)
+            tokens = estimate_tokens(content)
+            if tokens > limit:
+                if limit < self.min_turn_tokens:
+                    window.dropped_turns += index + 1
+                    break
+                content = truncate_to_tokens(content, limit)
+                tokens = estimate_tokens(content)
+                window.truncated = True
+            turns.append({"role": hist_msg.role, "content": content})
+            remaining -= tokens
+
+        turns.reverse()
+        # 先頭はuserでなければならないので、はみ出したassistantの応答は落とす
+        while turns and turns[0]["role"] != "user":
+            turns.pop(0)
+            window.dropped_turns += 1
+        turns.append({"role": "user", "content": message})
+        window.messages = self._merge_roles(turns)
+        window.tokens = budget - remaining
+        return window
+
+    def _merge_roles(self, turns: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """userとassistantが交互になるように連続する同じ役割をまとめる"""
+        normalized: List[Dict[str, str]] = []
+        for turn in turns:
+            if normalized and normalized[-1]["role"] == turn["role"]:
+                # 同じ役割が続く場合は1つにまとめる
+                normalized[-1] = {
+                    "role": turn["role"],
+                    "content": normalized[-1]["content"] + "\n\n" + turn["content"],
+                }
+            else:
+                normalized.append(turn)
+        return normalized
@@ -0,0 +1,339 @@
+"""
+Fake Provider - 負荷試験用のClaude/OpenAI互換の擬似プロバイダー
+本物のAPIと同じ形の応答を、設定した遅延・生成速度・エラー率で返す（プロセス内の transport と小さなHTTPサーバー）
+"""
+
+import asyncio
+import json
+import logging
+import math
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+
+from .context_builder import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# 応答本文の素材（コードレビューの行番号付き指摘としても読める形にしておく）
+RESPONSE_SENTENCES = [
+    "お兄ちゃん、ちゃんと見てみたよ！",
+    "- 12行目: 変数名をもう少し分かりやすくするといいかも。",
+    "全体的にはすっきり書けてると思うな。",
+    "- 20〜24行目: 例外を握りつぶしちゃってるから、ログだけでも残してね。",
+    "テストも一緒に書いておくと安心だよ。",
+    "- 31行目: ループの中で毎回同じ計算をしてるから外に出せそう。",
+    "困ったらいつでも紗良に聞いてね、お兄ちゃん。",
+]
+
+ANTHROPIC = "anthropic"
+OPENAI = "openai"
+
+
+@dataclass
+class FakeProviderConfig:
+    """擬似プロバイダーの設定"""
+    latency: str = "lognormal"  # 最初のトークンまでの遅延の分布: fixed / uniform / lognormal
+    latency_median: float = 0.8  # fixed ではこの値、lognormal では中央値 (seconds)
+    latency_p99: float = 3.0  # lognormal の99パーセンタイル、uniform の上限 (seconds)
+    latency_min: float = 0.1  # uniform の下限 (seconds)
+    tokens_per_second: float = 60.0  # 生成速度（0で遅延の後すぐに全部返す）
+    response_tokens: int = 200  # 応答のトークン数（リクエストの max_tokens が小さければそちら）
+    error_rate: float = 0.0  # 500を返す割合
+    rate_limit_rate: float = 0.0  # 429を返す割合
+    retry_after: float = 1.0  # 429の retry-after (seconds)
+    seed: Optional[int] = None
+
+
+class FakeProvider:
+    """リクエストのパスでClaude（/messages）かOpenAI（/chat/completions）かを判断して応答を作る"""
+
+    def __init__(self, config: Optional[FakeProviderConfig] = None):
+        self.config = config or FakeProviderConfig()
+        self.random = random.Random(self.config.seed)
+        self.requests = 0
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        if request.method == "HEAD":
+            return httpx.Response(200)
+
+        path = request.url.path
+        if path.endswith("/messages"):
+            api = ANTHROPIC
+        elif path.endswith("/chat/completions"):
+            api = OPENAI
+        else:
+            return httpx.Response(404, json={"error": {"type": "not_found", "message": f"unknown path {path}"}})
+
+        self.requests += 1
+        try:
+            body = json.loads(request.content or b"{}")
+        except ValueError:
+            return _error(api, 400, "invalid_request_error", "request body is not valid JSON")
+
+        # エラーは遅延を待たずに返す（本物のAPIでも拒否は早い）
+        roll = self.random.random()
+        if roll < self.config.rate_limit_rate:
+            response = _error(api, 429, "rate_limit_error", "fake provider rate limit")
+            response.headers["retry-after"] = f"{self.config.retry_after:g}"
+            return response
+        if roll < self.config.rate_limit_rate + self.config.error_rate:
+            await asyncio.sleep(self.sample_latency())
+            return _error(api, 500, "api_error", "fake provider internal error")
+
+        model = body.get("model") or "fake-model"
+        input_tokens = estimate_tokens(json.dumps(body.get("system", ""), ensure_ascii=False)) + sum(
+            estimate_tokens(json.dumps(message.get("content", ""), ensure_ascii=False))
+            for message in body.get("messages", [])
+        )
+        max_tokens = int(body.get("max_tokens") or self.config.response_tokens)
+        output_tokens = max(1, min(self.config.response_tokens, max_tokens))
+        pieces = _response_pieces(output_tokens)
+
+        if body.get("stream"):
+            stream = self._stream_anthropic if api == ANTHROPIC else self._stream_openai
+            return httpx.Response(
+                200,
+                headers={"content-type": "text/event-stream"},
+                content=stream(model, pieces, input_tokens, body),
+            )
+
+        await asyncio.sleep(self.sample_latency() + self._generation_time(len(pieces)))
+        text = "".join(pieces)
+        if api == ANTHROPIC:
+            return httpx.Response(200, json=_anthropic_message(model, text, input_tokens, len(pieces)))
+        return httpx.Response(200, json=_openai_completion(model, text, input_tokens, len(pieces)))
+
+    def sample_latency(self) -> float:
+        """最初のトークンまでの遅延 (seconds)"""
+        config = self.config
+        if config.latency == "fixed":
+            return config.latency_median
+        if config.latency == "uniform":
+            return self.random.uniform(config.latency_min, config.latency_p99)
+        # 対数正規分布: p99 = 中央値 * exp(2.326 * sigma)
+        sigma = math.log(max(config.latency_p99, config.latency_median) / config.latency_median) / 2.326
+        return self.random.lognormvariate(math.log(config.latency_median), sigma)
+
+    def _generation_time(self, tokens: int) -> float:
+        return tokens / self.config.tokens_per_second if self.config.tokens_per_second > 0 else 0.0
+
+    async def _paced(self, pieces: List[str]) -> AsyncIterator[str]:
+        """遅延の後、生成速度に合わせて1トークンずつ出す（sleep の誤差は累積させない）"""
+        await asyncio.sleep(self.sample_latency())
+        started = time.monotonic()
+        for index, piece in enumerate(pieces):
+            if self.config.tokens_per_second > 0:
+                delay = started + index / self.config.tokens_per_second - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield piece
+
+    async def _stream_anthropic(self, model: str, pieces: List[str], input_tokens: int,
+                                body: Dict) -> AsyncIterator[bytes]:
+        message = _anthropic_message(model, "", input_tokens, 0)
+        message.update(content=[], stop_reason=None)
+        yield _sse("message_start", {"type": "message_start", "message": message})
+        yield _sse("content_block_start", {
+            "type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""},
+        })
+        async for piece in self._paced(pieces):
+            yield _sse("content_block_delta", {
+                "type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": piece},
+            })
+        yield _sse("content_block_stop", {"type": "content_block_stop", "index": 0})
+        yield _sse("message_delta", {
+            "type": "message_delta",
+            "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+            "usage": {"output_tokens": len(pieces)},
+        })
+        yield _sse("message_stop", {"type": "message_stop"})
+
+    async def _stream_openai(self, model: str, pieces: List[str], input_tokens: int,
+                             body: Dict) -> AsyncIterator[bytes]:
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+
+        def chunk(delta: Dict, finish_reason: Optional[str] = None, usage: Optional[Dict] = None) -> bytes:
+            return _sse(None, {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [] if usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                "usage": usage,
+            })
+
+        yield chunk({"role": "assistant", "content": ""})
+        async for piece in self._paced(pieces):
+            yield chunk({"content": piece})
+        yield chunk({}, finish_reason="stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield chunk({}, usage=_openai_usage(input_tokens, len(pieces)))
+        yield b"data: [DONE]\n\n"
+
+
+class FakeProviderTransport(httpx.AsyncBaseTransport):
+    """httpx.AsyncClient に差し込むプロセス内の擬似プロバイダー"""
+
+    def __init__(self, config: Optional[FakeProviderConfig] = None):
+        self.provider = FakeProvider(config)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        return await self.provider.handle(request)
+
+
+def _response_pieces(tokens: int) -> List[str]:
+    """tokens 個のトークン（の概算）に分けた応答本文"""
+    text = ""
+    index = 0
+    while estimate_tokens(text) < tokens:
+        text += RESPONSE_SENTENCES[index % len(RESPONSE_SENTENCES)] + "\n"
+        index += 1
+    size = max(1, math.ceil(len(text) / tokens))
+    return [text[i:i + size] for i in range(0, len(text), size)][:tokens]
+
+
+def _sse(event: Optional[str], data: Dict) -> bytes:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+def _anthropic_message(model: str, text: str, input_tokens: int, output_tokens: int) -> Dict:
+    return {
+        "id": f"msg_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": model,
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens},
+    }
+
+
+def _openai_usage(input_tokens: int, output_tokens: int) -> Dict:
+    return {
+        "prompt_tokens": input_tokens,
+        "completion_tokens": output_tokens,
+        "total_tokens": input_tokens + output_tokens,
+    }
+
+
+def _openai_completion(model: str, text: str, input_tokens: int, output_tokens: int) -> Dict:
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": text},
+            "finish_reason": "stop",
+        }],
+        "usage": _openai_usage(input_tokens, output_tokens),
+    }
+
+
+def _error(api: str, status_code: int, error_type: str, message: str) -> httpx.Response:
+    if api == ANTHROPIC:
+        return httpx.Response(status_code, json={"type": "error", "error": {"type": error_type, "message": message}})
+    return httpx.Response(status_code, json={"error": {"type": error_type, "message": message, "code": None}})
+
+
+class FakeProviderServer:
+    """擬似プロバイダーを別プロセスから使うための最小限のHTTP/1.1サーバー（keep-alive と chunked 応答に対応）
+
+    Claudeは base_url に http://host:port、OpenAIは http://host:port/v1 を指定する。
+    """
+
+    def __init__(self, config: Optional[FakeProviderConfig] = None, host: str = "127.0.0.1", port: int = 8765):
+        self.provider = FakeProvider(config)
+        self.host = host
+        self.port = port
+        self.server: Optional[asyncio.AbstractServer] = None
+        self._connections: Dict["asyncio.Task", asyncio.StreamWriter] = {}
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info(f"Fake provider listening on http://{self.host}:{self.port}")
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            # keep-alive の接続が残っていると wait_closed が終わらないので、こちらから閉じて終わるのを待つ
+            connections = dict(self._connections)
+            for writer in connections.values():
+                writer.close()
+            await asyncio.gather(*connections, return_exceptions=True)
+            await self.server.wait_closed()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                response = await self.provider.handle(request)
+                await self._write_response(writer, response)
+                if request.headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logger.error(f"Fake provider connection error: {e}")
+        finally:
+            self._connections.pop(task, None)
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[httpx.Request]:
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+        headers: List[Tuple[str, str]] = []
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers.append((name.strip(), value.strip()))
+        length = int(dict((name.lower(), value) for name, value in headers).get("content-length", 0))
+        body = await reader.readexactly(length) if length else b""
+        return httpx.Request(method, f"http://{self.host}:{self.port}{target}", headers=headers, content=body)
+
+    async def _write_response(self, writer: asyncio.StreamWriter, response: httpx.Response):
+        streaming = not isinstance(response.stream, httpx.ByteStream)
+        headers = [(name, value) for name, value in response.headers.items()
+                   if name.lower() not in ("content-length", "transfer-encoding")]
+        if streaming:
+            headers.append(("transfer-encoding", "chunked"))
+        else:
+            headers.append(("content-length", str(len(response.content))))
+        head = f"HTTP/1.1 {response.status_code} {response.reason_phrase}\r\n"
+        head += "".join(f"{name}: {value}\r\n" for name, value in headers) + "\r\n"
+        writer.write(head.encode("latin-1"))
+
+        if not streaming:
+            writer.write(response.content)
+            await writer.drain()
+            return
+        async for chunk in response.aiter_raw():
+            writer.write(f"{len(chunk):x}\r\n".encode("latin-1") + chunk + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
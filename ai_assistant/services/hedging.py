@@ -0,0 +1,217 @@
+"""
+Hedging - ClaudeとOpenAIへのヘッジリクエスト
+プライマリが閾値内に応答しなければセカンダリも並行して呼び、先に返った方を採用する
+"""
+
+import asyncio
+import logging
+import math
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+ProviderCall = Tuple[str, Callable[[], Awaitable[Optional[Any]]]]
+ProviderStream = Tuple[str, Callable[[], AsyncIterator[str]]]
+
+
+@dataclass
+class HedgingConfig:
+    """ヘッジリクエストの設定"""
+    enabled: bool = False
+    percentile: float = 0.95  # プライマリのレイテンシ分布から閾値を決めるパーセンタイル
+    initial_delay: float = 3.0  # サンプルが揃うまでの閾値 (seconds)
+    min_delay: float = 0.5
+    max_delay: float = 15.0
+    min_samples: int = 20
+    window: int = 200
+
+
+@dataclass
+class HedgeOutcome:
+    """ヘッジ付き呼び出しでどちらの応答を採用したか"""
+    winner: Optional[str] = None
+    hedged: bool = False  # セカンダリも呼び出した
+
+
+class LatencyTracker:
+    """直近のレイテンシを保持してパーセンタイルを計算する"""
+
+    def __init__(self, window: int = 200):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, max(0, math.ceil(p * len(samples)) - 1))
+        return samples[index]
+
+
+class Hedger:
+    """プロバイダーごとのレイテンシを記録し、ヘッジ付きで呼び出す
+
+    kind="total" は応答完了まで、kind="ttft" は最初のトークンまでのレイテンシ。
+    """
+
+    def __init__(self, config: Optional[HedgingConfig] = None):
+        self.config = config or HedgingConfig()
+        self._trackers: Dict[Tuple[str, str], LatencyTracker] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.enabled
+
+    def tracker(self, provider: str, kind: str = "total") -> LatencyTracker:
+        key = (provider, kind)
+        if key not in self._trackers:
+            self._trackers[key] = LatencyTracker(self.config.window)
+        return self._trackers[key]
+
+    def record(self, provider: str, seconds: float, kind: str = "total"):
+        """成功した呼び出しのレイテンシを記録"""
+        self.tracker(provider, kind).record(seconds)
+
+    def delay_for(self, provider: str, kind: str = "total") -> float:
+        """セカンダリを起動するまでの待ち時間"""
+        tracker = self.tracker(provider, kind)
+        if len(tracker) < self.config.min_samples:
+            return self.config.initial_delay
+        threshold = tracker.percentile(self.config.percentile)
+        return min(self.config.max_delay, max(self.config.min_delay, threshold))
+
+    async def call(self, primary: ProviderCall, secondary: ProviderCall,
+                   outcome: Optional[HedgeOutcome] = None) -> Optional[Tuple[str, Any]]:
+        """ヘッジ付きで呼び出し、(プロバイダー名, 応答) を返す。両方失敗した場合は None
+
+        outcome を渡すと採用したプロバイダーとセカンダリを呼び出したかを書き込む。
+        """
+        primary_name, primary_call = primary
+        secondary_name, secondary_call = secondary
+        outcome = outcome if outcome is not None else HedgeOutcome()
+
+        tasks = {asyncio.ensure_future(primary_call()): primary_name}
+        done, _ = await asyncio.wait(tasks, timeout=self.delay_for(primary_name))
+        hedged = outcome.hedged = not done
+        if hedged:
+            metrics.increment("sister_ai_hedge_fired_total", provider=secondary_name)
+            logger.info(f"{primary_name} is slow, hedging with {secondary_name}")
+        elif _succeeded(next(iter(done))):
+            task = next(iter(done))
+            outcome.winner = primary_name
+            return primary_name, task.result()
+        else:
+            # 閾値前に失敗した場合は通常のフォールバック
+            tasks.clear()
+
+        tasks[asyncio.ensure_future(secondary_call())] = secondary_name
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if _succeeded(task):
+                        self._record_outcome(hedged, tasks[task], secondary_name)
+                        outcome.winner = tasks[task]
+                        return tasks[task], task.result()
+                    _log_failure(tasks[task], task)
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def stream(self, primary: ProviderStream, secondary: ProviderStream,
+                     outcome: Optional[HedgeOutcome] = None) -> AsyncIterator[str]:
+        """最初のトークンを基準にヘッジしてストリーミングする。両方失敗した場合は何もyieldしない"""
+        primary_name, primary_stream = primary
+        secondary_name, secondary_stream = secondary
+        outcome = outcome if outcome is not None else HedgeOutcome()
+
+        generators = {}
+        first = asyncio.ensure_future(_first_delta(primary_stream(), generators, primary_name))
+        candidates = {first: primary_name}
+        done, _ = await asyncio.wait(candidates, timeout=self.delay_for(primary_name, "ttft"))
+        hedged = outcome.hedged = not done
+        if hedged:
+            metrics.increment("sister_ai_hedge_fired_total", provider=secondary_name)
+            logger.info(f"{primary_name} first token is slow, hedging with {secondary_name}")
+
+        winner = None
+        if done and _succeeded(first):
+            winner = first
+        else:
+            if done:
+                _log_failure(primary_name, first)
+                candidates.clear()
+            second = asyncio.ensure_future(_first_delta(secondary_stream(), generators, secondary_name))
+            candidates[second] = secondary_name
+            pending = set(candidates)
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if _succeeded(task):
+                        winner = task
+                        break
+                    _log_failure(candidates[task], task)
+
+        # 負けた方のストリームを閉じる
+        for task, name in list(candidates.items()):
+            if task is winner:
+                continue
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            generator = generators.get(name)
+            if generator is not None:
+                await _aclose_quietly(generator)
+
+        if winner is None:
+            return
+
+        winner_name = outcome.winner = candidates[winner]
+        self._record_outcome(hedged, winner_name, secondary_name)
+        yield winner.result()
+        async for delta in generators[winner_name]:
+            yield delta
+
+    def _record_outcome(self, hedged: bool, winner: str, secondary_name: str):
+        if not hedged:
+            return
+        if winner == secondary_name:
+            metrics.increment("sister_ai_hedge_won_total", provider=winner)
+        else:
+            metrics.increment("sister_ai_hedge_lost_total", provider=secondary_name)
+
+
+async def _first_delta(generator: AsyncIterator[str], generators: Dict[str, AsyncIterator[str]], name: str) -> str:
+    """ストリームの最初の差分を取得（ジェネレーターは後で続きを読むために保持）"""
+    generators[name] = generator
+    return await generator.__anext__()
+
+
+async def _aclose_quietly(generator: AsyncIterator[str]):
+    try:
+        await generator.aclose()
+    except Exception as e:
+        logger.debug(f"Stream close failed: {e}")
+
+
+def _succeeded(task: "asyncio.Future") -> bool:
+    return not task.cancelled() and task.exception() is None and bool(task.result())
+
+
+def _log_failure(name: str, task: "asyncio.Future"):
+    if not task.cancelled():
+        logger.warning(f"{name} call failed during hedged request: {task.exception() or 'empty response'}")
@@ -0,0 +1,157 @@
+"""
+Metrics - 紗良AIサービスの実行時メトリクス
+プロセス内のカウンター・ゲージ・ヒストグラムをラベル付きで集計し、Prometheus形式でも公開する
+PROMETHEUS_MULTIPROC_DIR を設定して起動すると、全ワーカープロセスの値をまとめて公開できる
+"""
+
+import logging
+import os
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+logger = logging.getLogger(__name__)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# ヒストグラムのバケット（メトリクス名の末尾で選ぶ）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+_lock = threading.Lock()
+_counters: Dict[str, Dict[LabelKey, float]] = defaultdict(lambda: defaultdict(float))
+_gauges: Dict[str, Dict[LabelKey, float]] = defaultdict(dict)
+_histograms: Dict[str, Dict[LabelKey, List[float]]] = defaultdict(dict)  # [件数, 合計]
+
+_export_lock = threading.Lock()
+_exported: Dict[str, Any] = {}
+_rejected = set()
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _buckets(name: str) -> Tuple[float, ...]:
+    if name.endswith("_queries"):
+        return COUNT_BUCKETS
+    return LATENCY_BUCKETS if name.endswith("_seconds") else Histogram.DEFAULT_BUCKETS
+
+
+def _export(kind: type, name: str, labels: Dict[str, str]) -> Optional[Any]:
+    """Prometheus側のメトリクス（ラベル名は初回に決まり、合わない呼び出しは公開しない）"""
+    collector = _exported.get(name)
+    if collector is None:
+        with _export_lock:
+            collector = _exported.get(name)
+            if collector is None:
+                options: Dict[str, Any] = {}
+                if kind is Gauge:
+                    # プロセスごとの値を、生きているプロセス分だけ合計する
+                    options["multiprocess_mode"] = "livesum"
+                elif kind is Histogram:
+                    options["buckets"] = _buckets(name)
+                collector = _exported[name] = kind(name, name, sorted(labels), **options)
+    if not labels:
+        return collector
+    try:
+        return collector.labels(**{key: str(value) for key, value in labels.items()})
+    except ValueError as e:
+        if name not in _rejected:
+            _rejected.add(name)
+            logger.warning(f"Metric {name} not exported: {e}")
+        return None
+
+
+def increment(name: str, value: float = 1.0, **labels: str):
+    """カウンターを加算"""
+    key = _label_key(labels)
+    with _lock:
+        _counters[name][key] += value
+    exported = _export(Counter, name, labels)
+    if exported is not None:
+        exported.inc(value)
+
+
+def get_counter(name: str, **labels: str) -> float:
+    """カウンターの現在値を取得"""
+    with _lock:
+        return _counters.get(name, {}).get(_label_key(labels), 0.0)
+
+
+def set_gauge(name: str, value: float, **labels: str):
+    """ゲージ（キューの長さなど現在の値）を設定"""
+    key = _label_key(labels)
+    with _lock:
+        _gauges[name][key] = value
+    exported = _export(Gauge, name, labels)
+    if exported is not None:
+        exported.set(value)
+
+
+def adjust_gauge(name: str, delta: float, **labels: str):
+    """ゲージを増減（実行中の呼び出し数など）"""
+    key = _label_key(labels)
+    with _lock:
+        _gauges[name][key] = _gauges[name].get(key, 0.0) + delta
+    exported = _export(Gauge, name, labels)
+    if exported is not None:
+        exported.inc(delta)
+
+
+def get_gauge(name: str, **labels: str) -> float:
+    """ゲージの現在値を取得"""
+    with _lock:
+        return _gauges.get(name, {}).get(_label_key(labels), 0.0)
+
+
+def observe(name: str, value: float, **labels: str):
+    """ヒストグラムに値を記録（レイテンシやクエリ数の分布）"""
+    key = _label_key(labels)
+    with _lock:
+        summary = _histograms[name].setdefault(key, [0, 0.0])
+        summary[0] += 1
+        summary[1] += value
+    exported = _export(Histogram, name, labels)
+    if exported is not None:
+        exported.observe(value)
+
+
+def snapshot() -> Dict[str, Dict[LabelKey, float]]:
+    """全カウンターとゲージ、ヒストグラムの件数・合計のコピーを取得"""
+    with _lock:
+        values = {name: dict(values) for name, values in _counters.items()}
+        values.update({name: dict(values) for name, values in _gauges.items()})
+        for name, summaries in _histograms.items():
+            values[f"{name}_count"] = {key: summary[0] for key, summary in summaries.items()}
+            values[f"{name}_sum"] = {key: summary[1] for key, summary in summaries.items()}
+        return values
+
+
+def reset():
+    """プロセス内の集計をリセット（Prometheus側の値はそのまま）"""
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+
+
+def exposition() -> Tuple[bytes, str]:
+    """Prometheusのテキスト形式と Content-Type（マルチプロセスモードでは全プロセス分を集計）"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,206 @@
+"""
+Prompt Templates - コンテキスト種別と性格設定ごとに描画済みのシステムプロンプトを保持する
+全ユーザー共通の部分を先頭に固定し、プロバイダーのプロンプトキャッシュが効くようにする
+"""
+
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import astuple, dataclass
+from typing import TYPE_CHECKING, Any, List, Optional, Tuple
+
+from . import metrics
+
+if TYPE_CHECKING:
+    from .sister_ai import SisterPersonality
+
+logger = logging.getLogger(__name__)
+
+LOW = "low"
+MID = "mid"
+HIGH = "high"
+
+# スライダーの段階ごとの指示（中間は既定の性格のままなので何も足さない）
+TRAIT_INSTRUCTIONS = {
+    "friendliness": {
+        LOW: "親しみやすさは控えめにして、落ち着いた口調で話してください。",
+        HIGH: "いつも以上に親しみを込めて、妹らしい甘えた発言も多めにしてください。",
+    },
+    "technical_depth": {
+        LOW: "専門用語はできるだけ避け、要点を簡潔に説明してください。",
+        HIGH: "内部の仕組みや計算量、トレードオフまで踏み込んで技術的に詳しく説明してください。",
+    },
+    "helpfulness": {
+        LOW: "聞かれたことに絞って答えてください。",
+        HIGH: "関連する注意点や次にやるとよいことも先回りして提案してください。",
+    },
+    "casualness": {
+        LOW: "丁寧語を中心にした話し方にしてください。",
+        HIGH: "くだけた話し言葉で話してください。",
+    },
+}
+
+LANGUAGE_NAMES = {"en": "英語", "zh": "中国語", "ko": "韓国語"}
+
+
+def trait_level(value: float) -> str:
+    """0〜1のスライダー値を3段階にまとめる（近い設定同士で描画結果を共有する）"""
+    if value < 0.34:
+        return LOW
+    if value > 0.9:
+        return HIGH
+    return MID
+
+
+@dataclass(frozen=True)
+class PersonalityProfile:
+    """プロンプトに反映するお兄ちゃんごとの性格設定"""
+    friendliness: str = MID
+    technical_depth: str = MID
+    helpfulness: str = MID
+    casualness: str = MID
+    custom_name: str = "紗良"
+    custom_greeting: str = ""
+    preferred_language: str = "ja"
+
+    @classmethod
+    def from_values(cls, friendliness: float, technical_depth: float, helpfulness: float, casualness: float,
+                    custom_name: str = "紗良", custom_greeting: str = "",
+                    preferred_language: str = "ja") -> "PersonalityProfile":
+        return cls(
+            friendliness=trait_level(friendliness),
+            technical_depth=trait_level(technical_depth),
+            helpfulness=trait_level(helpfulness),
+            casualness=trait_level(casualness),
+            custom_name=custom_name or "紗良",
+            custom_greeting=custom_greeting or "",
+            preferred_language=preferred_language or "ja",
+        )
+
+    @property
+    def version(self) -> str:
+        """描画結果を決める値のハッシュ（同じ設定なら別のユーザーでも同じ）"""
+        digest = hashlib.sha256("\0".join(astuple(self)).encode("utf-8"))
+        return digest.hexdigest()[:16]
+
+
+DEFAULT_PROFILE = PersonalityProfile()
+
+
+class PromptTemplateRegistry:
+    """(性格設定のバージョン, コンテキスト種別) ごとに描画したシステムプロンプトのキャッシュ
+
+    - 共通部分（基本プロンプト＋コンテキスト種別のプロンプト）は常に同じバイト列で先頭に置き、
+      性格設定による指示はその後ろに付け足す
+    - ワーカー内のLRUに加えて、backend（Djangoのキャッシュ）にも保存する
+    - キーにはテンプレート自体のハッシュを含めるので、プロンプトを変更してもデプロイ後に古い描画結果は使われない
+    """
+
+    def __init__(self, personality: "SisterPersonality", backend: Any = None,
+                 ttl: int = 24 * 3600, max_entries: int = 1024, key_prefix: str = "sister_ai:prompt:"):
+        self.personality = personality
+        self.backend = backend
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.key_prefix = key_prefix
+        self._rendered: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        templates = "\0".join(
+            (personality.base_prompt, personality.code_review_prompt, personality.suggestion_prompt)
+        )
+        self.template_version = hashlib.sha256(templates.encode("utf-8")).hexdigest()[:12]
+
+    def static_prefix(self, context_type: str = "default") -> str:
+        """全ユーザー共通の部分"""
+        prompt = self.personality.base_prompt
+        if context_type == "code_review":
+            prompt += f"\n\n{self.personality.code_review_prompt}"
+        elif context_type == "improvement_suggestion":
+            prompt += f"\n\n{self.personality.suggestion_prompt}"
+        return prompt
+
+    def render(self, context_type: str = "default", profile: Optional[PersonalityProfile] = None) -> str:
+        """描画済みのシステムプロンプトを取得（ワーカー内のキャッシュのみ使う）"""
+        profile = profile or DEFAULT_PROFILE
+        key = (profile.version, context_type)
+        prompt = self._get_local(key)
+        if prompt is None:
+            prompt = self._render(context_type, profile)
+            self._set_local(key, prompt)
+        return prompt
+
+    async def get(self, context_type: str = "default", profile: Optional[PersonalityProfile] = None) -> str:
+        """描画済みのシステムプロンプトを取得（ワーカー内 → 共有キャッシュ → 描画の順）"""
+        profile = profile or DEFAULT_PROFILE
+        key = (profile.version, context_type)
+        prompt = self._get_local(key)
+        if prompt is not None:
+            metrics.increment("sister_ai_prompt_cache_total", result="local")
+            return prompt
+
+        shared_key = f"{self.key_prefix}{self.template_version}:{profile.version}:{context_type}"
+        if self.backend is not None:
+            try:
+                prompt = await self.backend.aget(shared_key)
+            except Exception as e:
+                logger.warning(f"Prompt cache read failed: {e}")
+        if prompt is not None:
+            metrics.increment("sister_ai_prompt_cache_total", result="shared")
+        else:
+            metrics.increment("sister_ai_prompt_cache_total", result="miss")
+            prompt = self._render(context_type, profile)
+            if self.backend is not None:
+                try:
+                    await self.backend.aset(shared_key, prompt, timeout=self.ttl)
+                except Exception as e:
+                    logger.warning(f"Prompt cache write failed: {e}")
+        self._set_local(key, prompt)
+        return prompt
+
+    def invalidate(self, profile: Optional[PersonalityProfile] = None):
+        """ワーカー内の描画結果を破棄（profile を省略すると全部）"""
+        with self._lock:
+            if profile is None:
+                self._rendered.clear()
+                return
+            for key in [key for key in self._rendered if key[0] == profile.version]:
+                del self._rendered[key]
+
+    def _render(self, context_type: str, profile: PersonalityProfile) -> str:
+        prompt = self.static_prefix(context_type)
+        instructions = self._instructions(profile)
+        if instructions:
+            lines = "\n".join(f"    - {instruction}" for instruction in instructions)
+            prompt += f"\n\n    お兄ちゃんの好みに合わせた設定:\n{lines}\n"
+        return prompt
+
+    def _instructions(self, profile: PersonalityProfile) -> List[str]:
+        instructions = []
+        if profile.custom_name != self.personality.name:
+            instructions.append(f"この会話では「{profile.custom_name}」と名乗ってください。")
+        for trait, levels in TRAIT_INSTRUCTIONS.items():
+            instruction = levels.get(getattr(profile, trait))
+            if instruction:
+                instructions.append(instruction)
+        if profile.custom_greeting:
+            instructions.append(f"会話の最初の挨拶は「{profile.custom_greeting}」にしてください。")
+        if profile.preferred_language != "ja":
+            language = LANGUAGE_NAMES.get(profile.preferred_language, profile.preferred_language)
+            instructions.append(f"回答は{language}で書いてください。")
+        return instructions
+
+    def _get_local(self, key: Tuple[str, str]) -> Optional[str]:
+        with self._lock:
+            prompt = self._rendered.get(key)
+            if prompt is not None:
+                self._rendered.move_to_end(key)
+            return prompt
+
+    def _set_local(self, key: Tuple[str, str], prompt: str):
+        with self._lock:
+            self._rendered[key] = prompt
+            self._rendered.move_to_end(key)
+            while len(self._rendered) > self.max_entries:
+                self._rendered.popitem(last=False)
@@ -0,0 +1,165 @@
+"""
+Provider Clients - ClaudeとOpenAIの非同期APIクライアント
+ワーカー内で keep-alive のHTTPコネクションプールを共有する
+"""
+
+import asyncio
+import logging
+import weakref
+from dataclasses import dataclass
+from typing import Optional
+
+import httpx
+from anthropic import AsyncAnthropic
+from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ProviderClientConfig:
+    """HTTPコネクションプールとタイムアウトの設定"""
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 60.0  # seconds
+    connect_timeout: float = 5.0
+    read_timeout: float = 60.0
+    write_timeout: float = 10.0
+    pool_timeout: float = 5.0
+    max_retries: int = 2
+    prewarm_connections: int = 2  # 0で事前接続しない
+    anthropic_base_url: Optional[str] = None
+    openai_base_url: Optional[str] = None
+    transport: Optional[httpx.AsyncBaseTransport] = None
+
+    @property
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(
+            connect=self.connect_timeout,
+            read=self.read_timeout,
+            write=self.write_timeout,
+            pool=self.pool_timeout,
+        )
+
+    @property
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+
+class ProviderClients:
+    """1つのイベントループで使うAPIクライアント一式"""
+
+    def __init__(self, openai_api_key: Optional[str], anthropic_api_key: Optional[str],
+                 config: ProviderClientConfig):
+        self.config = config
+        self.http_client = httpx.AsyncClient(
+            limits=config.limits,
+            timeout=config.timeout,
+            transport=config.transport,
+        )
+
+        self.anthropic = AsyncAnthropic(
+            api_key=anthropic_api_key,
+            base_url=config.anthropic_base_url,
+            timeout=config.timeout,
+            max_retries=config.max_retries,
+            http_client=self.http_client,
+        ) if anthropic_api_key else None
+
+        self.openai = AsyncOpenAI(
+            api_key=openai_api_key,
+            base_url=config.openai_base_url,
+            timeout=config.timeout,
+            max_retries=config.max_retries,
+            http_client=self.http_client,
+        ) if openai_api_key else None
+
+    async def warm_up(self, connections: Optional[int] = None):
+        """各プロバイダーへのTLS接続を先に張っておく"""
+        connections = self.config.prewarm_connections if connections is None else connections
+        urls = [str(client.base_url) for client in (self.anthropic, self.openai) if client]
+        if not connections or not urls:
+            return
+
+        results = await asyncio.gather(
+            *(self.http_client.head(url) for url in urls for _ in range(connections)),
+            return_exceptions=True,
+        )
+        failures = [r for r in results if isinstance(r, Exception)]
+        if failures:
+            logger.warning(f"Provider connection warm-up failed ({len(failures)}/{len(results)}): {failures[0]}")
+        else:
+            logger.info(f"Provider connections warmed up: {len(results)}")
+
+    async def aclose(self):
+        await self.http_client.aclose()
+
+
+class ProviderClientPool:
+    """イベントループごとにAPIクライアントを保持するプール
+
+    httpx.AsyncClient のコネクションは作成したイベントループに紐づくため、
+    ループ単位でクライアントを作る。ASGIワーカーではループが1つなので、
+    ワーカー内の全リクエストが同じコネクションプールを共有する。
+    クライアントはループが終わるときに閉じる。
+    """
+
+    def __init__(self, openai_api_key: Optional[str] = None, anthropic_api_key: Optional[str] = None,
+                 config: Optional[ProviderClientConfig] = None):
+        self.openai_api_key = openai_api_key
+        self.anthropic_api_key = anthropic_api_key
+        self.config = config or ProviderClientConfig()
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, ProviderClients]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    @property
+    def has_anthropic(self) -> bool:
+        return bool(self.anthropic_api_key)
+
+    @property
+    def has_openai(self) -> bool:
+        return bool(self.openai_api_key)
+
+    def get(self) -> ProviderClients:
+        """実行中のイベントループ用のクライアントを取得（初回は作成する。事前接続は warm_up() で行う）"""
+        loop = asyncio.get_running_loop()
+        clients = self._clients.get(loop)
+        if clients is None:
+            clients = ProviderClients(self.openai_api_key, self.anthropic_api_key, self.config)
+            self._clients[loop] = clients
+            loop.create_task(self._close_with_loop(clients))
+        return clients
+
+    async def _close_with_loop(self, clients: ProviderClients):
+        """ループが終わるときにクライアントを閉じる
+
+        asyncio.run や async_to_sync がリクエストごとに作るループは、閉じる前に残りのタスクを
+        キャンセルして待つので、そこでコネクションを閉じてソケットを残さない。
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            if self._clients.get(loop) is clients:
+                del self._clients[loop]
+                await clients.aclose()
+            raise
+
+    async def warm_up(self):
+        """実行中のイベントループ用のクライアントを作成して接続を張る
+
+        ASGIサーバーの起動時（lifespan）やワーカープロセスの起動時など、使い続けるループで呼ぶ。
+        リクエストごとに作られるループでは事前接続しても再利用されないので呼ばない。
+        """
+        await self.get().warm_up()
+
+    async def aclose(self):
+        """実行中のイベントループ用のクライアントを閉じる"""
+        clients = self._clients.pop(asyncio.get_running_loop(), None)
+        if clients is not None:
+            await clients.aclose()
@@ -0,0 +1,257 @@
+"""
+Rate Limit - ユーザーごと・全体のリクエスト数とトークン数のトークンバケット
+バケットはRedisのLuaスクリプトでまとめて判定・消費し、足りないと分かっているリクエストはワーカー内で断る
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, List, Optional, Tuple
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# 全バケットを補充してから判定し、全部に余裕がある場合だけ消費する（戻り値は止めたバケットの番号と各残量）
+_TAKE_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local levels = {}
+local blocked = 0
+local longest = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 3 - 2])
+    local capacity = tonumber(ARGV[i * 3 - 1])
+    local cost = tonumber(ARGV[i * 3])
+    local state = redis.call('HMGET', key, 'level', 'ts')
+    local level = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    level = math.min(capacity, level + math.max(0, now - ts) * rate)
+    levels[i] = level
+    if level < cost and (cost - level) / rate > longest then
+        longest = (cost - level) / rate
+        blocked = i
+    end
+end
+if blocked == 0 then
+    for i, key in ipairs(KEYS) do
+        local rate = tonumber(ARGV[i * 3 - 2])
+        local capacity = tonumber(ARGV[i * 3 - 1])
+        levels[i] = levels[i] - tonumber(ARGV[i * 3])
+        redis.call('HSET', key, 'level', levels[i], 'ts', now)
+        redis.call('PEXPIRE', key, math.ceil(capacity / rate * 1000) + 1000)
+    end
+end
+local result = {blocked}
+for i, level in ipairs(levels) do
+    result[i + 1] = tostring(level)
+end
+return result
+"""
+
+
+@dataclass
+class RateLimitConfig:
+    """レート制限の設定（上限は1分あたり、0でそのバケットを使わない。バケットの容量は1分ぶん）"""
+    enabled: bool = True
+    redis_url: Optional[str] = None  # 指定しなければワーカープロセスごとの制限になる
+    user_requests_per_minute: float = 20
+    user_tokens_per_minute: float = 40000
+    global_requests_per_minute: float = 600
+    global_tokens_per_minute: float = 1000000
+    fallback_duration: float = 5.0  # Redisに届かなかった後、ワーカー内のバケットで代替する時間 (seconds)
+    max_cached_levels: int = 10000  # ワーカー内に覚えておくバケット残量の数
+    key_prefix: str = "sister_ai:ratelimit:"
+
+
+@dataclass(frozen=True)
+class Bucket:
+    """1回の呼び出しで消費するバケット"""
+    key: str
+    scope: str  # "user" / "global"
+    dimension: str  # "requests" / "tokens"
+    rate: float  # 1秒あたりの補充量
+    capacity: float
+    cost: float
+
+    def wait(self, level: float) -> float:
+        """残量 level から cost 分たまるまでの秒数"""
+        return max(0.0, (self.cost - level) / self.rate)
+
+
+class RateLimitExceeded(Exception):
+    """レート制限を超えた"""
+
+    def __init__(self, scope: str, dimension: str, retry_after: float, limit: float):
+        super().__init__(f"{scope} {dimension} rate limit exceeded, retry after {retry_after:.1f}s")
+        self.scope = scope
+        self.dimension = dimension
+        self.retry_after = retry_after
+        self.limit = limit
+
+    @property
+    def retry_after_seconds(self) -> int:
+        """Retry-After ヘッダー用の秒数（切り上げ）"""
+        return max(1, math.ceil(self.retry_after))
+
+
+class RedisBucketStore:
+    """ワーカー間で共有するバケット"""
+
+    def __init__(self, redis_url: str):
+        import redis
+
+        self.client = redis.Redis.from_url(redis_url, socket_timeout=0.05, socket_connect_timeout=0.05)
+        self.script = self.client.register_script(_TAKE_SCRIPT)
+
+    def take(self, buckets: List[Bucket]) -> Tuple[Optional[int], List[float]]:
+        """(止めたバケットの番号または None, 各バケットの残量) を返す。接続エラーはそのまま送出"""
+        args: List[Any] = []
+        for bucket in buckets:
+            args.extend((bucket.rate, bucket.capacity, bucket.cost))
+        result = self.script(keys=[bucket.key for bucket in buckets], args=args)
+        blocked = int(result[0])
+        return (blocked - 1 if blocked else None), [float(level) for level in result[1:]]
+
+
+class LocalBucketStore:
+    """ワーカー内だけのバケット（Redisなしの開発環境とRedis障害時の代替）"""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._state: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, buckets: List[Bucket]) -> Tuple[Optional[int], List[float]]:
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            blocked, longest = None, 0.0
+            for index, bucket in enumerate(buckets):
+                level, ts = self._state.get(bucket.key, (bucket.capacity, now))
+                level = min(bucket.capacity, level + max(0.0, now - ts) * bucket.rate)
+                levels.append(level)
+                if bucket.wait(level) > longest:
+                    blocked, longest = index, bucket.wait(level)
+            if blocked is None:
+                for index, bucket in enumerate(buckets):
+                    levels[index] -= bucket.cost
+                    self._state[bucket.key] = (levels[index], now)
+                    self._state.move_to_end(bucket.key)
+                while len(self._state) > self.max_entries:
+                    self._state.popitem(last=False)
+            return blocked, levels
+
+
+class RateLimiter:
+    """ユーザーごとと全体のトークンバケットでAI呼び出しを制限する
+
+    - リクエスト数と推定トークン数の両方を、ユーザーごとと全体（このデプロイ全体）のバケットで数える
+    - 全バケットの判定と消費は1回のLuaスクリプトで行うので、ワーカーが増えても上限を超えない
+    - 最後に見た残量をワーカー内に覚えておき、補充を見込んでも足りないリクエストはRedisに問い合わせずに断る
+      （他のワーカーは残量を減らすだけなので、この見込みは実際の残量以上になる）
+    - Redisに届かない場合は fallback_duration の間ワーカー内のバケットで代替する
+    """
+
+    def __init__(self, config: Optional[RateLimitConfig] = None):
+        self.config = config or RateLimitConfig()
+        self.store = RedisBucketStore(self.config.redis_url) if self.config.redis_url else None
+        self.local = LocalBucketStore(self.config.max_cached_levels)
+        self._levels: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._fallback_until = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.enabled
+
+    def buckets(self, user: Any, tokens: int = 0) -> List[Bucket]:
+        """1回の呼び出しで消費するバケット（コストが容量を超える場合は容量まで）"""
+        config = self.config
+        limits = (
+            ("user", "requests", config.user_requests_per_minute, 1),
+            ("user", "tokens", config.user_tokens_per_minute, tokens),
+            ("global", "requests", config.global_requests_per_minute, 1),
+            ("global", "tokens", config.global_tokens_per_minute, tokens),
+        )
+        buckets = []
+        for scope, dimension, per_minute, cost in limits:
+            if per_minute <= 0 or cost <= 0:
+                continue
+            owner = f"user:{user}" if scope == "user" else "global"
+            buckets.append(Bucket(
+                key=f"{config.key_prefix}{owner}:{dimension}",
+                scope=scope,
+                dimension=dimension,
+                rate=per_minute / 60.0,
+                capacity=float(per_minute),
+                cost=float(min(cost, per_minute)),
+            ))
+        return buckets
+
+    def acquire(self, user: Any, tokens: int = 0):
+        """1回ぶんのリクエストと tokens を消費する。上限を超えていれば RateLimitExceeded"""
+        if not self.config.enabled:
+            return
+        buckets = self.buckets(user, tokens)
+        if not buckets:
+            return
+
+        now = time.monotonic()
+        denied = self._check_cached(buckets, now)
+        if denied is not None:
+            bucket, wait = denied
+            metrics.increment("sister_ai_rate_limit_total", scope=bucket.scope, result="limited", path="cached")
+            raise RateLimitExceeded(bucket.scope, bucket.dimension, wait, bucket.capacity)
+
+        blocked, levels, path = self._take(buckets, now)
+        self._remember(buckets, levels, time.monotonic())
+        if blocked is None:
+            metrics.increment("sister_ai_rate_limit_total", scope="all", result="allowed", path=path)
+            return
+        bucket = buckets[blocked]
+        metrics.increment("sister_ai_rate_limit_total", scope=bucket.scope, result="limited", path=path)
+        raise RateLimitExceeded(bucket.scope, bucket.dimension, bucket.wait(levels[blocked]), bucket.capacity)
+
+    def _take(self, buckets: List[Bucket], now: float) -> Tuple[Optional[int], List[float], str]:
+        if self.store is not None and now >= self._fallback_until:
+            try:
+                blocked, levels = self.store.take(buckets)
+                return blocked, levels, "redis"
+            except Exception as e:
+                # 制限のためにAI機能全体を止めないよう、しばらくワーカー内のバケットで代替する
+                logger.warning(f"Rate limit store unavailable, using local buckets: {e}")
+                metrics.increment("sister_ai_rate_limit_errors_total")
+                self._fallback_until = now + self.config.fallback_duration
+        blocked, levels = self.local.take(buckets)
+        return blocked, levels, "process"
+
+    def _check_cached(self, buckets: List[Bucket], now: float) -> Optional[Tuple[Bucket, float]]:
+        """覚えている残量に補充を見込んでも足りないバケット（と待ち時間）"""
+        longest: Optional[Tuple[Bucket, float]] = None
+        with self._lock:
+            for bucket in buckets:
+                cached = self._levels.get(bucket.key)
+                if cached is None:
+                    continue
+                level, seen_at = cached
+                projected = level + (now - seen_at) * bucket.rate
+                if projected >= bucket.capacity:
+                    # 満タンまで補充されていれば覚えておく必要はない
+                    del self._levels[bucket.key]
+                    continue
+                wait = bucket.wait(projected)
+                if wait > 0 and (longest is None or wait > longest[1]):
+                    longest = (bucket, wait)
+        return longest
+
+    def _remember(self, buckets: List[Bucket], levels: List[float], now: float):
+        with self._lock:
+            for bucket, level in zip(buckets, levels):
+                self._levels[bucket.key] = (level, now)
+                self._levels.move_to_end(bucket.key)
+            while len(self._levels) > self.config.max_cached_levels:
+                self._levels.popitem(last=False)
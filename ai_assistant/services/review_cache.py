@@ -0,0 +1,169 @@
+"""
+Review Cache - コードレビュー結果のコンテンツアドレスキャッシュ
+(言語, 正規化したコード, プロンプトのバージョン, モデル) のハッシュをキーに結果を再利用する
+"""
+
+import hashlib
+import io
+import logging
+import re
+import tokenize
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+# 行コメントの記号（ブロックコメント /* */ はC系の言語で共通）
+LINE_COMMENT_PREFIXES = {
+    "python": "#",
+    "javascript": "//",
+    "typescript": "//",
+    "java": "//",
+    "csharp": "//",
+    "cpp": "//",
+    "go": "//",
+    "rust": "//",
+}
+
+
+@dataclass
+class ReviewCacheConfig:
+    """レビューキャッシュの設定"""
+    enabled: bool = True
+    ttl: int = 7 * 24 * 3600  # seconds
+    normalize: bool = True  # 空白とコメントの違いを無視する
+    max_entry_bytes: int = 64 * 1024  # これより大きい結果はキャッシュしない
+    large_entry_bytes: int = 8 * 1024  # これより大きい結果はサイズに応じてTTLを短くする
+    key_prefix: str = "sister_ai:review:"
+
+
+def normalize_code(code: str, language: str) -> str:
+    """コメントを除去し、空白を1文字に揃える（文字列リテラルの中身は保持する）"""
+    if language == "python":
+        normalized = _normalize_python(code)
+        if normalized is not None:
+            return normalized
+    return _normalize_c_like(code, LINE_COMMENT_PREFIXES.get(language, "//"))
+
+
+def _normalize_python(code: str) -> Optional[str]:
+    """tokenize でトークン列に分解して比較用の文字列を作る（構文エラー時は None）"""
+    parts = []
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(code).readline):
+            if token.type in (tokenize.COMMENT, tokenize.NL, tokenize.ENDMARKER):
+                continue
+            if token.type == tokenize.INDENT:
+                parts.append("<INDENT>")
+            elif token.type == tokenize.DEDENT:
+                parts.append("<DEDENT>")
+            elif token.type == tokenize.NEWLINE:
+                parts.append("\n")
+            else:
+                parts.append(token.string)
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        return None
+    return " ".join(parts)
+
+
+def _normalize_c_like(code: str, line_comment: str) -> str:
+    """文字列リテラルを避けながらコメントを除去して空白を畳む"""
+    out = []
+    i = 0
+    length = len(code)
+    quote = None
+    while i < length:
+        char = code[i]
+        if quote:
+            out.append(char)
+            if char == "\\" and i + 1 < length:
+                out.append(code[i + 1])
+                i += 2
+                continue
+            if char == quote:
+                quote = None
+            i += 1
+        elif char in "\"'`":
+            quote = char
+            out.append(char)
+            i += 1
+        elif code.startswith(line_comment, i):
+            end = code.find("\n", i)
+            i = length if end == -1 else end
+        elif code.startswith("/*", i) and line_comment == "//":
+            end = code.find("*/", i + 2)
+            i = length if end == -1 else end + 2
+            _append_space(out, " ")
+        elif char.isspace():
+            start = i
+            while i < length and code[i].isspace():
+                i += 1
+            _append_space(out, "\n" if "\n" in code[start:i] else " ")
+        else:
+            out.append(char)
+            i += 1
+    return "".join(out).strip()
+
+
+def _append_space(out: list, space: str):
+    """空白を追加（コメントの前後の空白と続く場合は1つにまとめ、改行を優先する）"""
+    if out and out[-1] in (" ", "\n"):
+        if space == "\n":
+            out[-1] = space
+        return
+    out.append(space)
+
+
+class ReviewCache:
+    """コードレビュー結果のキャッシュ
+
+    backend には Django のキャッシュ (aget/aset を持つもの) を渡す。
+    Redis 側の maxmemory ポリシーに加えて、大きな結果ほどTTLを短くし、
+    上限を超える結果は保存しないことでサイズに応じて追い出す。
+    """
+
+    def __init__(self, backend: Any, config: Optional[ReviewCacheConfig] = None):
+        self.backend = backend
+        self.config = config or ReviewCacheConfig()
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.enabled and self.backend is not None
+
+    def make_key(self, code: str, language: str, prompt_version: str, model: str) -> str:
+        """レビュー対象と条件からキャッシュキーを作成"""
+        source = normalize_code(code, language) if self.config.normalize else code
+        digest = hashlib.sha256()
+        for part in (language, prompt_version, model, source):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return self.config.key_prefix + digest.hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        """キャッシュ済みのレビュー結果を取得"""
+        try:
+            result = await self.backend.aget(key)
+        except Exception as e:
+            logger.warning(f"Review cache read failed: {e}")
+            result = None
+        metrics.increment("sister_ai_review_cache_total", result="hit" if result else "miss")
+        return result
+
+    async def set(self, key: str, result: str):
+        """レビュー結果を保存（大きい結果は短いTTL、上限超過は保存しない）"""
+        size = len(result.encode("utf-8"))
+        if size > self.config.max_entry_bytes:
+            metrics.increment("sister_ai_review_cache_skipped_total")
+            return
+
+        ttl = self.config.ttl
+        if size > self.config.large_entry_bytes:
+            ttl = max(60, int(ttl * self.config.large_entry_bytes / size))
+        try:
+            await self.backend.aset(key, result, timeout=ttl)
+        except Exception as e:
+            logger.warning(f"Review cache write failed: {e}")
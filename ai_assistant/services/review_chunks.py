@@ -0,0 +1,288 @@
+"""
+Review Chunks - 大きなコードを構文の区切りで分割し、チャンクごとのレビューを統合する
+Pythonは ast の関数・クラス単位、その他の言語は波括弧とインデントの深さで区切る
+"""
+
+import ast
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from .context_builder import estimate_tokens
+
+# 統合したレビューの各セクションの見出し（findings の行範囲の復元にも使う）
+SECTION_HEADER = "### {start}〜{end}行目{label}"
+_SECTION_PATTERN = re.compile(r"^### (\d+)〜(\d+)行目(?: \((.*)\))?\s*$")
+_FINDING_PATTERN = re.compile(r"^\s*(?:[-*・]|\d+[.)])\s+(.+?)\s*$")
+# 指摘の中の行番号（「12行目」「12〜20行目」「line 12」「lines 12-20」）
+_LINE_REFERENCE = re.compile(
+    r"(\d+)(?:\s*[〜~\-–]\s*(\d+))?\s*行目|\b[Ll]ines?\s+(\d+)(?:\s*[-–]\s*(\d+))?"
+)
+
+# 文字列リテラルと行コメント（波括弧を数える前に取り除く）
+_C_LIKE_NOISE = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|`[^`]*`|//.*$')
+
+BRACE_LANGUAGES = {"javascript", "typescript", "java", "csharp", "cpp", "go", "rust"}
+
+
+@dataclass
+class ReviewChunkingConfig:
+    """大きなコードを分割してレビューする設定"""
+    enabled: bool = True
+    threshold_tokens: int = 2000  # これより大きいコードを分割する
+    max_chunk_tokens: int = 1500  # 1チャンクの上限
+    max_parallel: int = 4  # 同時にレビューするチャンク数
+
+
+@dataclass
+class CodeChunk:
+    """元のコードの連続した行範囲（行番号は1始まり、end_line を含む）"""
+    start_line: int
+    end_line: int
+    text: str
+    name: str = ""
+
+    @property
+    def label(self) -> str:
+        return f" ({self.name})" if self.name else ""
+
+
+Unit = Tuple[int, int, str]  # (開始行, 終了行, 名前)
+
+
+def split_code(code: str, language: str, max_chunk_tokens: int) -> List[CodeChunk]:
+    """構文の区切りでコードを分割し、max_chunk_tokens 以内のチャンクにまとめる"""
+    lines = code.splitlines()
+    if not lines:
+        return []
+
+    units = None
+    if language == "python":
+        units = _python_units(code, lines, max_chunk_tokens)
+    if units is None:
+        units = _brace_units(lines) if language in BRACE_LANGUAGES else _indent_units(lines)
+    return _pack(units, lines, max_chunk_tokens)
+
+
+def _python_units(code: str, lines: List[str], max_tokens: int) -> Optional[List[Unit]]:
+    """トップレベルの文（大きなクラスはメソッド単位）で区切る。構文エラーなら None"""
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return None
+
+    units: List[Unit] = []
+    for node in tree.body:
+        start = _node_start(node)
+        name = _node_name(node)
+        if isinstance(node, ast.ClassDef) and _tokens(lines, start, node.end_lineno) > max_tokens:
+            # クラスの先頭（宣言とdocstringなど）は最初のメソッドと同じ単位にする
+            for child in node.body:
+                child_name = f"{node.name}.{child.name}" if _node_name(child) else name
+                units.append((_node_start(child), child.end_lineno, child_name))
+            units[-len(node.body)] = (start,) + units[-len(node.body)][1:]
+        else:
+            units.append((start, node.end_lineno, name))
+    return _fill_gaps(units, len(lines))
+
+
+def _node_start(node: ast.AST) -> int:
+    decorators = getattr(node, "decorator_list", None)
+    return min([node.lineno] + [d.lineno for d in decorators]) if decorators else node.lineno
+
+
+def _node_name(node: ast.AST) -> str:
+    if isinstance(node, ast.ClassDef):
+        return f"class {node.name}"
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+        return f"def {node.name}"
+    return ""
+
+
+def _brace_units(lines: List[str]) -> List[Unit]:
+    """波括弧の深さが0に戻った行、または深さ0の空行で区切る"""
+    units: List[Unit] = []
+    depth = 0
+    in_block_comment = False
+    start = 1
+    for number, line in enumerate(lines, start=1):
+        stripped, in_block_comment = _strip_c_like(line, in_block_comment)
+        opened = stripped.count("{")
+        closed = stripped.count("}")
+        was_nested = depth > 0
+        depth = max(0, depth + opened - closed)
+        if depth == 0 and (was_nested and closed or not line.strip()):
+            units.append((start, number, _declaration_name(lines[start - 1:number])))
+            start = number + 1
+    if start <= len(lines):
+        units.append((start, len(lines), _declaration_name(lines[start - 1:])))
+    return _fill_gaps(units, len(lines))
+
+
+def _indent_units(lines: List[str]) -> List[Unit]:
+    """空行の後にインデントなしで始まる行で区切る（波括弧を使わない言語向け）"""
+    units: List[Unit] = []
+    start = 1
+    previous_blank = False
+    for number, line in enumerate(lines, start=1):
+        if previous_blank and line.strip() and not line[0].isspace() and number > start:
+            units.append((start, number - 1, ""))
+            start = number
+        previous_blank = not line.strip()
+    units.append((start, len(lines), ""))
+    return units
+
+
+def _strip_c_like(line: str, in_block_comment: bool) -> Tuple[str, bool]:
+    """文字列リテラルとコメントを取り除く（ブロックコメントの継続状態も返す）"""
+    out = []
+    i = 0
+    while i < len(line):
+        if in_block_comment:
+            end = line.find("*/", i)
+            if end == -1:
+                return "".join(out), True
+            i = end + 2
+            in_block_comment = False
+            continue
+        start = line.find("/*", i)
+        segment = line[i:] if start == -1 else line[i:start]
+        out.append(_C_LIKE_NOISE.sub("", segment))
+        if start == -1:
+            break
+        i = start + 2
+        in_block_comment = True
+    return "".join(out), in_block_comment
+
+
+_DECLARATION = re.compile(
+    r"\b(?:class|interface|struct|enum|impl|trait|fn|func|function|def)\s+([A-Za-z_][\w:<>]*)"
+)
+
+
+def _declaration_name(lines: List[str]) -> str:
+    for line in lines:
+        match = _DECLARATION.search(line)
+        if match:
+            return match.group(0)
+    return ""
+
+
+def _fill_gaps(units: List[Unit], total_lines: int) -> List[Unit]:
+    """単位の間の行（コメントや空行）を後ろの単位に含め、全行を覆うようにする"""
+    filled: List[Unit] = []
+    next_line = 1
+    for start, end, name in units:
+        if end < next_line:
+            continue
+        filled.append((next_line, end, name))
+        next_line = end + 1
+    if next_line <= total_lines:
+        if filled:
+            start, _, name = filled[-1]
+            filled[-1] = (start, total_lines, name)
+        else:
+            filled.append((1, total_lines, ""))
+    return filled
+
+
+def _tokens(lines: List[str], start: int, end: int) -> int:
+    return estimate_tokens("\n".join(lines[start - 1:end]))
+
+
+def _pack(units: List[Unit], lines: List[str], max_tokens: int) -> List[CodeChunk]:
+    """隣り合う単位を上限まで詰め、上限を超える単位は行単位で分ける"""
+    chunks: List[CodeChunk] = []
+    current: Optional[List[Any]] = None  # [開始行, 終了行, 名前のリスト, トークン数]
+
+    def flush():
+        if current:
+            start, end, names, _ = current
+            chunks.append(CodeChunk(start, end, "\n".join(lines[start - 1:end]), _join_names(names)))
+
+    for start, end, name in units:
+        tokens = _tokens(lines, start, end)
+        if tokens > max_tokens:
+            flush()
+            current = None
+            chunks.extend(_split_lines(lines, start, end, name, max_tokens))
+            continue
+        if current and current[3] + tokens <= max_tokens:
+            current[1] = end
+            current[3] += tokens
+            if name:
+                current[2].append(name)
+            continue
+        flush()
+        current = [start, end, [name] if name else [], tokens]
+    flush()
+    return chunks
+
+
+def _split_lines(lines: List[str], start: int, end: int, name: str, max_tokens: int) -> List[CodeChunk]:
+    pieces: List[CodeChunk] = []
+    piece_start = start
+    tokens = 0
+    for number in range(start, end + 1):
+        line_tokens = estimate_tokens(lines[number - 1]) + 1
+        if tokens and tokens + line_tokens > max_tokens:
+            pieces.append(CodeChunk(piece_start, number - 1, "\n".join(lines[piece_start - 1:number - 1]), name))
+            piece_start = number
+            tokens = 0
+        tokens += line_tokens
+    pieces.append(CodeChunk(piece_start, end, "\n".join(lines[piece_start - 1:end]), name))
+    return pieces
+
+
+def _join_names(names: List[str]) -> str:
+    if len(names) > 3:
+        return ", ".join(names[:3]) + f" ほか{len(names) - 3}件"
+    return ", ".join(names)
+
+
+def merge_reviews(chunks: List[CodeChunk], reviews: List[Optional[str]]) -> str:
+    """チャンクごとのレビューを行範囲の見出し付きで1つにまとめる"""
+    sections = [f"{len(chunks)}つの部分に分けてレビューしたよ、お兄ちゃん。"]
+    for chunk, review in zip(chunks, reviews):
+        header = SECTION_HEADER.format(start=chunk.start_line, end=chunk.end_line, label=chunk.label)
+        body = review.strip() if review else "（この部分はレビューできなかったの...ごめんね）"
+        sections.append(f"{header}\n{body}")
+    return "\n\n".join(sections)
+
+
+def extract_findings(review_text: str, total_lines: int) -> List[Dict[str, Any]]:
+    """レビュー本文の箇条書きを指摘として取り出す
+
+    見出しがあればその行範囲に紐付け、指摘の中で行番号に触れていればその範囲に絞る。
+    """
+    findings: List[Dict[str, Any]] = []
+    start_line, end_line, section = 1, total_lines, ""
+    for line in review_text.splitlines():
+        header = _SECTION_PATTERN.match(line)
+        if header:
+            start_line, end_line = int(header.group(1)), int(header.group(2))
+            section = header.group(3) or ""
+            continue
+        finding = _FINDING_PATTERN.match(line)
+        if finding:
+            text = finding.group(1)
+            first, last = _cited_lines(text, start_line, end_line)
+            findings.append({
+                "start_line": first,
+                "end_line": last,
+                "section": section,
+                "text": text,
+            })
+    return findings
+
+
+def _cited_lines(text: str, start_line: int, end_line: int) -> Tuple[int, int]:
+    """指摘が触れている行範囲（セクションの範囲外の番号は無視する）"""
+    match = _LINE_REFERENCE.search(text)
+    if not match:
+        return start_line, end_line
+    first = int(match.group(1) or match.group(3))
+    last = int(match.group(2) or match.group(4) or first)
+    if start_line <= first <= last <= end_line:
+        return first, last
+    return start_line, end_line
@@ -0,0 +1,130 @@
+"""
+Review Diff - 前回レビューしたコードとの差分による再レビュー
+変更された部分（と前後数行）だけをAIに送り、変更のない部分の指摘は行番号を付け替えて引き継ぐ
+"""
+
+import difflib
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from .review_chunks import SECTION_HEADER
+
+
+@dataclass
+class IncrementalReviewConfig:
+    """差分レビューの設定"""
+    enabled: bool = True
+    min_tokens: int = 1000  # これより小さいコードは全体をレビューした方が早い
+    max_changed_ratio: float = 0.5  # 変更がこれより多ければ全体をレビューする
+    context_lines: int = 3  # 変更の前後に含める行数
+
+
+@dataclass
+class DiffHunk:
+    """変更のまとまり（行番号は1始まり、new_end を含む。削除だけの場合は new_start > new_end）"""
+    old_start: int
+    old_end: int
+    new_start: int
+    new_end: int
+    text: str  # 新しいファイルの行番号付きの差分
+
+
+@dataclass
+class CodeDiff:
+    """前回のコードと今回のコードの差分"""
+    hunks: List[DiffHunk]
+    opcodes: List[Tuple[str, int, int, int, int]]
+    changed_ratio: float
+    total_lines: int = 0
+
+    @property
+    def span(self) -> Tuple[int, int]:
+        """変更部分全体を含む新しいファイルの行範囲"""
+        start = min(hunk.new_start for hunk in self.hunks)
+        end = max(hunk.new_end for hunk in self.hunks)
+        return max(1, start), max(start, end)
+
+
+def diff_code(old_code: str, new_code: str, context_lines: int = 3) -> CodeDiff:
+    """行単位の差分を取り、変更部分を前後 context_lines 行付きのまとまりにする"""
+    old_lines = old_code.splitlines()
+    new_lines = new_code.splitlines()
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    # get_grouped_opcodes はキャッシュされた opcodes の先頭と末尾を書き換えるのでコピーしておく
+    opcodes = list(matcher.get_opcodes())
+
+    changed = sum((i2 - i1) + (j2 - j1) for tag, i1, i2, j1, j2 in opcodes if tag != "equal")
+    total = len(old_lines) + len(new_lines)
+
+    hunks = []
+    if changed:
+        for group in matcher.get_grouped_opcodes(context_lines):
+            hunks.append(_render_hunk(group, old_lines, new_lines))
+    return CodeDiff(
+        hunks=hunks,
+        opcodes=opcodes,
+        changed_ratio=changed / total if total else 0.0,
+        total_lines=len(new_lines),
+    )
+
+
+def _render_hunk(group, old_lines: List[str], new_lines: List[str]) -> DiffHunk:
+    rows = []
+    for tag, i1, i2, j1, j2 in group:
+        if tag == "equal":
+            rows.extend(f"{j + 1:>5}   {new_lines[j]}" for j in range(j1, j2))
+            continue
+        if tag in ("replace", "delete"):
+            rows.extend(f"{'':>5} - {old_lines[i]}" for i in range(i1, i2))
+        if tag in ("replace", "insert"):
+            rows.extend(f"{j + 1:>5} + {new_lines[j]}" for j in range(j1, j2))
+    first, last = group[0], group[-1]
+    return DiffHunk(
+        old_start=first[1] + 1,
+        old_end=last[2],
+        new_start=first[3] + 1,
+        new_end=last[4],
+        text="\n".join(rows),
+    )
+
+
+def remap_range(start: int, end: int, diff: CodeDiff) -> Optional[Tuple[int, int]]:
+    """前回のコードの行範囲を今回の行番号に付け替える（範囲内が変更されていれば None）"""
+    first, last = start - 1, end  # 0始まりの半開区間
+    for tag, i1, i2, j1, j2 in diff.opcodes:
+        if tag == "equal":
+            if i1 <= first and last <= i2:
+                return first - i1 + j1 + 1, last - i1 + j1
+        elif (i1 < last and i2 > first) or (i1 == i2 and first < i1 < last):
+            return None
+    return None
+
+
+def carry_forward(findings: List[Dict[str, Any]], diff: CodeDiff) -> List[Dict[str, Any]]:
+    """変更の影響を受けていない前回の指摘を、今回の行番号で引き継ぐ"""
+    carried = []
+    for finding in findings:
+        try:
+            start, end = int(finding["start_line"]), int(finding["end_line"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        remapped = remap_range(start, end, diff)
+        if remapped:
+            carried.append({**finding, "start_line": remapped[0], "end_line": remapped[1]})
+    return carried
+
+
+def render_carried(findings: List[Dict[str, Any]]) -> str:
+    """引き継いだ指摘を行範囲ごとの見出しでまとめる"""
+    sections: List[str] = []
+    current = None
+    for finding in sorted(findings, key=lambda f: (f["start_line"], f["end_line"])):
+        key = (finding["start_line"], finding["end_line"], finding.get("section", ""))
+        if key != current:
+            if sections:
+                sections.append("")
+            label = f" ({key[2]})" if key[2] else ""
+            sections.append(SECTION_HEADER.format(start=key[0], end=key[1], label=label))
+            current = key
+        sections.append(f"- {finding['text']}")
+    return "\n".join(sections)
@@ -0,0 +1,256 @@
+"""
+Scheduler - プロバイダー呼び出しの優先度付きアドミッション制御
+プロバイダーごとの同時実行数に上限を設け、空きを優先度順・ユーザーごとに順番に割り当てる
+"""
+
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, Optional
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# 優先度クラス（小さいほど優先）
+INTERACTIVE = 0
+REVIEW = 1
+BACKGROUND = 2
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", REVIEW: "review", BACKGROUND: "background"}
+
+
+@dataclass
+class SchedulerConfig:
+    """アドミッション制御の設定（上限はワーカープロセスごと）"""
+    enabled: bool = True
+    max_concurrency: int = 16  # プロバイダーごとの同時呼び出し数の上限
+    provider_limits: Dict[str, int] = field(default_factory=dict)  # プロバイダー別の上限（省略時は max_concurrency）
+    reserved_interactive: int = 4  # チャット用に空けておく枠（レビューやバックグラウンドは使えない）
+    max_wait: float = 30.0  # 待ち時間の上限 (seconds)
+
+
+@dataclass(frozen=True)
+class RequestClass:
+    """呼び出し元の優先度とユーザー（未設定なら None）"""
+    priority: Optional[int] = None
+    user: Optional[str] = None
+
+
+_current_request: contextvars.ContextVar = contextvars.ContextVar("sister_ai_request", default=RequestClass())
+
+
+@contextmanager
+def request_scope(priority: Optional[int] = None, user: Any = None) -> Iterator[None]:
+    """このスコープ内のAI呼び出しの優先度とユーザーを設定（外側で設定済みの値が優先）"""
+    current = _current_request.get()
+    token = _current_request.set(RequestClass(
+        priority=current.priority if current.priority is not None else priority,
+        user=current.user if current.user is not None else (str(user) if user is not None else None),
+    ))
+    try:
+        yield
+    finally:
+        _current_request.reset(token)
+
+
+def current_request() -> RequestClass:
+    return _current_request.get()
+
+
+class QueueTimeout(Exception):
+    """待ち時間の上限までに枠が空かなかった"""
+
+
+@dataclass(eq=False)
+class _Waiter:
+    loop: asyncio.AbstractEventLoop
+    future: "asyncio.Future"
+    priority: int
+    user: str
+    enqueued_at: float
+    granted: bool = False
+
+
+class _ProviderQueue:
+    """1プロバイダー分の枠と待ち行列（優先度ごとに、ユーザー単位のラウンドロビン）"""
+
+    def __init__(self, name: str, limit: int, reserved_interactive: int):
+        self.name = name
+        self.limit = limit
+        self.reserved_interactive = min(reserved_interactive, max(0, limit - 1))
+        self.in_flight = 0
+        self.waiting: Dict[int, "OrderedDict[str, Deque[_Waiter]]"] = {
+            priority: OrderedDict() for priority in PRIORITY_NAMES
+        }
+
+    def can_admit(self, priority: int) -> bool:
+        reserved = 0 if priority == INTERACTIVE else self.reserved_interactive
+        return self.in_flight < self.limit - reserved
+
+    def has_waiters(self, up_to_priority: int) -> bool:
+        return any(self.waiting[priority] for priority in PRIORITY_NAMES if priority <= up_to_priority)
+
+    def depth(self, priority: int) -> int:
+        return sum(len(queue) for queue in self.waiting[priority].values())
+
+    def enqueue(self, waiter: _Waiter):
+        self.waiting[waiter.priority].setdefault(waiter.user, deque()).append(waiter)
+
+    def remove(self, waiter: _Waiter):
+        users = self.waiting[waiter.priority]
+        queue = users.get(waiter.user)
+        if queue is None:
+            return
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            return
+        if not queue:
+            del users[waiter.user]
+
+    def next_waiter(self) -> Optional[_Waiter]:
+        """次に枠を渡す待機者（優先度の高い順、同じ優先度ではユーザーごとに順番）"""
+        for priority in PRIORITY_NAMES:
+            users = self.waiting[priority]
+            if not users or not self.can_admit(priority):
+                continue
+            user, queue = next(iter(users.items()))
+            waiter = queue.popleft()
+            if queue:
+                users.move_to_end(user)
+            else:
+                del users[user]
+            return waiter
+        return None
+
+
+class AdmissionScheduler:
+    """プロバイダー呼び出しの前に枠を確保するスケジューラー
+
+    - 枠に空きがあり、同じか高い優先度の待機者がいなければすぐに呼び出す
+    - 空きがなければ優先度ごとの待ち行列に並び、同じ優先度の中ではユーザーごとに順番に割り当てる
+      （1人が大量にレビューを投げても、他のユーザーの呼び出しが後回しになり続けない）
+    - reserved_interactive の枠はチャット専用にして、レビューのバッチ中もチャットの待ち時間を抑える
+    """
+
+    def __init__(self, config: Optional[SchedulerConfig] = None):
+        self.config = config or SchedulerConfig()
+        self._queues: Dict[str, _ProviderQueue] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.enabled
+
+    @asynccontextmanager
+    async def slot(self, provider: str, priority: Optional[int] = None,
+                   user: Optional[str] = None) -> AsyncIterator[None]:
+        """枠を確保してから呼び出す（priority, user を省略すると現在のスコープの値を使う）"""
+        if not self.config.enabled:
+            yield
+            return
+
+        request = current_request()
+        priority = priority if priority is not None else (
+            request.priority if request.priority is not None else INTERACTIVE
+        )
+        user = user or request.user or ""
+        await self.acquire(provider, priority, user)
+        try:
+            yield
+        finally:
+            self.release(provider)
+
+    async def acquire(self, provider: str, priority: int, user: str):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            queue = self._queue(provider)
+            if queue.can_admit(priority) and not queue.has_waiters(priority):
+                queue.in_flight += 1
+                self._publish(queue)
+                self._record_admitted(provider, priority, 0.0)
+                return
+            waiter = _Waiter(loop, loop.create_future(), priority, user, time.monotonic())
+            queue.enqueue(waiter)
+            self._publish(queue)
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=self.config.max_wait)
+        except BaseException as e:
+            with self._lock:
+                if waiter.granted:
+                    # 枠を受け取った直後にキャンセルされた場合は次の待機者へ渡す
+                    self._release_locked(queue)
+                else:
+                    queue.remove(waiter)
+                self._publish(queue)
+            if isinstance(e, asyncio.TimeoutError):
+                metrics.increment("sister_ai_scheduler_timeouts_total", provider=provider,
+                                  priority=PRIORITY_NAMES[priority])
+                raise QueueTimeout(f"{provider}: no slot within {self.config.max_wait}s") from None
+            raise
+
+    def release(self, provider: str):
+        with self._lock:
+            queue = self._queue(provider)
+            self._release_locked(queue)
+            self._publish(queue)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """プロバイダーごとの実行中の数と待ち行列の長さ"""
+        with self._lock:
+            return {
+                name: {
+                    "in_flight": queue.in_flight,
+                    "limit": queue.limit,
+                    "queued": {PRIORITY_NAMES[priority]: queue.depth(priority) for priority in PRIORITY_NAMES},
+                }
+                for name, queue in self._queues.items()
+            }
+
+    def _queue(self, provider: str) -> _ProviderQueue:
+        queue = self._queues.get(provider)
+        if queue is None:
+            limit = self.config.provider_limits.get(provider, self.config.max_concurrency)
+            queue = self._queues[provider] = _ProviderQueue(provider, limit, self.config.reserved_interactive)
+        return queue
+
+    def _release_locked(self, queue: _ProviderQueue):
+        """枠を返し、入れる待機者がいれば順に渡す（ロック取得済みで呼ぶ）"""
+        queue.in_flight -= 1
+        while True:
+            waiter = queue.next_waiter()
+            if waiter is None:
+                return
+            try:
+                waiter.loop.call_soon_threadsafe(_wake, waiter.future)
+            except RuntimeError:
+                # 待機者のイベントループが既に閉じている
+                continue
+            waiter.granted = True
+            queue.in_flight += 1
+            self._record_admitted(queue.name, waiter.priority, time.monotonic() - waiter.enqueued_at)
+            if not queue.can_admit(INTERACTIVE):
+                return
+
+    def _record_admitted(self, provider: str, priority: int, waited: float):
+        labels = {"provider": provider, "priority": PRIORITY_NAMES[priority]}
+        metrics.increment("sister_ai_scheduler_admitted_total", **labels)
+        metrics.observe("sister_ai_scheduler_wait_seconds", waited, **labels)
+
+    def _publish(self, queue: _ProviderQueue):
+        metrics.set_gauge("sister_ai_scheduler_in_flight", queue.in_flight, provider=queue.name)
+        for priority, name in PRIORITY_NAMES.items():
+            metrics.set_gauge("sister_ai_scheduler_queue_depth", queue.depth(priority),
+                              provider=queue.name, priority=name)
+
+
+def _wake(future: "asyncio.Future"):
+    if not future.done():
+        future.set_result(None)
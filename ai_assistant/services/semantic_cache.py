@@ -0,0 +1,245 @@
+"""
+Semantic Cache - ほぼ同じ質問への応答を再利用するローカル類似度インデックス
+文字n-gramのMinHashとLSHで直近のプロンプトを索引し、外部サービスは使わない
+"""
+
+import hashlib
+import logging
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_MERSENNE_PRIME = (1 << 31) - 1
+_WHITESPACE = re.compile(r"\s+")
+
+# 前のやり取りを指す言葉（これを含む質問は履歴によって答えが変わる）
+FOLLOW_UP_MARKERS = (
+    "それ", "これ", "あれ", "その", "この", "さっき", "先ほど", "上の", "前の", "続き",
+    "もう一度", "もっと", "さらに", "じゃあ", "他には", "ほかには",
+    "it", "that", "this", "these", "those", "above", "previous", "earlier", "again",
+    "instead", "same", "more",
+)
+
+
+@dataclass
+class SemanticCacheConfig:
+    """類似応答キャッシュの設定"""
+    enabled: bool = False
+    context_types: Tuple[str, ...] = ("default",)  # 対象にするコンテキスト種別
+    threshold: float = 0.8  # 推定Jaccard類似度がこれ以上ならキャッシュを返す
+    ttl: float = 3600.0  # seconds
+    max_entries: int = 2000  # コンテキスト種別ごとの上限
+    max_bytes: int = 16 * 1024 * 1024  # 全体の応答テキストの上限
+    min_chars: int = 16  # 短すぎる質問は文脈依存なので対象外
+    follow_up_markers: Tuple[str, ...] = FOLLOW_UP_MARKERS  # 会話の途中ではこれを含む質問を対象外にする
+    max_chars: int = 2000  # 長い入力（コードの貼り付けなど）は対象外
+    shingle_size: int = 3
+    num_perm: int = 64
+    bands: int = 16
+
+
+@dataclass
+class _Entry:
+    signature: np.ndarray
+    response: str
+    created_at: float
+    size_bytes: int
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).lower()
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class MinHasher:
+    """文字n-gramのMinHash署名を計算する"""
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 3, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self._a = rng.randint(1, _MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, _MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+
+    def shingles(self, text: str) -> Set[str]:
+        text = _normalize(text)
+        size = self.shingle_size
+        if len(text) <= size:
+            return {text}
+        return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) % _MERSENNE_PRIME for shingle in self.shingles(text)),
+            dtype=np.uint64,
+        )
+        # (a * h + b) mod p を全順列まとめて計算し、各順列の最小値を署名とする
+        permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME
+        return permuted.min(axis=0).astype(np.uint32)
+
+
+def _marker_pattern(markers: Tuple[str, ...]) -> Optional["re.Pattern[str]"]:
+    parts = [rf"\b{re.escape(m)}\b" if m.isascii() else re.escape(m) for m in markers]
+    return re.compile("|".join(parts)) if parts else None
+
+
+def estimated_similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """署名の一致率（Jaccard類似度の推定値）"""
+    return float(np.count_nonzero(a == b)) / len(a)
+
+
+class _Index:
+    """1つの名前空間（コンテキスト種別×システムプロンプト）のLSHインデックス"""
+
+    def __init__(self, bands: int, rows: int):
+        self.bands = bands
+        self.rows = rows
+        self.entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self.buckets: Dict[bytes, Set[int]] = defaultdict(set)
+
+    def band_keys(self, signature: np.ndarray) -> List[bytes]:
+        rows = self.rows
+        return [bytes([band]) + signature[band * rows:(band + 1) * rows].tobytes() for band in range(self.bands)]
+
+    def candidates(self, signature: np.ndarray) -> Set[int]:
+        found: Set[int] = set()
+        for key in self.band_keys(signature):
+            found |= self.buckets.get(key, set())
+        return found
+
+    def add(self, entry_id: int, entry: _Entry):
+        self.entries[entry_id] = entry
+        for key in self.band_keys(entry.signature):
+            self.buckets[key].add(entry_id)
+
+    def remove(self, entry_id: int) -> Optional[_Entry]:
+        entry = self.entries.pop(entry_id, None)
+        if entry is None:
+            return None
+        for key in self.band_keys(entry.signature):
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self.buckets[key]
+        return entry
+
+
+class SemanticCache:
+    """ほぼ同じ質問に対する応答のキャッシュ
+
+    - コンテキスト種別とシステムプロンプトごとに別のインデックスを持つ
+    - LSHで候補を絞り、署名の一致率が閾値以上なら保存済みの応答を返す
+    - TTLと件数・バイト数の上限で古いものから追い出す
+    """
+
+    def __init__(self, config: Optional[SemanticCacheConfig] = None):
+        self.config = config or SemanticCacheConfig()
+        self.hasher = MinHasher(self.config.num_perm, self.config.shingle_size)
+        self._rows = self.config.num_perm // self.config.bands
+        self._indexes: Dict[str, _Index] = {}
+        self._total_bytes = 0
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._follow_up = _marker_pattern(self.config.follow_up_markers)
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.enabled
+
+    def accepts(self, context_type: str, message: str) -> bool:
+        """キャッシュの対象になる質問か"""
+        if context_type not in self.config.context_types:
+            return False
+        return self.config.min_chars <= len(message.strip()) <= self.config.max_chars
+
+    def is_follow_up(self, message: str) -> bool:
+        """前のやり取りを指す続きの質問か（英語の単語は単語単位で判定する）"""
+        return self._follow_up is not None and self._follow_up.search(_normalize(message)) is not None
+
+    def namespace(self, context_type: str, system_prompt: str) -> str:
+        digest = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:12]
+        return f"{context_type}:{digest}"
+
+    def lookup(self, namespace: str, message: str) -> Optional[str]:
+        """類似した質問の応答を取得"""
+        signature = self.hasher.signature(message)
+        now = time.monotonic()
+        best: Optional[_Entry] = None
+        best_score = 0.0
+        with self._lock:
+            index = self._indexes.get(namespace)
+            if index is not None:
+                for entry_id in index.candidates(signature):
+                    entry = index.entries[entry_id]
+                    if now - entry.created_at > self.config.ttl:
+                        self._remove(index, entry_id)
+                        continue
+                    score = estimated_similarity(signature, entry.signature)
+                    if score >= self.config.threshold and score > best_score:
+                        best, best_score = entry, score
+
+        metrics.increment("sister_ai_semantic_cache_total", result="hit" if best else "miss")
+        if best is not None:
+            logger.debug(f"Semantic cache hit ({namespace}, similarity={best_score:.2f})")
+            return best.response
+        return None
+
+    def store(self, namespace: str, message: str, response: str):
+        """質問と応答を保存"""
+        entry = _Entry(
+            signature=self.hasher.signature(message),
+            response=response,
+            created_at=time.monotonic(),
+            size_bytes=len(response.encode("utf-8")) + self.config.num_perm * 4,
+        )
+        with self._lock:
+            index = self._indexes.get(namespace)
+            if index is None:
+                index = self._indexes[namespace] = _Index(self.config.bands, self._rows)
+            self._next_id += 1
+            index.add(self._next_id, entry)
+            self._total_bytes += entry.size_bytes
+            self._evict(index)
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+            self._total_bytes = 0
+
+    def _remove(self, index: _Index, entry_id: int):
+        entry = index.remove(entry_id)
+        if entry is not None:
+            self._total_bytes -= entry.size_bytes
+
+    def _evict(self, index: _Index):
+        """期限切れ・上限超過のエントリを古い順に追い出す（ロック取得済みで呼ぶ）"""
+        now = time.monotonic()
+        while index.entries:
+            entry_id, entry = next(iter(index.entries.items()))
+            expired = now - entry.created_at > self.config.ttl
+            if not expired and len(index.entries) <= self.config.max_entries:
+                break
+            self._remove(index, entry_id)
+
+        # バイト数の上限は全インデックスの古いものから順に削る
+        while self._total_bytes > self.config.max_bytes:
+            oldest = min(
+                (idx for idx in self._indexes.values() if idx.entries),
+                key=lambda idx: next(iter(idx.entries.values())).created_at,
+                default=None,
+            )
+            if oldest is None:
+                break
+            self._remove(oldest, next(iter(oldest.entries)))
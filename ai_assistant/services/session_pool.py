@@ -0,0 +1,232 @@
+"""
+Session State Pool - セッションごとの会話状態プール
+ChatSession.id をキーにした会話履歴のLRU/TTLキャッシュ
+"""
+
+import inspect
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Deque, Dict, List, Optional, Union
+
+if TYPE_CHECKING:
+    from .sister_ai import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+# 1メッセージあたりの固定オーバーヘッド（dataclass・datetime・dequeスロット分の概算）
+MESSAGE_OVERHEAD_BYTES = 200
+
+HistoryLoader = Callable[[str, int], Union[List["ChatMessage"], Awaitable[List["ChatMessage"]]]]
+VersionLoader = Callable[[str], Union[int, Awaitable[int]]]
+
+
+def estimate_message_bytes(message: "ChatMessage") -> int:
+    """メッセージのメモリ使用量を概算"""
+    return MESSAGE_OVERHEAD_BYTES + len(message.content.encode("utf-8"))
+
+
+@dataclass
+class ConversationState:
+    """1セッション分の会話状態"""
+    session_id: Optional[str]
+    max_messages: int = 50
+    messages: Deque["ChatMessage"] = field(init=False)
+    last_access: float = field(default_factory=time.monotonic)
+    size_bytes: int = 0
+    version: Optional[int] = None  # 復元時点の永続化済みメッセージ数（保存のたびに進める）
+
+    def __post_init__(self):
+        self.messages = deque(maxlen=self.max_messages)
+
+    def append(self, message: "ChatMessage") -> int:
+        """メッセージを追加し、増減したバイト数を返す"""
+        delta = estimate_message_bytes(message)
+        if len(self.messages) == self.messages.maxlen:
+            delta -= estimate_message_bytes(self.messages[0])
+        self.messages.append(message)
+        self.size_bytes += delta
+        return delta
+
+    def history(self, limit: Optional[int] = None) -> List["ChatMessage"]:
+        """古い順の履歴を取得"""
+        messages = list(self.messages)
+        return messages[-limit:] if limit else messages
+
+
+class SessionStatePool:
+    """ChatSession.id をキーにした会話状態のプール
+
+    - LRU順に保持し、セッション数とメモリ上限を超えたら古いものから追い出す
+    - 最終アクセスからTTLを過ぎた状態は期限切れとして破棄する
+    - キャッシュミス時は loader で ChatMessage から履歴を復元する
+    - version_loader を渡すと、ヒット時も永続化済みのメッセージ数と比べ、
+      他のワーカーが保存したやり取りがあれば履歴を復元し直す
+    """
+
+    def __init__(
+        self,
+        loader: Optional[HistoryLoader] = None,
+        version_loader: Optional[VersionLoader] = None,
+        max_sessions: int = 1000,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: float = 1800.0,
+        max_messages: int = 50,
+    ):
+        self.loader = loader
+        self.version_loader = version_loader
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_messages = max_messages
+
+        self._states: "OrderedDict[str, ConversationState]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.reloads = 0
+
+    def new_state(self, session_id: Optional[str] = None) -> ConversationState:
+        """プールに登録しない空の会話状態を作成"""
+        return ConversationState(session_id=session_id, max_messages=self.max_messages)
+
+    async def get(self, session_id: Optional[str]) -> ConversationState:
+        """会話状態を取得（ミス時は履歴を復元して登録）"""
+        if not session_id:
+            return self.new_state()
+
+        version = await self._load_version(session_id)
+        state = self.peek(session_id)
+        if state is not None:
+            if version is None or state.version == version:
+                self.hits += 1
+                return state
+            # 他のワーカーが処理したやり取りが保存されている
+            self.reloads += 1
+            with self._lock:
+                if self._states.get(session_id) is state:
+                    self._remove(session_id)
+        else:
+            self.misses += 1
+        messages = await self._load(session_id)
+
+        with self._lock:
+            # 復元中に他のコルーチンが登録していればそちらを使う
+            existing = self._states.get(session_id)
+            if existing is not None:
+                return existing
+
+            state = self.new_state(session_id)
+            state.version = version
+            for message in messages:
+                state.append(message)
+            self._states[session_id] = state
+            self._total_bytes += state.size_bytes
+            self._evict()
+            return state
+
+    def peek(self, session_id: str) -> Optional[ConversationState]:
+        """プールにある会話状態だけを取得（復元はしない）"""
+        now = time.monotonic()
+        with self._lock:
+            state = self._states.get(session_id)
+            if state is None:
+                return None
+            if now - state.last_access > self.ttl:
+                self._remove(session_id)
+                return None
+            state.last_access = now
+            self._states.move_to_end(session_id)
+            return state
+
+    def append(self, state: ConversationState, message: "ChatMessage"):
+        """会話状態にメッセージを追加してメモリ上限を確認"""
+        with self._lock:
+            delta = state.append(message)
+            if self._states.get(state.session_id) is state:
+                self._total_bytes += delta
+                self._evict()
+
+    def record_saved(self, session_id: str, count: int):
+        """このワーカーで処理したやり取りを count 件保存したことを記録（次回は復元し直さない）
+
+        保存の前に他のワーカーが保存していれば件数が合わなくなるので、次回の get で復元し直す。
+        """
+        with self._lock:
+            state = self._states.get(session_id)
+            if state is not None and state.version is not None:
+                state.version += count
+
+    def discard(self, session_id: str):
+        """会話状態を破棄"""
+        with self._lock:
+            self._remove(session_id)
+
+    def clear(self):
+        """すべての会話状態を破棄"""
+        with self._lock:
+            self._states.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """プールの統計情報"""
+        with self._lock:
+            return {
+                "sessions": len(self._states),
+                "bytes": self._total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "reloads": self.reloads,
+            }
+
+    async def _load(self, session_id: str) -> List["ChatMessage"]:
+        """loader で永続化済みの履歴を読み込む"""
+        if self.loader is None:
+            return []
+        try:
+            result = self.loader(session_id, self.max_messages)
+            if inspect.isawaitable(result):
+                result = await result
+            return list(result)
+        except Exception as e:
+            logger.warning(f"Session history load failed ({session_id}): {e}")
+            return []
+
+    async def _load_version(self, session_id: str) -> Optional[int]:
+        """version_loader で永続化済みのメッセージ数を取得（取得できなければ None で比較しない）"""
+        if self.version_loader is None:
+            return None
+        try:
+            result = self.version_loader(session_id)
+            if inspect.isawaitable(result):
+                result = await result
+            return result
+        except Exception as e:
+            logger.warning(f"Session version load failed ({session_id}): {e}")
+            return None
+
+    def _remove(self, session_id: str):
+        state = self._states.pop(session_id, None)
+        if state is not None:
+            self._total_bytes -= state.size_bytes
+
+    def _evict(self):
+        """期限切れ・上限超過の会話状態を古い順に追い出す（ロック取得済みで呼ぶ）"""
+        now = time.monotonic()
+        while self._states:
+            session_id, state = next(iter(self._states.items()))
+            expired = now - state.last_access > self.ttl
+            over_limit = len(self._states) > self.max_sessions or self._total_bytes > self.max_bytes
+            if not (expired or over_limit):
+                break
+            # 追加直後の1件だけが残る場合はメモリ上限を超えても保持する
+            if not expired and len(self._states) == 1:
+                break
+            self._remove(session_id)
+            self.evictions += 1
@@ -0,0 +1,162 @@
+"""
+Single Flight - 同じ内容の同時リクエストを1回のAI呼び出しにまとめる
+先に来たリクエストだけがプロバイダーを呼び、後から来たリクエストはその結果を待つ
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# ロックの持ち主だけが削除する
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+@dataclass
+class SingleFlightConfig:
+    """シングルフライトの設定"""
+    enabled: bool = True
+    redis_url: Optional[str] = None  # 指定するとワーカー間でも同じ呼び出しをまとめる
+    lock_ttl: float = 120.0  # リーダーのロックの有効期間（AI呼び出しより長くする） (seconds)
+    result_ttl: float = 10.0  # 待機中の他ワーカーへ結果を渡すための保持期間 (seconds)
+    poll_interval: float = 0.2  # 他ワーカーの結果を確認する間隔 (seconds)
+    key_prefix: str = "sister_ai:flight:"
+
+
+class RedisFlightStore:
+    """ワーカー間で共有するリーダーのロックと結果"""
+
+    def __init__(self, redis_url: str, key_prefix: str):
+        import redis
+
+        self.client = redis.Redis.from_url(redis_url, socket_timeout=0.05, socket_connect_timeout=0.05)
+        self.key_prefix = key_prefix
+
+    def acquire(self, key: str, token: str, seconds: float) -> bool:
+        """リーダーのロックを取得（Redisに届かない場合は自分で呼び出す）"""
+        try:
+            return bool(self.client.set(f"{self.key_prefix}{key}:lock", token, nx=True, px=int(seconds * 1000)))
+        except Exception as e:
+            logger.debug(f"Flight lock failed ({key}): {e}")
+            return True
+
+    def release(self, key: str, token: str):
+        try:
+            self.client.eval(_RELEASE_SCRIPT, 1, f"{self.key_prefix}{key}:lock", token)
+        except Exception as e:
+            logger.debug(f"Flight unlock failed ({key}): {e}")
+
+    def publish(self, key: str, result: str, seconds: float):
+        try:
+            self.client.set(f"{self.key_prefix}{key}:result", result.encode("utf-8"), px=int(seconds * 1000))
+        except Exception as e:
+            logger.debug(f"Flight result write failed ({key}): {e}")
+
+    def result(self, key: str) -> Optional[str]:
+        try:
+            value = self.client.get(f"{self.key_prefix}{key}:result")
+        except Exception as e:
+            logger.debug(f"Flight result read failed ({key}): {e}")
+            return None
+        return value.decode("utf-8") if value is not None else None
+
+
+class SingleFlight:
+    """キーごとに実行中の呼び出しを1つに保つ
+
+    - 同じプロセス内の待機者は実行中の呼び出しの結果を共有する（イベントループが違っても可）
+    - redis_url を指定すると、他のワーカーがリーダーの場合はその結果を待つ
+    - リーダーのリクエストがキャンセルされても、待っている他のリクエストのために呼び出しは続ける
+    """
+
+    def __init__(self, config: Optional[SingleFlightConfig] = None):
+        self.config = config or SingleFlightConfig()
+        self.store = RedisFlightStore(self.config.redis_url, self.config.key_prefix) if self.config.redis_url else None
+        self._calls: Dict[str, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.enabled
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]], kind: str = "default") -> Tuple[Any, bool]:
+        """fn を実行して (結果, 他の呼び出しの結果を共有したか) を返す
+
+        他のワーカーの結果を待った場合、結果は text 属性の文字列だけになる。
+        """
+        if not self.config.enabled:
+            return await fn(), False
+
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = concurrent.futures.Future()
+
+        if leader:
+            task = asyncio.ensure_future(self._run(key, fn, kind))
+            task.add_done_callback(lambda done: self._settle(key, future, done))
+        else:
+            metrics.increment("sister_ai_singleflight_collapsed_total", kind=kind, scope="local")
+
+        result, shared = await asyncio.shield(asyncio.wrap_future(future))
+        return result, shared or not leader
+
+    async def _run(self, key: str, fn: Callable[[], Awaitable[Any]], kind: str) -> Tuple[Any, bool]:
+        metrics.increment("sister_ai_singleflight_calls_total", kind=kind)
+        if self.store is None:
+            return await fn(), False
+
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.config.lock_ttl
+        waited = False
+        while True:
+            # 待っていた場合だけ結果を見る（終わった呼び出しの結果を後から来た別のリクエストに返さない）
+            if waited:
+                result = self.store.result(key)
+                if result is not None:
+                    metrics.increment("sister_ai_singleflight_collapsed_total", kind=kind, scope="redis")
+                    return result, True
+            if self.store.acquire(key, token, self.config.lock_ttl):
+                try:
+                    result = await fn()
+                    # 他のワーカーにはテキストだけを渡す（計測値などはリーダーのもの）
+                    text = getattr(result, "text", result)
+                    if isinstance(text, str):
+                        self.store.publish(key, text, self.config.result_ttl)
+                    return result, False
+                finally:
+                    self.store.release(key, token)
+            if time.monotonic() >= deadline:
+                logger.warning(f"Gave up waiting for in-flight call {key}")
+                return await fn(), False
+            waited = True
+            await asyncio.sleep(self.config.poll_interval)
+
+    def _settle(self, key: str, future: concurrent.futures.Future, task: "asyncio.Task"):
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+        if task.cancelled():
+            future.set_exception(asyncio.CancelledError())
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result())
@@ -4,16 +4,51 @@ Sister AI Service - 妹キャラクター「紗良」のAIサービス
 """
 
 import asyncio
+import hashlib
 import logging
-from typing import Dict, List, Optional, Any
-from dataclasses import dataclass
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple, Union, Any
+from dataclasses import dataclass, field
 from datetime import datetime
 
-import openai
-from anthropic import Anthropic
+from . import metrics
+from .circuit_breaker import CircuitBreakerConfig, CircuitBreakerRegistry
+from .context_builder import ContextBuilder, ContextWindow, estimate_tokens
+from .hedging import HedgeOutcome, Hedger, HedgingConfig
+from .prompt_templates import PersonalityProfile, PromptTemplateRegistry
+from .providers import ProviderClientConfig, ProviderClientPool
+from .review_cache import ReviewCache
+from .review_chunks import (
+    SECTION_HEADER,
+    CodeChunk,
+    ReviewChunkingConfig,
+    extract_findings,
+    merge_reviews,
+    split_code,
+)
+from .review_diff import IncrementalReviewConfig, carry_forward, diff_code, render_carried
+from .scheduler import REVIEW, AdmissionScheduler, SchedulerConfig, request_scope
+from .semantic_cache import SemanticCache
+from .session_pool import SessionStatePool
+from .singleflight import SingleFlight, SingleFlightConfig
 
 logger = logging.getLogger(__name__)
 
+# プロバイダーごとの利用モデルと出力トークン上限
+CLAUDE_MODEL = "claude-3-sonnet-20240229"
+OPENAI_MODEL = "gpt-4"
+MAX_OUTPUT_TOKENS = 1000
+
+# APIが使えない時の定型応答
+FALLBACK_RESPONSES = {
+    "code_review": "お兄ちゃん、今AIが使えないけど、コードを見る限りきれいに書けてるね！でも念のため、エラーハンドリングとテストを追加することをおすすめするよ。",
+    "improvement_suggestion": "お兄ちゃん、今は具体的な提案ができないけど、まずはコードの可読性向上とテストカバレッジの改善から始めるのがいいと思うよ！",
+    "default": "お兄ちゃん、今ちょっと考え中...もう少し詳しく教えてもらえる？"
+}
+CHAT_ERROR_RESPONSE = "お兄ちゃん、ごめんね。今ちょっと調子が悪いみたい...少し待ってもらえる？"
+CODE_REVIEW_ERROR_RESPONSE = "お兄ちゃん、コードレビューでエラーが発生しちゃった...ごめんね。"
+CANNED_RESPONSES = frozenset(FALLBACK_RESPONSES.values()) | {CHAT_ERROR_RESPONSE, CODE_REVIEW_ERROR_RESPONSE}
+
 
 @dataclass
 class ChatMessage:
@@ -24,6 +59,64 @@ class ChatMessage:
     metadata: Optional[Dict[str, Any]] = None
 
 
+@dataclass
+class ChatResult:
+    """AIの応答と、応答が返るまでの計測値"""
+    text: str
+    provider: str = ""  # 'claude' / 'openai'（キャッシュや定型応答の場合は空）
+    model: str = ""
+    input_tokens: int = 0  # プロバイダーが返した使用量（返らなければ概算）
+    output_tokens: int = 0
+    queue_time: float = 0.0  # スケジューラーの枠を待った時間 (seconds)
+    ttft: Optional[float] = None  # 最初のトークンを返すまでの時間（ストリーミングのみ） (seconds)
+    latency: float = 0.0  # 受け付けてから応答が揃うまでの時間 (seconds)
+    cached: bool = False  # 類似応答キャッシュから返した
+    hedged: bool = False  # ヘッジでセカンダリも呼び出した
+    shared: bool = False  # 同時に来た同じ内容の呼び出しの結果を共有した
+    
+    @property
+    def tokens_used(self) -> int:
+        return self.input_tokens + self.output_tokens
+    
+    def record_call(self, call: "ChatResult"):
+        """プロバイダー呼び出しの計測値を取り込む"""
+        self.provider = call.provider
+        self.model = call.model
+        self.input_tokens = call.input_tokens
+        self.output_tokens = call.output_tokens
+        self.queue_time = call.queue_time
+    
+    def telemetry(self) -> Dict[str, Any]:
+        """保存用の内訳"""
+        return {
+            "provider": self.provider,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "queue_time": round(self.queue_time, 4),
+            "ttft": round(self.ttft, 4) if self.ttft is not None else None,
+            "latency": round(self.latency, 4),
+            "cached": self.cached,
+            "hedged": self.hedged,
+            "shared": self.shared,
+        }
+
+
+@dataclass
+class ReviewResult:
+    """コードレビューの結果"""
+    text: str
+    cached: bool = False
+    shared: bool = False  # 同時に来た同じレビューの呼び出しを共有した
+    model: str = ""
+    input_tokens: int = 0  # このリクエストで消費したトークン数（プロバイダーの使用量、再利用した結果は0）
+    output_tokens: int = 0
+    suggestions: List[Dict[str, Any]] = field(default_factory=list)  # 箇条書きの指摘（行範囲付き）
+    
+    @property
+    def tokens_used(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+
 @dataclass
 class SisterPersonality:
     """紗良の性格設定"""
@@ -70,29 +163,85 @@ class SisterPersonality:
 class SisterAI:
     """紗良AI - お兄ちゃん専属AIアシスタント"""
     
-    def __init__(self, openai_api_key: str = None, anthropic_api_key: str = None):
+    def __init__(self, openai_api_key: str = None, anthropic_api_key: str = None,
+                 session_pool: Optional[SessionStatePool] = None,
+                 context_builder: Optional[ContextBuilder] = None,
+                 client_config: Optional[ProviderClientConfig] = None,
+                 hedging: Optional[HedgingConfig] = None,
+                 circuit_breaker: Optional[CircuitBreakerConfig] = None,
+                 review_cache: Optional[ReviewCache] = None,
+                 semantic_cache: Optional[SemanticCache] = None,
+                 singleflight: Optional[SingleFlightConfig] = None,
+                 review_chunking: Optional[ReviewChunkingConfig] = None,
+                 incremental_review: Optional[IncrementalReviewConfig] = None,
+                 prompt_cache: Any = None,
+                 scheduler: Optional[SchedulerConfig] = None):
         self.personality = SisterPersonality()
-        self.chat_history: List[ChatMessage] = []
+        # 描画済みのシステムプロンプト（prompt_cache にはDjangoのキャッシュを渡す）
+        self.prompts = PromptTemplateRegistry(self.personality, prompt_cache)
+        # 会話履歴はセッションごとにプールで管理する
+        self.sessions = session_pool or SessionStatePool()
+        self.context_builder = context_builder or ContextBuilder()
         
-        # AI API clients
-        if openai_api_key:
-            openai.api_key = openai_api_key
-            self.openai_client = openai
-        else:
-            self.openai_client = None
-            
-        if anthropic_api_key:
-            self.anthropic_client = Anthropic(api_key=anthropic_api_key)
-        else:
-            self.anthropic_client = None
+        # AI API clients（非同期クライアントとHTTPコネクションプールをワーカー内で共有）
+        self.clients = ProviderClientPool(openai_api_key, anthropic_api_key, client_config)
+        self.hedger = Hedger(hedging)
+        self.breakers = CircuitBreakerRegistry(circuit_breaker)
+        # プロバイダーごとの同時呼び出し数を優先度順に割り当てる
+        self.scheduler = AdmissionScheduler(scheduler)
+        self.review_cache = review_cache
+        self.semantic_cache = semantic_cache
+        # 同じ内容の同時リクエストは1回の呼び出しにまとめる
+        self.flights = SingleFlight(singleflight)
+        # 大きなコードは構文の区切りで分割して並行にレビューする
+        self.review_chunking = review_chunking or ReviewChunkingConfig()
+        self.incremental_review = incremental_review or IncrementalReviewConfig()
             
         logger.info("Sister AI initialized: 紗良がお兄ちゃんのサポートを開始しました！")
     
-    async def chat(self, message: str, context: Optional[Dict[str, Any]] = None) -> str:
+    @property
+    def review_prompt_version(self) -> str:
+        """レビュー結果に影響するプロンプトのバージョン（内容のハッシュ）"""
+        prompts = self.personality.base_prompt + self.personality.code_review_prompt
+        chunking = self.review_chunking
+        if chunking.enabled:
+            # 分割の仕方が変わると統合した結果も変わる
+            prompts += f"\0{chunking.threshold_tokens}:{chunking.max_chunk_tokens}"
+        return hashlib.sha256(prompts.encode("utf-8")).hexdigest()[:12]
+    
+    @property
+    def anthropic_client(self):
+        """実行中のイベントループ用のClaudeクライアント"""
+        return self.clients.get().anthropic if self.clients.has_anthropic else None
+    
+    @property
+    def openai_client(self):
+        """実行中のイベントループ用のOpenAIクライアント"""
+        return self.clients.get().openai if self.clients.has_openai else None
+    
+    async def chat(self, message: str, context: Optional[Dict[str, Any]] = None,
+                   session_id: Optional[str] = None, use_cache: bool = True,
+                   profile: Optional[PersonalityProfile] = None) -> str:
         """
         お兄ちゃんとのチャット機能
+        session_id を渡すとそのセッションの履歴だけをプロンプトに含める
+        use_cache=False で類似応答キャッシュを使わない（保存もしない）
+        profile を渡すとお兄ちゃんの性格設定をシステムプロンプトに反映する
+        """
+        result = await self.respond(message, context, session_id, use_cache, profile)
+        return result.text
+    
+    async def respond(self, message: str, context: Optional[Dict[str, Any]] = None,
+                      session_id: Optional[str] = None, use_cache: bool = True,
+                      profile: Optional[PersonalityProfile] = None) -> ChatResult:
+        """
+        チャット機能（応答に加えてプロバイダー・モデル・トークン数・待ち時間を返す）
         """
+        started_at = time.perf_counter()
         try:
+            state = await self.sessions.get(session_id)
+            history = state.history()
+            
             # メッセージを履歴に追加
             user_message = ChatMessage(
                 role="user",
@@ -100,32 +249,210 @@ class SisterAI:
                 timestamp=datetime.now(),
                 metadata=context
             )
-            self.chat_history.append(user_message)
+            self.sessions.append(state, user_message)
             
             # システムプロンプトを準備
-            system_prompt = self._build_system_prompt(context)
+            system_prompt = await self.prompts.get(self._context_type(context), profile)
             
-            # AI APIを呼び出し
-            response = await self._call_ai_api(message, system_prompt, context)
+            # 似た質問への応答があれば再利用し、なければAI APIを呼び出す
+            namespace = self._semantic_namespace(message, system_prompt, context, history, use_cache)
+            cached = self.semantic_cache.lookup(namespace, message) if namespace else None
+            if cached is not None:
+                result = ChatResult(text=cached, cached=True)
+            else:
+                result = await self._call_ai_api(message, system_prompt, context, history)
+                if namespace and result.text not in CANNED_RESPONSES:
+                    self.semantic_cache.store(namespace, message, result.text)
             
             # レスポンスを履歴に追加
             assistant_message = ChatMessage(
                 role="assistant",
-                content=response,
+                content=result.text,
                 timestamp=datetime.now()
             )
-            self.chat_history.append(assistant_message)
-            
-            return response
+            self.sessions.append(state, assistant_message)
             
         except Exception as e:
             logger.error(f"Chat error: {e}")
-            return "お兄ちゃん、ごめんね。今ちょっと調子が悪いみたい...少し待ってもらえる？"
+            metrics.increment("sister_ai_errors_total", operation="chat")
+            result = ChatResult(text=CHAT_ERROR_RESPONSE)
+        
+        result.latency = time.perf_counter() - started_at
+        return result
+    
+    async def chat_stream(self, message: str, context: Optional[Dict[str, Any]] = None,
+                          session_id: Optional[str] = None, use_cache: bool = True,
+                          profile: Optional[PersonalityProfile] = None,
+                          result: Optional[ChatResult] = None) -> AsyncIterator[str]:
+        """
+        お兄ちゃんとのチャット機能（ストリーミング版）
+        生成されたテキストの差分を届いた順にyieldする
+        result を渡すと、完了時に応答全体と計測値を書き込む
+        """
+        started_at = time.perf_counter()
+        result = result if result is not None else ChatResult(text="")
+        state = await self.sessions.get(session_id)
+        history = state.history()
+        
+        user_message = ChatMessage(
+            role="user",
+            content=message,
+            timestamp=datetime.now(),
+            metadata=context
+        )
+        self.sessions.append(state, user_message)
+        
+        system_prompt = await self.prompts.get(self._context_type(context), profile)
+        
+        namespace = self._semantic_namespace(message, system_prompt, context, history, use_cache)
+        cached = self.semantic_cache.lookup(namespace, message) if namespace else None
+        
+        chunks: List[str] = []
+        try:
+            if cached is not None:
+                result.cached = True
+                result.ttft = time.perf_counter() - started_at
+                chunks.append(cached)
+                yield cached
+            else:
+                async for delta in self._stream_ai_api(message, system_prompt, context, history, result):
+                    if not chunks:
+                        result.ttft = time.perf_counter() - started_at
+                    chunks.append(delta)
+                    yield delta
+                response = "".join(chunks)
+                if namespace and response and response not in CANNED_RESPONSES:
+                    self.semantic_cache.store(namespace, message, response)
+        except Exception as e:
+            logger.error(f"Chat stream error: {e}")
+            metrics.increment("sister_ai_errors_total", operation="chat_stream")
+            if not chunks:
+                delta = CHAT_ERROR_RESPONSE
+                chunks.append(delta)
+                yield delta
+        
+        # 完了した応答を履歴に追加
+        result.text = "".join(chunks)
+        result.latency = time.perf_counter() - started_at
+        assistant_message = ChatMessage(
+            role="assistant",
+            content=result.text,
+            timestamp=datetime.now()
+        )
+        self.sessions.append(state, assistant_message)
     
-    async def code_review(self, code: str, language: str = "python") -> str:
+    async def code_review(self, code: str, language: str = "python",
+                          session_id: Optional[str] = None) -> str:
         """
         コードレビュー機能
         """
+        result = await self.review_code(code, language, session_id)
+        return result.text
+    
+    async def review_code(self, code: str, language: str = "python",
+                          session_id: Optional[str] = None) -> ReviewResult:
+        """
+        コードレビュー機能（結果キャッシュ対応）
+        セッションに依存しないレビューは同じコードなら前回の結果を再利用する
+        """
+        cache_key = None
+        if self.review_cache and self.review_cache.enabled and not session_id:
+            cache_key = self.review_cache.make_key(
+                code, language, self.review_prompt_version, self._primary_model()
+            )
+            cached = await self.review_cache.get(cache_key)
+            if cached:
+                return ReviewResult(text=cached, cached=True, model=self._primary_model(),
+                                    suggestions=extract_findings(cached, len(code.splitlines())))
+        
+        async def generate() -> ChatResult:
+            result = await self._generate_code_review(code, language, session_id)
+            if cache_key and result.text not in CANNED_RESPONSES:
+                await self.review_cache.set(cache_key, result.text)
+            return result
+        
+        flight_key = self._flight_key("code_review", session_id, language, self.review_prompt_version, code)
+        with request_scope(REVIEW):
+            result = self._shared_result(*await self.flights.do(flight_key, generate, kind="code_review"))
+        text = result.text
+        if text in CANNED_RESPONSES:
+            return ReviewResult(text=text, shared=result.shared)
+        return ReviewResult(text=text, shared=result.shared, model=result.model or self._primary_model(),
+                            input_tokens=result.input_tokens, output_tokens=result.output_tokens,
+                            suggestions=extract_findings(text, len(code.splitlines())))
+    
+    async def review_changes(self, code: str, language: str, previous_code: str, previous_review: str,
+                             previous_suggestions: Optional[List[Dict[str, Any]]] = None,
+                             session_id: Optional[str] = None) -> ReviewResult:
+        """
+        前回レビューしたコードからの差分レビュー
+        変更された部分だけをAIに送り、変更のない部分の前回の指摘は行番号を付け替えて引き継ぐ。
+        変更が多い場合や小さなコードは全体をレビューする。
+        """
+        config = self.incremental_review
+        if not config.enabled or not previous_review or estimate_tokens(code) < config.min_tokens:
+            return await self.review_code(code, language, session_id)
+        
+        diff = diff_code(previous_code, code, config.context_lines)
+        if not diff.hunks:
+            metrics.increment("sister_ai_incremental_review_total", result="unchanged")
+            return ReviewResult(text=previous_review, cached=True, model=self._primary_model(),
+                                suggestions=list(previous_suggestions or []))
+        if diff.changed_ratio > config.max_changed_ratio:
+            metrics.increment("sister_ai_incremental_review_total", result="full")
+            return await self.review_code(code, language, session_id)
+        
+        hunks = "\n...\n".join(hunk.text for hunk in diff.hunks)
+        prompt = f"""
+            {self.personality.code_review_prompt}
+            
+            言語: {language}
+            前回レビューしたコードの変更部分だけを送るね（全{diff.total_lines}行）。
+            行頭の数字は新しいファイルの行番号、+ は追加・変更された行、- は削除された行だよ。
+            変更された行についてだけ、行番号を付けて箇条書きで指摘してね。
+            ```{language}
+            {hunks}
+            ```
+            """
+        context = {"type": "code_review", "language": language}
+        try:
+            with request_scope(REVIEW):
+                response = await self._call_ai_api(prompt, self._build_system_prompt(context), context)
+        except Exception as e:
+            logger.error(f"Incremental review error: {e}")
+            metrics.increment("sister_ai_errors_total", operation="code_review")
+            response = ChatResult(text=CODE_REVIEW_ERROR_RESPONSE)
+        if response.text in CANNED_RESPONSES:
+            return ReviewResult(text=response.text)
+        
+        start, end = diff.span
+        changes = f"{SECTION_HEADER.format(start=start, end=end, label=' (変更部分)')}\n{response.text.strip()}"
+        carried = carry_forward(previous_suggestions or [], diff)
+        sections = [f"前回のレビューから変わった{len(diff.hunks)}か所を見たよ、お兄ちゃん。", changes]
+        if carried:
+            sections.append(f"変更のない部分の前回の指摘もそのまま残しておくね。\n\n{render_carried(carried)}")
+        text = "\n\n".join(sections)
+        
+        metrics.increment("sister_ai_incremental_review_total", result="diff")
+        metrics.increment("sister_ai_incremental_review_tokens_saved_total",
+                          max(0, estimate_tokens(code) - estimate_tokens(hunks)))
+        return ReviewResult(
+            text=text,
+            model=response.model or self._primary_model(),
+            input_tokens=response.input_tokens,
+            output_tokens=response.output_tokens,
+            suggestions=extract_findings(changes, diff.total_lines) + carried,
+        )
+    
+    async def _generate_code_review(self, code: str, language: str,
+                                    session_id: Optional[str] = None) -> ChatResult:
+        """AIにコードレビューを依頼"""
+        chunking = self.review_chunking
+        if chunking.enabled and estimate_tokens(code) > chunking.threshold_tokens:
+            chunks = split_code(code, language, chunking.max_chunk_tokens)
+            if len(chunks) > 1:
+                return await self._generate_chunked_review(code, chunks, language, session_id)
+        
         try:
             context = {
                 "type": "code_review",
@@ -143,16 +470,96 @@ class SisterAI:
             ```
             """
             
-            return await self.chat(prompt, context)
+            return await self.respond(prompt, context, session_id)
             
         except Exception as e:
             logger.error(f"Code review error: {e}")
-            return "お兄ちゃん、コードレビューでエラーが発生しちゃった...ごめんね。"
+            metrics.increment("sister_ai_errors_total", operation="code_review")
+            return ChatResult(text=CODE_REVIEW_ERROR_RESPONSE)
+    
+    async def _generate_chunked_review(self, code: str, chunks: List[CodeChunk], language: str,
+                                       session_id: Optional[str] = None) -> ChatResult:
+        """チャンクごとに並行してレビューし、結果を1つにまとめる
+        
+        所要時間はファイル全体ではなく一番大きいチャンクのレビュー時間で決まる。
+        """
+        context = {"type": "code_review", "language": language}
+        system_prompt = self._build_system_prompt(context)
+        total_lines = len(code.splitlines())
+        semaphore = asyncio.Semaphore(self.review_chunking.max_parallel)
+        
+        async def review_chunk(chunk: CodeChunk) -> Optional[ChatResult]:
+            prompt = f"""
+            {self.personality.code_review_prompt}
+            
+            言語: {language}
+            全{total_lines}行のファイルのうち {chunk.start_line}〜{chunk.end_line}行目{chunk.label} です。
+            指摘は箇条書きで、行番号は元のファイルの行番号で書いてね。
+            コード:
+            ```{language}
+            {chunk.text}
+            ```
+            """
+            try:
+                async with semaphore:
+                    response = await self._call_ai_api(prompt, system_prompt, context)
+            except Exception as e:
+                logger.error(f"Chunk review error ({chunk.start_line}-{chunk.end_line}): {e}")
+                metrics.increment("sister_ai_errors_total", operation="code_review")
+                return None
+            return None if response.text in CANNED_RESPONSES else response
+        
+        results = await asyncio.gather(*(review_chunk(chunk) for chunk in chunks))
+        reviewed = [result for result in results if result]
+        if not reviewed:
+            return ChatResult(text=CODE_REVIEW_ERROR_RESPONSE)
+        merged = merge_reviews(chunks, [result.text if result else None for result in results])
+        
+        if session_id:
+            # 履歴にはコード全体ではなく依頼の要約を残す
+            state = await self.sessions.get(session_id)
+            self.sessions.append(state, ChatMessage(
+                role="user",
+                content=f"{language}のコード（{total_lines}行）をレビューして",
+                timestamp=datetime.now(),
+                metadata=context,
+            ))
+            self.sessions.append(state, ChatMessage(role="assistant", content=merged, timestamp=datetime.now()))
+        # 並行して呼んだので、待ち時間は一番長く待ったチャンクのもの
+        return ChatResult(
+            text=merged,
+            provider=reviewed[0].provider,
+            model=reviewed[0].model,
+            input_tokens=sum(result.input_tokens for result in reviewed),
+            output_tokens=sum(result.output_tokens for result in reviewed),
+            queue_time=max(result.queue_time for result in reviewed),
+            hedged=any(result.hedged for result in reviewed),
+        )
     
-    async def suggest_improvement(self, project_info: Dict[str, Any]) -> str:
+    async def suggest_improvement(self, project_info: Dict[str, Any],
+                                  session_id: Optional[str] = None) -> str:
         """
         プロジェクト改善提案機能
         """
+        result = await self.suggest(project_info, session_id)
+        return result.text
+    
+    async def suggest(self, project_info: Dict[str, Any], session_id: Optional[str] = None) -> ChatResult:
+        """
+        プロジェクト改善提案機能（応答に加えてモデル・トークン数などを返す）
+        """
+        flight_key = self._flight_key(
+            "suggestion", session_id, self.personality.suggestion_prompt, self._format_project_info(project_info)
+        )
+        with request_scope(REVIEW):
+            result = self._shared_result(*await self.flights.do(
+                flight_key, lambda: self._generate_suggestion(project_info, session_id), kind="suggestion"
+            ))
+        return result
+    
+    async def _generate_suggestion(self, project_info: Dict[str, Any],
+                                   session_id: Optional[str] = None) -> ChatResult:
+        """AIに改善提案を依頼"""
         try:
             context = {
                 "type": "improvement_suggestion",
@@ -166,96 +573,365 @@ class SisterAI:
             {self._format_project_info(project_info)}
             """
             
-            return await self.chat(prompt, context)
+            return await self.respond(prompt, context, session_id)
             
         except Exception as e:
             logger.error(f"Improvement suggestion error: {e}")
-            return "お兄ちゃん、提案を考えるのにちょっと時間がかかっちゃう...待ってて。"
+            metrics.increment("sister_ai_errors_total", operation="suggestion")
+            return ChatResult(text="お兄ちゃん、提案を考えるのにちょっと時間がかかっちゃう...待ってて。")
     
-    def _build_system_prompt(self, context: Optional[Dict[str, Any]] = None) -> str:
-        """システムプロンプトの構築"""
-        base_prompt = self.personality.base_prompt
+    def _flight_key(self, kind: str, session_id: Optional[str], *parts: str) -> str:
+        """同時リクエストをまとめるためのキー（セッションが違えば別の呼び出しにする）"""
+        digest = hashlib.sha256()
+        for part in (kind, session_id or "", self._primary_model(), *parts):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return f"{kind}:{digest.hexdigest()}"
+    
+    @staticmethod
+    def _shared_result(result: Union[ChatResult, str], shared: bool) -> ChatResult:
+        """シングルフライトの結果（共有した結果のトークンはこのリクエストの消費に数えない）"""
+        if isinstance(result, str):
+            # 他のワーカーの結果はテキストだけ
+            return ChatResult(text=result, shared=True)
+        if shared:
+            return ChatResult(text=result.text, provider=result.provider, model=result.model,
+                              cached=result.cached, shared=True)
+        return result
+    
+    def _build_system_prompt(self, context: Optional[Dict[str, Any]] = None,
+                             profile: Optional[PersonalityProfile] = None) -> str:
+        """システムプロンプトの構築（描画済みのものを再利用する）"""
+        return self.prompts.render(self._context_type(context), profile)
+    
+    @staticmethod
+    def _context_type(context: Optional[Dict[str, Any]]) -> str:
+        return (context or {}).get("type") or "default"
+    
+    async def _call_ai_api(self, message: str, system_prompt: str, context: Optional[Dict[str, Any]] = None,
+                           history: Optional[List[ChatMessage]] = None) -> ChatResult:
+        """AI APIの呼び出し（Claude優先、OpenAI fallback）
         
-        if context and context.get("type") == "code_review":
-            base_prompt += f"\n\n{self.personality.code_review_prompt}"
-        elif context and context.get("type") == "improvement_suggestion":
-            base_prompt += f"\n\n{self.personality.suggestion_prompt}"
+        ヘッジが有効な場合、Claudeが閾値内に応答しなければOpenAIも並行して呼び、
+        先に返った方を採用する。
+        """
+        providers = self._available_providers()
+        if self.hedger.enabled and len(providers) > 1:
+            (primary, primary_call, _), (secondary, secondary_call, _) = providers[:2]
+            outcome = HedgeOutcome()
+            winner = await self.hedger.call(
+                (primary, lambda: self._timed_call(primary, primary_call, message, system_prompt, history)),
+                (secondary, lambda: self._timed_call(secondary, secondary_call, message, system_prompt, history)),
+                outcome,
+            )
+            if winner:
+                result = winner[1]
+                result.hedged = outcome.hedged
+                return result
+            return ChatResult(text=self._fallback_response(message, context), hedged=outcome.hedged)
+        
+        # 優先順に試す
+        for name, call, _ in providers:
+            try:
+                result = await self._timed_call(name, call, message, system_prompt, history)
+                if result:
+                    return result
+            except Exception as e:
+                logger.warning(f"{name} API error, trying next provider: {e}")
         
-        return base_prompt
+        # フォールバック応答
+        return ChatResult(text=self._fallback_response(message, context))
     
-    async def _call_ai_api(self, message: str, system_prompt: str, context: Optional[Dict[str, Any]] = None) -> str:
-        """AI APIの呼び出し（Claude優先、OpenAI fallback）"""
+    async def _stream_ai_api(self, message: str, system_prompt: str, context: Optional[Dict[str, Any]] = None,
+                             history: Optional[List[ChatMessage]] = None,
+                             result: Optional[ChatResult] = None) -> AsyncIterator[str]:
+        """AI APIのストリーミング呼び出し（Claude優先、OpenAI fallback）
         
-        # Claude API を試す
-        if self.anthropic_client:
+        最初の差分を返す前に失敗した場合のみ次のプロバイダーへ切り替える。
+        ヘッジが有効な場合は最初のトークンまでの時間を基準に並行して呼び出す。
+        result には採用したプロバイダーの計測値を書き込む。
+        """
+        result = result if result is not None else ChatResult(text="")
+        providers = self._available_providers()
+        if self.hedger.enabled and len(providers) > 1:
+            (primary, _, primary_stream), (secondary, _, secondary_stream) = providers[:2]
+            calls = {primary: ChatResult(text=""), secondary: ChatResult(text="")}
+            outcome = HedgeOutcome()
+            started = False
             try:
-                response = await self._call_claude_api(message, system_prompt)
-                if response:
-                    return response
+                async for delta in self.hedger.stream(
+                    (primary, lambda: self._timed_stream(
+                        primary, primary_stream, calls[primary], message, system_prompt, history)),
+                    (secondary, lambda: self._timed_stream(
+                        secondary, secondary_stream, calls[secondary], message, system_prompt, history)),
+                    outcome,
+                ):
+                    started = True
+                    yield delta
             except Exception as e:
-                logger.warning(f"Claude API error, trying OpenAI: {e}")
+                if started:
+                    # 途中まで送ってしまった応答は差し替えられない
+                    logger.error(f"{outcome.winner} stream interrupted: {e}")
+                else:
+                    logger.warning(f"Hedged stream error: {e}")
+            result.hedged = outcome.hedged
+            if not started:
+                yield self._fallback_response(message, context)
+                return
+            result.record_call(calls[outcome.winner])
+            return
         
-        # OpenAI API を試す
-        if self.openai_client:
+        for name, _, stream in providers:
+            call = ChatResult(text="")
+            started = False
             try:
-                return await self._call_openai_api(message, system_prompt)
+                async for delta in self._timed_stream(name, stream, call, message, system_prompt, history):
+                    started = True
+                    yield delta
+                if started:
+                    result.record_call(call)
+                    return
             except Exception as e:
-                logger.error(f"OpenAI API error: {e}")
+                if started:
+                    # 途中まで送ってしまった応答は差し替えられない
+                    logger.error(f"{name} stream interrupted: {e}")
+                    result.record_call(call)
+                    return
+                logger.warning(f"{name} stream error, trying next provider: {e}")
         
         # フォールバック応答
-        return self._fallback_response(message, context)
+        yield self._fallback_response(message, context)
+    
+    def _semantic_namespace(self, message: str, system_prompt: str, context: Optional[Dict[str, Any]],
+                            history: List[ChatMessage], use_cache: bool) -> Optional[str]:
+        """類似応答キャッシュの名前空間（対象外なら None）
+        
+        チャットは同じセッションを使い続けるので、会話の途中でも単独で意味の通る質問は対象にする。
+        前のやり取りを指す続きの質問は履歴によって答えが変わるため対象外にする。
+        """
+        if not (use_cache and self.semantic_cache and self.semantic_cache.enabled):
+            return None
+        context_type = self._context_type(context)
+        if not self.semantic_cache.accepts(context_type, message):
+            return None
+        if history and self.semantic_cache.is_follow_up(message):
+            return None
+        return self.semantic_cache.namespace(context_type, system_prompt)
     
-    async def _call_claude_api(self, message: str, system_prompt: str) -> str:
+    def _primary_model(self) -> str:
+        """優先して使うモデル名"""
+        return CLAUDE_MODEL if self.clients.has_anthropic else OPENAI_MODEL
+    
+    def _available_providers(self) -> List[Tuple[str, Callable, Callable]]:
+        """利用可能なプロバイダーを優先順に返す (名前, 通常呼び出し, ストリーミング呼び出し)
+        
+        サーキットブレーカーがオープンのプロバイダーはタイムアウトを待たずにスキップする。
+        """
+        providers = []
+        if self.anthropic_client and self.breakers.get("claude").allow():
+            providers.append(("claude", self._call_claude_api, self._stream_claude_api))
+        if self.openai_client and self.breakers.get("openai").allow():
+            providers.append(("openai", self._call_openai_api, self._stream_openai_api))
+        return providers
+    
+    async def _timed_call(self, provider: str, call: Callable, *args) -> Optional[ChatResult]:
+        """呼び出しのレイテンシと成否を記録（スケジューラーの枠を確保してから呼ぶ）"""
+        breaker = self.breakers.get(provider)
+        queued_at = time.perf_counter()
+        async with self.scheduler.slot(provider):
+            started_at = time.perf_counter()
+            metrics.adjust_gauge("sister_ai_provider_in_flight", 1, provider=provider)
+            try:
+                response = await call(*args)
+            except Exception:
+                breaker.record_failure(time.perf_counter() - started_at)
+                metrics.increment("sister_ai_provider_errors_total", provider=provider)
+                raise
+            finally:
+                metrics.adjust_gauge("sister_ai_provider_in_flight", -1, provider=provider)
+        
+        elapsed = time.perf_counter() - started_at
+        if response:
+            response.queue_time = started_at - queued_at
+            self.hedger.record(provider, elapsed)
+            breaker.record_success(elapsed)
+            self._record_call(response, elapsed)
+        else:
+            breaker.record_failure(elapsed)
+            metrics.increment("sister_ai_provider_errors_total", provider=provider)
+        return response
+    
+    async def _timed_stream(self, provider: str, stream: Callable, result: ChatResult, *args) -> AsyncIterator[str]:
+        """ストリーミングの最初のトークンまでの時間・完了までの時間と成否を記録
+        
+        result にはプロバイダー・待ち時間と、完了時にモデルとトークン使用量を書き込む。
+        """
+        breaker = self.breakers.get(provider)
+        queued_at = time.perf_counter()
+        async with self.scheduler.slot(provider):
+            started_at = time.perf_counter()
+            result.provider = provider
+            result.queue_time = started_at - queued_at
+            ttft = None
+            metrics.adjust_gauge("sister_ai_provider_in_flight", 1, provider=provider)
+            try:
+                async for delta in stream(*args, result=result):
+                    if ttft is None:
+                        ttft = time.perf_counter() - started_at
+                        self.hedger.record(provider, ttft, kind="ttft")
+                    yield delta
+            except Exception:
+                breaker.record_failure(time.perf_counter() - started_at)
+                metrics.increment("sister_ai_provider_errors_total", provider=provider)
+                raise
+            finally:
+                metrics.adjust_gauge("sister_ai_provider_in_flight", -1, provider=provider)
+        
+        elapsed = time.perf_counter() - started_at
+        if ttft is None:
+            breaker.record_failure(elapsed)
+            metrics.increment("sister_ai_provider_errors_total", provider=provider)
+        else:
+            self.hedger.record(provider, elapsed)
+            breaker.record_success(ttft)
+            self._record_call(result, elapsed, ttft)
+    
+    def _record_call(self, result: ChatResult, latency: float, ttft: Optional[float] = None):
+        """成功した呼び出しのレイテンシとトークン使用量をプロバイダー・モデルごとに記録"""
+        labels = {"provider": result.provider, "model": result.model}
+        metrics.observe("sister_ai_provider_latency_seconds", latency, **labels)
+        if ttft is not None:
+            metrics.observe("sister_ai_provider_ttft_seconds", ttft, **labels)
+        metrics.increment("sister_ai_tokens_total", result.input_tokens, direction="input", **labels)
+        metrics.increment("sister_ai_tokens_total", result.output_tokens, direction="output", **labels)
+    
+    @staticmethod
+    def _set_usage(result: ChatResult, model: str, window: ContextWindow, text: str,
+                   input_tokens: Optional[int], output_tokens: Optional[int]) -> ChatResult:
+        """応答したモデルとトークン使用量を設定（プロバイダーが使用量を返さなければ概算する）"""
+        result.model = model
+        result.input_tokens = input_tokens if input_tokens is not None else window.tokens
+        result.output_tokens = output_tokens if output_tokens is not None else estimate_tokens(text)
+        return result
+    
+    async def _stream_claude_api(self, message: str, system_prompt: str,
+                                 history: Optional[List[ChatMessage]] = None,
+                                 result: Optional[ChatResult] = None) -> AsyncIterator[str]:
+        """Claude APIのストリーミング呼び出し（完了時に result へ使用量を書き込む）"""
+        window = self._build_context(CLAUDE_MODEL, message, system_prompt, history)
+        parts = []
+        async with self.anthropic_client.messages.stream(
+            model=CLAUDE_MODEL,
+            max_tokens=MAX_OUTPUT_TOKENS,
+            system=window.system,
+            messages=window.messages
+        ) as stream:
+            async for text in stream.text_stream:
+                if text:
+                    parts.append(text)
+                    yield text
+            final = await stream.get_final_message()
+        
+        if result is not None:
+            usage = getattr(final, "usage", None)
+            self._set_usage(result, final.model or CLAUDE_MODEL, window, "".join(parts),
+                            _usage_value(usage, "input_tokens"), _usage_value(usage, "output_tokens"))
+    
+    async def _stream_openai_api(self, message: str, system_prompt: str,
+                                 history: Optional[List[ChatMessage]] = None,
+                                 result: Optional[ChatResult] = None) -> AsyncIterator[str]:
+        """OpenAI APIのストリーミング呼び出し（完了時に result へ使用量を書き込む）"""
+        window = self._build_context(OPENAI_MODEL, message, system_prompt, history)
+        response = await self.openai_client.chat.completions.create(
+            model=OPENAI_MODEL,
+            messages=self._openai_messages(window),
+            max_tokens=MAX_OUTPUT_TOKENS,
+            temperature=0.7,
+            stream=True,
+            # 最後のチャンクで使用量を受け取る（openai==1.3.5 には stream_options 引数がない）
+            extra_body={"stream_options": {"include_usage": True}},
+        )
+        
+        parts = []
+        model = OPENAI_MODEL
+        usage = None
+        async for chunk in response:
+            model = chunk.model or model
+            usage = getattr(chunk, "usage", None) or usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+        
+        if result is not None:
+            self._set_usage(result, model, window, "".join(parts),
+                            _usage_value(usage, "prompt_tokens"), _usage_value(usage, "completion_tokens"))
+    
+    async def _call_claude_api(self, message: str, system_prompt: str,
+                               history: Optional[List[ChatMessage]] = None) -> Optional[ChatResult]:
         """Claude APIの呼び出し"""
         try:
+            window = self._build_context(CLAUDE_MODEL, message, system_prompt, history)
             response = await self.anthropic_client.messages.create(
-                model="claude-3-sonnet-20240229",
-                max_tokens=1000,
-                system=system_prompt,
-                messages=[{"role": "user", "content": message}]
+                model=CLAUDE_MODEL,
+                max_tokens=MAX_OUTPUT_TOKENS,
+                system=window.system,
+                messages=window.messages
             )
-            return response.content[0].text
+            text = response.content[0].text
+            if not text:
+                return None
+            usage = getattr(response, "usage", None)
+            return self._set_usage(ChatResult(text=text, provider="claude"), response.model or CLAUDE_MODEL,
+                                   window, text, _usage_value(usage, "input_tokens"),
+                                   _usage_value(usage, "output_tokens"))
         except Exception as e:
             logger.error(f"Claude API call failed: {e}")
             return None
     
-    async def _call_openai_api(self, message: str, system_prompt: str) -> str:
+    async def _call_openai_api(self, message: str, system_prompt: str,
+                               history: Optional[List[ChatMessage]] = None) -> Optional[ChatResult]:
         """OpenAI APIの呼び出し"""
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": message}
-        ]
-        
-        # 履歴も含める（最新10件）
-        for hist_msg in self.chat_history[-10:]:
-            if hist_msg.role in ["user", "assistant"]:
-                messages.append({
-                    "role": hist_msg.role,
-                    "content": hist_msg.content
-                })
-        
-        response = await self.openai_client.ChatCompletion.acreate(
-            model="gpt-4",
-            messages=messages,
-            max_tokens=1000,
+        window = self._build_context(OPENAI_MODEL, message, system_prompt, history)
+        response = await self.openai_client.chat.completions.create(
+            model=OPENAI_MODEL,
+            messages=self._openai_messages(window),
+            max_tokens=MAX_OUTPUT_TOKENS,
             temperature=0.7
         )
         
-        return response.choices[0].message.content
+        text = response.choices[0].message.content
+        if not text:
+            return None
+        usage = getattr(response, "usage", None)
+        return self._set_usage(ChatResult(text=text, provider="openai"), response.model or OPENAI_MODEL,
+                               window, text, _usage_value(usage, "prompt_tokens"),
+                               _usage_value(usage, "completion_tokens"))
+    
+    def _build_context(self, model: str, message: str, system_prompt: str,
+                       history: Optional[List[ChatMessage]] = None) -> ContextWindow:
+        """モデルのトークン予算に収まるコンテキストを構築"""
+        window = self.context_builder.build(
+            model, system_prompt, history or [], message, max_output_tokens=MAX_OUTPUT_TOKENS
+        )
+        if window.dropped_turns or window.truncated:
+            logger.debug(
+                f"Context trimmed for {model}: ~{window.tokens} tokens, "
+                f"dropped {window.dropped_turns} turns, truncated={window.truncated}"
+            )
+        return window
+    
+    def _openai_messages(self, window: ContextWindow) -> List[Dict[str, str]]:
+        """OpenAI API用のメッセージリスト（システムプロンプト→履歴→今回のメッセージ）"""
+        return [{"role": "system", "content": window.system}] + window.messages
     
     def _fallback_response(self, message: str, context: Optional[Dict[str, Any]] = None) -> str:
         """APIが使えない時のフォールバック応答"""
-        fallback_responses = {
-            "code_review": "お兄ちゃん、今AIが使えないけど、コードを見る限りきれいに書けてるね！でも念のため、エラーハンドリングとテストを追加することをおすすめするよ。",
-            "improvement_suggestion": "お兄ちゃん、今は具体的な提案ができないけど、まずはコードの可読性向上とテストカバレッジの改善から始めるのがいいと思うよ！",
-            "default": "お兄ちゃん、今ちょっと考え中...もう少し詳しく教えてもらえる？"
-        }
-        
         response_type = "default"
-        if context and context.get("type"):
+        if context and context.get("type") in FALLBACK_RESPONSES:
             response_type = context["type"]
         
-        return fallback_responses.get(response_type, fallback_responses["default"])
+        metrics.increment("sister_ai_fallback_total", type=response_type)
+        return FALLBACK_RESPONSES[response_type]
     
     def _format_project_info(self, project_info: Dict[str, Any]) -> str:
         """プロジェクト情報のフォーマット"""
@@ -264,10 +940,14 @@ class SisterAI:
             formatted.append(f"- {key}: {value}")
         return "\n".join(formatted)
     
-    def get_chat_history(self, limit: int = 50) -> List[Dict[str, Any]]:
-        """チャット履歴の取得"""
+    def get_chat_history(self, limit: int = 50, session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """チャット履歴の取得（プールに載っているセッションのみ）"""
+        state = self.sessions.peek(session_id) if session_id else None
+        if state is None:
+            return []
+        
         history = []
-        for msg in self.chat_history[-limit:]:
+        for msg in state.history(limit):
             history.append({
                 "role": msg.role,
                 "content": msg.content,
@@ -276,18 +956,30 @@ class SisterAI:
             })
         return history
     
-    def clear_chat_history(self):
-        """チャット履歴のクリア"""
-        self.chat_history.clear()
+    def clear_chat_history(self, session_id: Optional[str] = None):
+        """チャット履歴のクリア（session_id 省略時は全セッション）"""
+        if session_id:
+            self.sessions.discard(session_id)
+        else:
+            self.sessions.clear()
         logger.info("Chat history cleared")
 
 
+def _usage_value(usage: Any, name: str) -> Optional[int]:
+    """SDKの使用量（オブジェクトまたはdict）から値を取り出す"""
+    if usage is None:
+        return None
+    return usage.get(name) if isinstance(usage, dict) else getattr(usage, name, None)
+
+
 # シングルトンインスタンス
+# APIクライアントを共有するためのもので、会話状態はセッションプールが持つ
 _sister_ai_instance = None
 
-def get_sister_ai(openai_api_key: str = None, anthropic_api_key: str = None) -> SisterAI:
-    """Sister AIのシングルトンインスタンスを取得"""
+
+def get_sister_ai(openai_api_key: str = None, anthropic_api_key: str = None, **options) -> SisterAI:
+    """Sister AIのシングルトンインスタンスを取得（options は初回生成時に SisterAI へ渡す）"""
     global _sister_ai_instance
     if _sister_ai_instance is None:
-        _sister_ai_instance = SisterAI(openai_api_key, anthropic_api_key)
+        _sister_ai_instance = SisterAI(openai_api_key, anthropic_api_key, **options)
     return _sister_ai_instance
\ No newline at end of file
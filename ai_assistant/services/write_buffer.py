@@ -0,0 +1,189 @@
+"""
+Write Buffer - 利用記録のライトビハインドバッファ
+リクエスト中は行をメモリ（またはRedis）に積むだけにして、件数か時間のしきい値でまとめて書き込む
+"""
+
+import json
+import logging
+import os
+import threading
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+Row = Dict[str, Any]
+RowWriter = Callable[[str, List[Row]], None]
+
+
+@dataclass
+class WriteBufferConfig:
+    """ライトビハインドバッファの設定"""
+    enabled: bool = True  # False の場合は add() のたびに書き込む
+    redis_url: Optional[str] = None  # 指定するとRedisのリストに積み、どのワーカーからでも書き込む
+    batch_size: int = 200  # この件数たまったら書き込む（1回の書き込みの上限でもある）
+    flush_interval: float = 5.0  # 件数に達しなくても書き込む間隔 (seconds)
+    max_buffered: int = 10000  # 書き込めない間にプロセス内に保持する上限（超えたら古いものから捨てる）
+    key: str = "sister_ai:write_buffer"
+
+
+class RedisRowStore:
+    """ワーカー間で共有する未書き込みの行（1つのリストに種類ごと積む）"""
+
+    def __init__(self, redis_url: str, key: str):
+        import redis
+
+        self.client = redis.Redis.from_url(redis_url, socket_timeout=0.05, socket_connect_timeout=0.05)
+        self.key = key
+
+    def push(self, kind: str, row: Row) -> Optional[int]:
+        """行を積んでリストの長さを返す（Redisに届かない場合は None）"""
+        try:
+            return self.client.rpush(self.key, json.dumps({"kind": kind, "row": row}, ensure_ascii=False, default=str))
+        except Exception as e:
+            logger.debug(f"Write buffer push failed: {e}")
+            return None
+
+    def drain(self, count: int) -> List[Tuple[str, Row]]:
+        """先頭から最大 count 件を取り出す"""
+        try:
+            pipe = self.client.pipeline(transaction=True)
+            pipe.lrange(self.key, 0, count - 1)
+            pipe.ltrim(self.key, count, -1)
+            values, _ = pipe.execute()
+        except Exception as e:
+            logger.debug(f"Write buffer drain failed: {e}")
+            return []
+        items = []
+        for value in values:
+            item = json.loads(value)
+            items.append((item["kind"], item["row"]))
+        return items
+
+
+class WriteBehindBuffer:
+    """行をためて writer(kind, rows) でまとめて書き込む
+
+    - add() はプロセス内のリスト（または Redis）に積むだけで、書き込みはバックグラウンドのスレッドが行う
+    - batch_size 件たまるか flush_interval 秒たつと書き込む。close() で残りを書き込んで止める
+    - 書き込みに失敗した行はプロセス内に戻し、次の書き込みで再試行する（max_buffered まで）
+    """
+
+    def __init__(self, writer: RowWriter, config: Optional[WriteBufferConfig] = None,
+                 release: Optional[Callable[[], None]] = None):
+        self.writer = writer
+        self.config = config or WriteBufferConfig()
+        # 書き込みスレッドで書き込みのたびに呼ぶ（DB接続の後始末など）
+        self.release = release
+        self.store = RedisRowStore(self.config.redis_url, self.config.key) if self.config.redis_url else None
+
+        self._rows: Deque[Tuple[str, Row]] = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._closed = False
+
+    def pending(self) -> int:
+        """プロセス内で書き込みを待っている行数"""
+        with self._lock:
+            return len(self._rows)
+
+    def add(self, kind: str, row: Row):
+        """行を積む（しきい値に達したら書き込みスレッドを起こす）"""
+        if not self.config.enabled or self._closed:
+            self._write(kind, [row])
+            return
+
+        size = self.store.push(kind, row) if self.store else None
+        if size is None:
+            with self._lock:
+                self._rows.append((kind, row))
+                self._trim_locked()
+                size = len(self._rows)
+        self._ensure_thread()
+        if size >= self.config.batch_size:
+            self._wake.set()
+
+    def flush(self) -> int:
+        """ためている行をすべて書き込み、書き込んだ件数を返す"""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = [self._rows.popleft() for _ in range(min(len(self._rows), self.config.batch_size))]
+                if self.store and len(batch) < self.config.batch_size:
+                    batch += self.store.drain(self.config.batch_size - len(batch))
+                if not batch:
+                    break
+
+                grouped: Dict[str, List[Row]] = defaultdict(list)
+                for kind, row in batch:
+                    grouped[kind].append(row)
+                failed = []
+                for kind, rows in grouped.items():
+                    if self._write(kind, rows):
+                        written += len(rows)
+                    else:
+                        failed += [(kind, row) for row in rows]
+                if failed:
+                    self._requeue(failed)
+                    break
+        return written
+
+    def close(self):
+        """書き込みスレッドを止め、残りの行を書き込む（プロセス終了時に呼ぶ）"""
+        self._closed = True
+        self._wake.set()
+        self.flush()
+
+    def _write(self, kind: str, rows: List[Row]) -> bool:
+        try:
+            self.writer(kind, rows)
+        except Exception as e:
+            logger.error(f"Write buffer flush failed ({kind}, {len(rows)} rows): {e}")
+            metrics.increment("sister_ai_write_buffer_rows_total", len(rows), kind=kind, result="failed")
+            return False
+        metrics.increment("sister_ai_write_buffer_rows_total", len(rows), kind=kind, result="written")
+        metrics.increment("sister_ai_write_buffer_flushes_total", kind=kind)
+        return True
+
+    def _requeue(self, items: List[Tuple[str, Row]]):
+        with self._lock:
+            self._rows.extendleft(reversed(items))
+            self._trim_locked()
+
+    def _trim_locked(self):
+        overflow = len(self._rows) - self.config.max_buffered
+        for _ in range(max(0, overflow)):
+            kind, _ = self._rows.popleft()
+            metrics.increment("sister_ai_write_buffer_rows_total", kind=kind, result="dropped")
+        if overflow > 0:
+            logger.warning(f"Write buffer full, dropped {overflow} rows")
+
+    def _ensure_thread(self):
+        # fork したプロセスにはスレッドが引き継がれないので、プロセスごとに起動する
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="sister-ai-write-buffer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.config.flush_interval)
+            self._wake.clear()
+            if self._closed:
+                break
+            try:
+                self.flush()
+            finally:
+                if self.release:
+                    self.release()
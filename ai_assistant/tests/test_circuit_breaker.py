@@ -0,0 +1,168 @@
+"""
+Circuit Breaker Tests
+"""
+
+import unittest
+from unittest import mock
+
+from ai_assistant.services import circuit_breaker
+from ai_assistant.services.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitBreakerConfig,
+)
+
+
+class FakeClock:
+    """モジュールの time の代わりに差し替えて時間を進める"""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+class FakeStore:
+    """ワーカー間で共有するオープン状態の代わり"""
+
+    def __init__(self):
+        self.open_until = {}
+
+    def mark_open(self, name, seconds):
+        self.open_until[name] = seconds
+
+    def clear(self, name):
+        self.open_until.pop(name, None)
+
+    def open_remaining(self, name):
+        return self.open_until.get(name, 0.0)
+
+
+class CircuitBreakerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(circuit_breaker, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.config = CircuitBreakerConfig(window=60, min_calls=4, error_rate_threshold=0.5,
+                                           slow_call_threshold=10, open_duration=30)
+
+    def open_breaker(self, breaker):
+        for _ in range(4):
+            breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+
+    def test_stays_closed_below_min_calls(self):
+        breaker = CircuitBreaker("claude", self.config)
+        for _ in range(3):
+            breaker.record_failure()
+
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertTrue(breaker.allow())
+
+    def test_opens_at_error_rate_threshold(self):
+        breaker = CircuitBreaker("claude", self.config)
+        breaker.record_success(1.0)
+        breaker.record_success(1.0)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CLOSED)
+
+        breaker.record_failure()
+
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_slow_success_counts_as_failure(self):
+        breaker = CircuitBreaker("claude", self.config)
+        for _ in range(4):
+            breaker.record_success(11.0)
+
+        self.assertEqual(breaker.state, OPEN)
+
+    def test_failures_outside_window_are_forgotten(self):
+        breaker = CircuitBreaker("claude", self.config)
+        for _ in range(3):
+            breaker.record_failure()
+        self.clock.advance(61)
+
+        breaker.record_failure()
+
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_half_open_allows_one_probe_after_open_duration(self):
+        breaker = CircuitBreaker("claude", self.config)
+        self.open_breaker(breaker)
+
+        self.clock.advance(29)
+        self.assertFalse(breaker.allow())
+        self.clock.advance(1)
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, HALF_OPEN)
+        # 試行の結果が返るまで他の呼び出しは通さない
+        self.assertFalse(breaker.allow())
+
+    def test_successful_probe_closes(self):
+        breaker = CircuitBreaker("claude", self.config)
+        self.open_breaker(breaker)
+        self.clock.advance(30)
+        breaker.allow()
+
+        breaker.record_success(1.0)
+
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertTrue(breaker.allow())
+        # 閉じたら過去の失敗は数えない
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker("claude", self.config)
+        self.open_breaker(breaker)
+        self.clock.advance(30)
+        breaker.allow()
+
+        breaker.record_failure()
+
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow())
+        self.clock.advance(30)
+        self.assertTrue(breaker.allow())
+
+    def test_disabled_always_allows(self):
+        breaker = CircuitBreaker("claude", CircuitBreakerConfig(enabled=False, min_calls=1))
+        breaker.record_failure()
+
+        self.assertTrue(breaker.allow())
+
+    def test_open_state_is_shared_through_store(self):
+        store = FakeStore()
+        worker_a = CircuitBreaker("claude", self.config, store)
+        worker_b = CircuitBreaker("claude", self.config, store)
+        self.open_breaker(worker_a)
+
+        self.assertFalse(worker_b.allow())
+        self.assertEqual(worker_b.state, OPEN)
+
+    def test_health_score(self):
+        breaker = CircuitBreaker("claude", self.config)
+        breaker.record_success(1.0)
+        breaker.record_failure()
+
+        health = breaker.health()
+
+        self.assertEqual(health["calls"], 2)
+        self.assertEqual(health["error_rate"], 0.5)
+        self.assertEqual(health["score"], 0.5)
+        self.open_breaker(breaker)
+        self.assertEqual(breaker.health()["score"], 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
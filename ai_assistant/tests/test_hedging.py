@@ -0,0 +1,174 @@
+"""
+Hedging Tests
+"""
+
+import asyncio
+import unittest
+
+from ai_assistant.services.hedging import HedgeOutcome, Hedger, HedgingConfig, LatencyTracker
+
+DELAY = 0.05
+
+
+def provider(result, after=0.0, error=None):
+    """after 秒後に result を返す（error を指定すると送出する）呼び出し"""
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(after)
+        if error is not None:
+            raise error
+        return result
+
+    call.calls = calls
+    return call
+
+
+def streaming(deltas, first_after=0.0, error=None):
+    """最初の差分を first_after 秒後に返すストリーム"""
+    state = {"calls": 0, "closed": False}
+
+    def start():
+        state["calls"] += 1
+        return generate()
+
+    async def generate():
+        try:
+            await asyncio.sleep(first_after)
+            if error is not None:
+                raise error
+            for delta in deltas:
+                yield delta
+        finally:
+            state["closed"] = True
+
+    start.state = state
+    return start
+
+
+class HedgerCallTests(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.hedger = Hedger(HedgingConfig(enabled=True, initial_delay=DELAY))
+
+    async def test_fast_primary_does_not_hedge(self):
+        primary, secondary = provider("claude"), provider("openai")
+        outcome = HedgeOutcome()
+
+        result = await self.hedger.call(("claude", primary), ("openai", secondary), outcome)
+
+        self.assertEqual(result, ("claude", "claude"))
+        self.assertEqual((outcome.winner, outcome.hedged), ("claude", False))
+        self.assertEqual(secondary.calls, [])
+
+    async def test_hedge_fires_after_delay_and_secondary_wins(self):
+        primary, secondary = provider("claude", after=1.0), provider("openai")
+        outcome = HedgeOutcome()
+
+        started = asyncio.get_running_loop().time()
+        result = await self.hedger.call(("claude", primary), ("openai", secondary), outcome)
+        elapsed = asyncio.get_running_loop().time() - started
+
+        self.assertEqual(result, ("openai", "openai"))
+        self.assertEqual((outcome.winner, outcome.hedged), ("openai", True))
+        self.assertGreaterEqual(elapsed, DELAY)
+        self.assertLess(elapsed, 1.0)
+
+    async def test_slow_primary_can_still_win_after_hedging(self):
+        primary, secondary = provider("claude", after=DELAY * 2), provider("openai", after=1.0)
+        outcome = HedgeOutcome()
+
+        result = await self.hedger.call(("claude", primary), ("openai", secondary), outcome)
+
+        self.assertEqual(result, ("claude", "claude"))
+        self.assertEqual((outcome.winner, outcome.hedged), ("claude", True))
+        self.assertEqual(len(secondary.calls), 1)
+
+    async def test_primary_failure_falls_back_without_hedging(self):
+        primary = provider(None, error=RuntimeError("overloaded"))
+        secondary = provider("openai")
+        outcome = HedgeOutcome()
+
+        result = await self.hedger.call(("claude", primary), ("openai", secondary), outcome)
+
+        self.assertEqual(result, ("openai", "openai"))
+        self.assertEqual((outcome.winner, outcome.hedged), ("openai", False))
+
+    async def test_both_fail(self):
+        primary = provider(None, after=DELAY * 2, error=RuntimeError("overloaded"))
+        secondary = provider("")
+
+        self.assertIsNone(await self.hedger.call(("claude", primary), ("openai", secondary)))
+
+    def test_delay_uses_percentile_once_enough_samples(self):
+        hedger = Hedger(HedgingConfig(initial_delay=3.0, min_delay=0.5, max_delay=15.0,
+                                      min_samples=10, percentile=0.9))
+        for seconds in range(1, 10):
+            hedger.record("claude", float(seconds))
+        self.assertEqual(hedger.delay_for("claude"), 3.0)
+
+        hedger.record("claude", 10.0)
+        self.assertEqual(hedger.delay_for("claude"), 9.0)
+        self.assertEqual(hedger.delay_for("claude", "ttft"), 3.0)
+
+        for _ in range(10):
+            hedger.record("openai", 0.1)
+            hedger.record("gemini", 60.0)
+        self.assertEqual(hedger.delay_for("openai"), 0.5)
+        self.assertEqual(hedger.delay_for("gemini"), 15.0)
+
+    def test_latency_tracker_window(self):
+        tracker = LatencyTracker(window=3)
+        self.assertIsNone(tracker.percentile(0.5))
+        for seconds in (10.0, 1.0, 2.0, 3.0):
+            tracker.record(seconds)
+
+        self.assertEqual(len(tracker), 3)
+        self.assertEqual(tracker.percentile(1.0), 3.0)
+        self.assertEqual(tracker.percentile(0.0), 1.0)
+
+
+class HedgerStreamTests(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.hedger = Hedger(HedgingConfig(enabled=True, initial_delay=DELAY))
+
+    async def collect(self, primary, secondary, outcome):
+        return [delta async for delta in self.hedger.stream(("claude", primary), ("openai", secondary), outcome)]
+
+    async def test_fast_primary_streams_without_hedging(self):
+        primary, secondary = streaming(["お兄", "ちゃん"]), streaming(["x"])
+        outcome = HedgeOutcome()
+
+        self.assertEqual(await self.collect(primary, secondary, outcome), ["お兄", "ちゃん"])
+        self.assertEqual((outcome.winner, outcome.hedged), ("claude", False))
+        self.assertEqual(secondary.state["calls"], 0)
+
+    async def test_slow_first_token_hedges_and_closes_loser(self):
+        primary, secondary = streaming(["slow"], first_after=1.0), streaming(["速", "い"])
+        outcome = HedgeOutcome()
+
+        self.assertEqual(await self.collect(primary, secondary, outcome), ["速", "い"])
+        self.assertEqual((outcome.winner, outcome.hedged), ("openai", True))
+        self.assertTrue(primary.state["closed"])
+
+    async def test_primary_error_before_first_token_falls_back(self):
+        primary = streaming([], error=RuntimeError("overloaded"))
+        secondary = streaming(["ok"])
+        outcome = HedgeOutcome()
+
+        self.assertEqual(await self.collect(primary, secondary, outcome), ["ok"])
+        self.assertEqual((outcome.winner, outcome.hedged), ("openai", False))
+
+    async def test_both_streams_fail(self):
+        primary = streaming([], error=RuntimeError("overloaded"))
+        secondary = streaming([], error=RuntimeError("rate limited"))
+        outcome = HedgeOutcome()
+
+        self.assertEqual(await self.collect(primary, secondary, outcome), [])
+        self.assertIsNone(outcome.winner)
+
+
+if __name__ == "__main__":
+    unittest.main()
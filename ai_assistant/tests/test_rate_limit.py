@@ -0,0 +1,189 @@
+"""
+Rate Limit Tests
+"""
+
+import unittest
+from unittest import mock
+
+from ai_assistant.services import rate_limit
+from ai_assistant.services.rate_limit import (
+    Bucket,
+    LocalBucketStore,
+    RateLimitConfig,
+    RateLimiter,
+    RateLimitExceeded,
+)
+
+
+class FakeClock:
+    """モジュールの time の代わりに差し替えて時間を進める"""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+class BrokenStore:
+    """接続できないRedisの代わり"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def take(self, buckets):
+        self.calls += 1
+        raise ConnectionError("redis is down")
+
+
+def limiter(**overrides) -> RateLimiter:
+    config = dict(user_requests_per_minute=3, user_tokens_per_minute=0,
+                  global_requests_per_minute=0, global_tokens_per_minute=0)
+    config.update(overrides)
+    return RateLimiter(RateLimitConfig(**config))
+
+
+class RateLimitTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(rate_limit, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_denies_when_bucket_is_empty(self):
+        limiter_ = limiter()
+        for _ in range(3):
+            limiter_.acquire("alice")
+
+        with self.assertRaises(RateLimitExceeded) as raised:
+            limiter_.acquire("alice")
+
+        self.assertEqual(raised.exception.scope, "user")
+        self.assertEqual(raised.exception.dimension, "requests")
+        self.assertAlmostEqual(raised.exception.retry_after, 20.0)
+        self.assertEqual(raised.exception.retry_after_seconds, 20)
+
+    def test_refills_over_time(self):
+        limiter_ = limiter()
+        for _ in range(3):
+            limiter_.acquire("alice")
+
+        self.clock.advance(19)
+        self.assertRaises(RateLimitExceeded, limiter_.acquire, "alice")
+        self.clock.advance(1)
+        limiter_.acquire("alice")
+        self.assertRaises(RateLimitExceeded, limiter_.acquire, "alice")
+
+    def test_users_have_separate_buckets(self):
+        limiter_ = limiter()
+        for _ in range(3):
+            limiter_.acquire("alice")
+
+        limiter_.acquire("bob")
+
+    def test_global_bucket_limits_all_users(self):
+        limiter_ = limiter(user_requests_per_minute=10, global_requests_per_minute=2)
+        limiter_.acquire("alice")
+        limiter_.acquire("bob")
+
+        with self.assertRaises(RateLimitExceeded) as raised:
+            limiter_.acquire("carol")
+
+        self.assertEqual(raised.exception.scope, "global")
+
+    def test_token_bucket_and_cost_capped_at_capacity(self):
+        limiter_ = limiter(user_requests_per_minute=0, user_tokens_per_minute=600)
+        limiter_.acquire("alice", tokens=500)
+
+        with self.assertRaises(RateLimitExceeded) as raised:
+            limiter_.acquire("alice", tokens=200)
+        self.assertEqual(raised.exception.dimension, "tokens")
+        self.assertAlmostEqual(raised.exception.retry_after, 10.0)
+
+        # 容量より大きい要求も、満タンになれば通る
+        self.clock.advance(60)
+        limiter_.acquire("alice", tokens=10000)
+
+    def test_denied_request_consumes_nothing(self):
+        limiter_ = limiter(user_requests_per_minute=10, user_tokens_per_minute=100)
+        limiter_.acquire("alice", tokens=100)
+        self.assertRaises(RateLimitExceeded, limiter_.acquire, "alice", 50)
+
+        # トークンで止められたリクエストはリクエスト数のバケットも消費しない
+        self.clock.advance(60)
+        for _ in range(10):
+            limiter_.acquire("alice", tokens=1)
+
+    def test_cached_level_denies_without_store(self):
+        limiter_ = limiter()
+        for _ in range(3):
+            limiter_.acquire("alice")
+        limiter_.local = mock.Mock(wraps=limiter_.local)
+
+        self.assertRaises(RateLimitExceeded, limiter_.acquire, "alice")
+
+        limiter_.local.take.assert_not_called()
+
+    def test_falls_back_to_local_buckets_when_store_fails(self):
+        limiter_ = limiter(fallback_duration=5)
+        limiter_.store = BrokenStore()
+
+        limiter_.acquire("alice")
+        limiter_.acquire("alice")
+        self.assertEqual(limiter_.store.calls, 1)
+
+        self.clock.advance(5)
+        limiter_.acquire("alice")
+        self.assertEqual(limiter_.store.calls, 2)
+
+    def test_disabled(self):
+        limiter_ = limiter(enabled=False)
+        for _ in range(10):
+            limiter_.acquire("alice")
+
+
+class LocalBucketStoreTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(rate_limit, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def bucket(self, key="k", cost=1.0):
+        return Bucket(key=key, scope="user", dimension="requests", rate=1.0, capacity=2.0, cost=cost)
+
+    def test_take_and_refill(self):
+        store = LocalBucketStore()
+
+        self.assertEqual(store.take([self.bucket()]), (None, [1.0]))
+        self.assertEqual(store.take([self.bucket()]), (None, [0.0]))
+        self.assertEqual(store.take([self.bucket()]), (0, [0.0]))
+        self.clock.advance(10)
+        self.assertEqual(store.take([self.bucket()]), (None, [1.0]))
+
+    def test_reports_bucket_with_longest_wait(self):
+        store = LocalBucketStore()
+        store.take([self.bucket("a", 2.0)])
+
+        blocked, levels = store.take([self.bucket("b", 1.0), self.bucket("a", 2.0)])
+
+        self.assertEqual(blocked, 1)
+        self.assertEqual(levels, [2.0, 0.0])
+        # 止められたときは他のバケットも消費しない
+        self.assertEqual(store.take([self.bucket("b", 2.0)]), (None, [0.0]))
+
+    def test_evicts_oldest_buckets(self):
+        store = LocalBucketStore(max_entries=2)
+        for key in ("a", "b", "c"):
+            store.take([self.bucket(key, 2.0)])
+
+        self.assertEqual(list(store._state), ["b", "c"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+"""
+Review Cache Tests
+"""
+
+import unittest
+
+from ai_assistant.services.review_cache import ReviewCache, ReviewCacheConfig, normalize_code
+
+
+class FakeBackend:
+    """Django キャッシュの aget/aset だけを持つ代わり"""
+
+    def __init__(self, fail=False):
+        self.data = {}
+        self.timeouts = {}
+        self.fail = fail
+
+    async def aget(self, key):
+        if self.fail:
+            raise ConnectionError("redis is down")
+        return self.data.get(key)
+
+    async def aset(self, key, value, timeout=None):
+        if self.fail:
+            raise ConnectionError("redis is down")
+        self.data[key] = value
+        self.timeouts[key] = timeout
+
+
+class NormalizeCodeTests(unittest.TestCase):
+
+    def test_python_ignores_comments_and_spacing(self):
+        original = "def add(a, b):\n    return a + b\n"
+        reformatted = "def add(a,b):  # 足し算\n\n\n        return a+b   \n"
+
+        self.assertEqual(normalize_code(original, "python"), normalize_code(reformatted, "python"))
+
+    def test_python_keeps_indentation_structure(self):
+        inside = "if ok:\n    run()\n    stop()\n"
+        outside = "if ok:\n    run()\nstop()\n"
+
+        self.assertNotEqual(normalize_code(inside, "python"), normalize_code(outside, "python"))
+
+    def test_python_keeps_string_contents(self):
+        self.assertNotEqual(normalize_code("x = 'a  b'\n", "python"), normalize_code("x = 'a b'\n", "python"))
+        self.assertIn("'# not a comment'", normalize_code("x = '# not a comment'\n", "python"))
+
+    def test_python_syntax_error_falls_back(self):
+        normalized = normalize_code("def broken(:\n    '''unterminated", "python")
+
+        self.assertTrue(normalized.startswith("def broken(:"))
+
+    def test_c_like_strips_comments_outside_strings(self):
+        code = 'const url = "http://example.com"; /* block */ let a = 1; // trailing\n'
+
+        self.assertEqual(normalize_code(code, "javascript"), 'const url = "http://example.com"; let a = 1;')
+
+    def test_c_like_adding_comments_does_not_change_result(self):
+        plain = "int a = 1;\nint b = a + 2;"
+        commented = "int a = 1; // first\nint b = a /* sum */ + 2;  /* done */"
+
+        self.assertEqual(normalize_code(commented, "cpp"), normalize_code(plain, "cpp"))
+
+    def test_c_like_collapses_whitespace_and_keeps_escapes(self):
+        self.assertEqual(normalize_code('a  =\t"x\\"  y" ;\n\n\nb', "go"), 'a = "x\\"  y" ;\nb')
+
+    def test_unknown_language_uses_slash_comments(self):
+        self.assertEqual(normalize_code("x = 1 // note", "kotlin"), "x = 1")
+
+
+class ReviewCacheTests(unittest.IsolatedAsyncioTestCase):
+
+    def test_key_ignores_formatting_but_not_conditions(self):
+        cache = ReviewCache(FakeBackend())
+        key = cache.make_key("x = 1  # one\n", "python", "v1", "claude")
+
+        self.assertEqual(key, cache.make_key("x=1\n", "python", "v1", "claude"))
+        self.assertTrue(key.startswith("sister_ai:review:"))
+        self.assertNotEqual(key, cache.make_key("x = 1\n", "python", "v2", "claude"))
+        self.assertNotEqual(key, cache.make_key("x = 1\n", "python", "v1", "gpt-4"))
+        self.assertNotEqual(key, cache.make_key("x = 1\n", "ruby", "v1", "claude"))
+        self.assertNotEqual(key, cache.make_key("x = 2\n", "python", "v1", "claude"))
+
+    def test_key_without_normalization(self):
+        cache = ReviewCache(FakeBackend(), ReviewCacheConfig(normalize=False))
+
+        self.assertNotEqual(cache.make_key("x = 1\n", "python", "v1", "claude"),
+                            cache.make_key("x=1\n", "python", "v1", "claude"))
+
+    async def test_round_trip(self):
+        cache = ReviewCache(FakeBackend())
+
+        self.assertIsNone(await cache.get("k"))
+        await cache.set("k", "いいコードだね")
+        self.assertEqual(await cache.get("k"), "いいコードだね")
+
+    async def test_large_results_get_shorter_ttl(self):
+        backend = FakeBackend()
+        cache = ReviewCache(backend, ReviewCacheConfig(ttl=1000, large_entry_bytes=100, max_entry_bytes=1000))
+
+        await cache.set("small", "x" * 100)
+        await cache.set("large", "x" * 400)
+        await cache.set("tiny-ttl", "x" * 1000)
+
+        self.assertEqual(backend.timeouts["small"], 1000)
+        self.assertEqual(backend.timeouts["large"], 250)
+        self.assertEqual(backend.timeouts["tiny-ttl"], 100)
+
+    async def test_ttl_has_a_floor(self):
+        backend = FakeBackend()
+        cache = ReviewCache(backend, ReviewCacheConfig(ttl=100, large_entry_bytes=10, max_entry_bytes=1000))
+
+        await cache.set("k", "x" * 1000)
+
+        self.assertEqual(backend.timeouts["k"], 60)
+
+    async def test_oversized_results_are_skipped(self):
+        backend = FakeBackend()
+        cache = ReviewCache(backend, ReviewCacheConfig(max_entry_bytes=10))
+
+        # バイト数で判定する（日本語1文字は3バイト）
+        await cache.set("k", "あ" * 4)
+
+        self.assertEqual(backend.data, {})
+
+    async def test_backend_errors_are_misses(self):
+        cache = ReviewCache(FakeBackend(fail=True))
+
+        await cache.set("k", "result")
+        self.assertIsNone(await cache.get("k"))
+
+    def test_disabled_without_backend(self):
+        self.assertFalse(ReviewCache(None).enabled)
+        self.assertFalse(ReviewCache(FakeBackend(), ReviewCacheConfig(enabled=False)).enabled)
+        self.assertTrue(ReviewCache(FakeBackend()).enabled)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+"""
+Review Chunks Tests
+"""
+
+import unittest
+
+from ai_assistant.services.review_chunks import CodeChunk, extract_findings, merge_reviews, split_code
+
+
+def python_functions(count: int, body_lines: int = 3) -> str:
+    functions = []
+    for index in range(count):
+        body = "\n".join(f"    value_{line} = compute_{line}(argument)" for line in range(body_lines))
+        functions.append(f"def handler_{index}(argument):\n{body}\n    return argument\n")
+    return "\n\n".join(functions)
+
+
+class SplitCodeTests(unittest.TestCase):
+
+    def assert_covers(self, chunks, code):
+        """チャンクが全行を重なりなく順に覆い、本文が元の行と一致する"""
+        lines = code.splitlines()
+        self.assertEqual(chunks[0].start_line, 1)
+        self.assertEqual(chunks[-1].end_line, len(lines))
+        for previous, chunk in zip(chunks, chunks[1:]):
+            self.assertEqual(chunk.start_line, previous.end_line + 1)
+        for chunk in chunks:
+            self.assertEqual(chunk.text, "\n".join(lines[chunk.start_line - 1:chunk.end_line]))
+
+    def test_empty_code(self):
+        self.assertEqual(split_code("", "python", 100), [])
+
+    def test_small_code_is_one_chunk(self):
+        code = python_functions(2)
+
+        chunks = split_code(code, "python", 1000)
+
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(chunks[0].name, "def handler_0, def handler_1")
+        self.assert_covers(chunks, code)
+
+    def test_python_splits_between_functions(self):
+        code = "import os\n\n\n" + python_functions(6)
+
+        chunks = split_code(code, "python", 80)
+
+        self.assertGreater(len(chunks), 1)
+        self.assert_covers(chunks, code)
+        for chunk in chunks:
+            # 関数の途中で切らない
+            self.assertTrue(chunk.text.lstrip().startswith(("import", "def")), chunk.text)
+
+    def test_large_python_class_splits_by_method(self):
+        methods = "\n\n".join(
+            f"    def method_{index}(self):\n" + "\n".join(f"        self.value_{line} = {line}" for line in range(6))
+            for index in range(6)
+        )
+        code = f'class Service:\n    """docstring"""\n\n{methods}\n'
+
+        chunks = split_code(code, "python", 80)
+
+        self.assertGreater(len(chunks), 1)
+        self.assert_covers(chunks, code)
+        self.assertTrue(chunks[0].text.startswith("class Service:"))
+        self.assertIn("Service.method_0", chunks[0].name)
+
+    def test_oversized_unit_is_split_by_lines(self):
+        code = python_functions(1, body_lines=60)
+
+        chunks = split_code(code, "python", 100)
+
+        self.assertGreater(len(chunks), 1)
+        self.assert_covers(chunks, code)
+        self.assertTrue(all(chunk.name == "def handler_0" for chunk in chunks))
+
+    def test_python_syntax_error_falls_back_to_indentation(self):
+        code = "def broken(:\n    pass\n\ndef other():\n    pass\n"
+
+        chunks = split_code(code, "python", 8)
+
+        self.assert_covers(chunks, code)
+        self.assertEqual([chunk.start_line for chunk in chunks], [1, 4])
+
+    def test_brace_language_ignores_braces_in_strings_and_comments(self):
+        code = "\n".join([
+            "function a() {",
+            '  const s = "}}}";  // }',
+            "  /* { */",
+            "  return s;",
+            "}",
+            "function b() {",
+            "  return 1;",
+            "}",
+        ])
+
+        chunks = split_code(code, "javascript", 20)
+
+        self.assert_covers(chunks, code)
+        self.assertEqual([(chunk.start_line, chunk.end_line) for chunk in chunks], [(1, 5), (6, 8)])
+        self.assertEqual([chunk.name for chunk in chunks], ["function a", "function b"])
+
+
+class MergeReviewsTests(unittest.TestCase):
+
+    def test_merge_and_extract_round_trip(self):
+        chunks = [CodeChunk(1, 10, "", "def a"), CodeChunk(11, 30, "")]
+        merged = merge_reviews(chunks, [
+            "- 12行目の例外は握りつぶさない方がいいよ\n- 変数名が短すぎるかも",
+            "1. 15〜18行目はループの外に出せるよ\n* line 40 is out of range",
+        ])
+
+        findings = extract_findings(merged, total_lines=30)
+
+        self.assertTrue(merged.startswith("2つの部分に分けてレビューしたよ"))
+        self.assertEqual([(f["start_line"], f["end_line"], f["section"]) for f in findings], [
+            (1, 10, "def a"),  # 範囲外の行番号はセクションの範囲のまま
+            (1, 10, "def a"),
+            (15, 18, ""),
+            (11, 30, ""),
+        ])
+        self.assertEqual(findings[1]["text"], "変数名が短すぎるかも")
+
+    def test_missing_review_is_noted(self):
+        merged = merge_reviews([CodeChunk(1, 5, "")], [None])
+
+        self.assertIn("### 1〜5行目\n（この部分はレビューできなかったの", merged)
+
+    def test_findings_without_sections_cover_whole_file(self):
+        findings = extract_findings("まとめ\n- lines 3-4 を関数にしよう\n- 全体的にいい感じ", total_lines=20)
+
+        self.assertEqual([(f["start_line"], f["end_line"]) for f in findings], [(3, 4), (1, 20)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+"""
+Review Diff Tests
+"""
+
+import unittest
+
+from ai_assistant.services.review_chunks import extract_findings
+from ai_assistant.services.review_diff import carry_forward, diff_code, remap_range, render_carried
+
+
+def numbered(count: int) -> list:
+    return [f"line_{number} = {number}" for number in range(1, count + 1)]
+
+
+def code(lines: list) -> str:
+    return "\n".join(lines) + "\n"
+
+
+class DiffCodeTests(unittest.TestCase):
+
+    def test_identical_code_has_no_hunks(self):
+        diff = diff_code(code(numbered(10)), code(numbered(10)))
+
+        self.assertEqual(diff.hunks, [])
+        self.assertEqual(diff.changed_ratio, 0.0)
+        self.assertEqual(diff.total_lines, 10)
+
+    def test_hunk_includes_context_lines(self):
+        new = numbered(20)
+        new[9] = "line_10 = 'changed'"
+
+        diff = diff_code(code(numbered(20)), code(new), context_lines=2)
+
+        self.assertEqual(len(diff.hunks), 1)
+        hunk = diff.hunks[0]
+        self.assertEqual((hunk.new_start, hunk.new_end), (8, 12))
+        self.assertEqual((hunk.old_start, hunk.old_end), (8, 12))
+        self.assertIn("   10 + line_10 = 'changed'", hunk.text)
+        self.assertIn("      - line_10 = 10", hunk.text)
+        self.assertEqual(diff.span, (8, 12))
+        self.assertAlmostEqual(diff.changed_ratio, 2 / 40)
+
+    def test_distant_changes_make_separate_hunks(self):
+        new = numbered(30)
+        new[2] = "first = 'changed'"
+        new[27] = "second = 'changed'"
+
+        diff = diff_code(code(numbered(30)), code(new), context_lines=1)
+
+        self.assertEqual([(h.new_start, h.new_end) for h in diff.hunks], [(2, 4), (27, 29)])
+        self.assertEqual(diff.span, (2, 29))
+
+    def test_empty_old_code(self):
+        diff = diff_code("", code(numbered(3)))
+
+        self.assertEqual(diff.changed_ratio, 1.0)
+        self.assertEqual(diff.span, (1, 3))
+
+
+class RemapTests(unittest.TestCase):
+
+    def setUp(self):
+        # 3行目の後に2行追加し、8行目を書き換える
+        old = numbered(12)
+        new = old[:3] + ["added_1 = 1", "added_2 = 2"] + old[3:]
+        new[9] = "line_8 = 'changed'"
+        self.diff = diff_code(code(old), code(new))
+
+    def test_range_before_change_keeps_lines(self):
+        self.assertEqual(remap_range(1, 3, self.diff), (1, 3))
+
+    def test_range_after_insert_is_shifted(self):
+        self.assertEqual(remap_range(4, 7, self.diff), (6, 9))
+        self.assertEqual(remap_range(10, 12, self.diff), (12, 14))
+
+    def test_changed_range_is_dropped(self):
+        self.assertIsNone(remap_range(8, 8, self.diff))
+        self.assertIsNone(remap_range(7, 9, self.diff))
+
+    def test_range_spanning_an_insert_is_dropped(self):
+        self.assertIsNone(remap_range(3, 4, self.diff))
+
+    def test_carry_forward_and_render(self):
+        findings = [
+            {"start_line": 2, "end_line": 2, "section": "", "text": "定数にしよう"},
+            {"start_line": 8, "end_line": 8, "section": "", "text": "ここは変わった"},
+            {"start_line": 11, "end_line": 12, "section": "def tail", "text": "ループをまとめよう"},
+            {"start_line": 11, "end_line": 12, "section": "def tail", "text": "名前を変えよう"},
+            {"start_line": "x", "end_line": 1, "text": "壊れた指摘"},
+            {"text": "行番号なし"},
+        ]
+
+        carried = carry_forward(findings, self.diff)
+        rendered = render_carried(carried)
+
+        self.assertEqual([(f["start_line"], f["end_line"], f["text"]) for f in carried], [
+            (2, 2, "定数にしよう"),
+            (13, 14, "ループをまとめよう"),
+            (13, 14, "名前を変えよう"),
+        ])
+        self.assertEqual(rendered, "\n".join([
+            "### 2〜2行目",
+            "- 定数にしよう",
+            "",
+            "### 13〜14行目 (def tail)",
+            "- ループをまとめよう",
+            "- 名前を変えよう",
+        ]))
+        # 見出しから元の行範囲を復元できる
+        self.assertEqual([(f["start_line"], f["end_line"]) for f in extract_findings(rendered, 14)],
+                         [(2, 2), (13, 14), (13, 14)])
+
+
+if __name__ == "__main__":
+    unittest.main()
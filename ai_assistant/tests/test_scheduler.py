@@ -0,0 +1,185 @@
+"""
+Admission Scheduler Tests
+"""
+
+import asyncio
+import unittest
+
+from ai_assistant.services.scheduler import (
+    BACKGROUND,
+    INTERACTIVE,
+    REVIEW,
+    AdmissionScheduler,
+    QueueTimeout,
+    SchedulerConfig,
+    current_request,
+    request_scope,
+)
+
+
+class AdmissionSchedulerTests(unittest.IsolatedAsyncioTestCase):
+
+    def scheduler(self, limit=1, reserved=0, max_wait=5.0) -> AdmissionScheduler:
+        return AdmissionScheduler(SchedulerConfig(max_concurrency=limit, reserved_interactive=reserved,
+                                                  max_wait=max_wait))
+
+    async def queue_up(self, scheduler, admitted, name, priority, user=""):
+        """待ち行列に並ばせ、枠を受け取ったら名前を記録するタスク"""
+        async def wait():
+            await scheduler.acquire("claude", priority, user)
+            admitted.append(name)
+
+        task = asyncio.ensure_future(wait())
+        await asyncio.sleep(0)
+        return task
+
+    async def release_all(self, scheduler, tasks):
+        for _ in tasks:
+            scheduler.release("claude")
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+
+    def queued(self, scheduler):
+        return scheduler.stats()["claude"]["queued"]
+
+    async def test_admits_up_to_limit(self):
+        scheduler = self.scheduler(limit=2)
+        admitted = []
+        await scheduler.acquire("claude", INTERACTIVE, "a")
+        await scheduler.acquire("claude", INTERACTIVE, "a")
+        task = await self.queue_up(scheduler, admitted, "third", INTERACTIVE)
+
+        self.assertEqual(admitted, [])
+        self.assertEqual(scheduler.stats()["claude"]["in_flight"], 2)
+        self.assertEqual(self.queued(scheduler)["interactive"], 1)
+
+        scheduler.release("claude")
+        await task
+        self.assertEqual(admitted, ["third"])
+        self.assertEqual(scheduler.stats()["claude"]["in_flight"], 2)
+
+    async def test_providers_have_separate_limits(self):
+        scheduler = AdmissionScheduler(SchedulerConfig(max_concurrency=1, reserved_interactive=0,
+                                                       provider_limits={"openai": 2}))
+        await scheduler.acquire("claude", INTERACTIVE, "a")
+        await scheduler.acquire("openai", INTERACTIVE, "a")
+        await scheduler.acquire("openai", INTERACTIVE, "a")
+
+        self.assertEqual(scheduler.stats()["openai"], {
+            "in_flight": 2, "limit": 2, "queued": {"interactive": 0, "review": 0, "background": 0},
+        })
+
+    async def test_higher_priority_goes_first(self):
+        scheduler = self.scheduler()
+        admitted = []
+        await scheduler.acquire("claude", INTERACTIVE, "a")
+        tasks = [
+            await self.queue_up(scheduler, admitted, "background", BACKGROUND),
+            await self.queue_up(scheduler, admitted, "review", REVIEW),
+            await self.queue_up(scheduler, admitted, "interactive", INTERACTIVE),
+        ]
+
+        await self.release_all(scheduler, tasks)
+
+        self.assertEqual(admitted, ["interactive", "review", "background"])
+
+    async def test_round_robin_between_users(self):
+        scheduler = self.scheduler()
+        admitted = []
+        await scheduler.acquire("claude", REVIEW, "alice")
+        tasks = [await self.queue_up(scheduler, admitted, f"alice-{i}", REVIEW, "alice") for i in range(3)]
+        tasks.append(await self.queue_up(scheduler, admitted, "bob-0", REVIEW, "bob"))
+
+        await self.release_all(scheduler, tasks)
+
+        self.assertEqual(admitted, ["alice-0", "bob-0", "alice-1", "alice-2"])
+
+    async def test_new_request_does_not_jump_the_queue(self):
+        scheduler = self.scheduler(limit=1)
+        admitted = []
+        await scheduler.acquire("claude", REVIEW, "a")
+        first = await self.queue_up(scheduler, admitted, "first", REVIEW)
+        scheduler.release("claude")
+        second = await self.queue_up(scheduler, admitted, "second", REVIEW)
+
+        await first
+        self.assertEqual(admitted, ["first"])
+        await self.release_all(scheduler, [second])
+        self.assertEqual(admitted, ["first", "second"])
+
+    async def test_reserved_slot_is_only_for_interactive(self):
+        scheduler = self.scheduler(limit=2, reserved=1)
+        admitted = []
+        await scheduler.acquire("claude", REVIEW, "a")
+        review = await self.queue_up(scheduler, admitted, "review", REVIEW)
+        self.assertEqual(admitted, [])
+
+        await scheduler.acquire("claude", INTERACTIVE, "b")
+        self.assertEqual(scheduler.stats()["claude"]["in_flight"], 2)
+
+        # 空いた枠がチャット用の1つだけならレビューは入れない
+        scheduler.release("claude")
+        await asyncio.sleep(0)
+        self.assertEqual(admitted, [])
+        scheduler.release("claude")
+        await review
+        self.assertEqual(admitted, ["review"])
+
+    async def test_reserved_never_takes_every_slot(self):
+        scheduler = self.scheduler(limit=1, reserved=4)
+
+        await asyncio.wait_for(scheduler.acquire("claude", BACKGROUND, "a"), timeout=1)
+
+    async def test_timeout_leaves_the_queue(self):
+        scheduler = self.scheduler(max_wait=0.05)
+        await scheduler.acquire("claude", INTERACTIVE, "a")
+
+        with self.assertRaises(QueueTimeout):
+            await scheduler.acquire("claude", REVIEW, "b")
+
+        self.assertEqual(self.queued(scheduler)["review"], 0)
+        scheduler.release("claude")
+        self.assertEqual(scheduler.stats()["claude"]["in_flight"], 0)
+
+    async def test_cancelled_waiter_leaves_the_queue(self):
+        scheduler = self.scheduler()
+        admitted = []
+        await scheduler.acquire("claude", INTERACTIVE, "a")
+        cancelled = await self.queue_up(scheduler, admitted, "cancelled", INTERACTIVE)
+        waiting = await self.queue_up(scheduler, admitted, "waiting", INTERACTIVE)
+
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        await self.release_all(scheduler, [waiting])
+
+        self.assertEqual(admitted, ["waiting"])
+
+    async def test_slot_uses_request_scope(self):
+        scheduler = self.scheduler(limit=2, reserved=1, max_wait=0.01)
+        with request_scope(priority=REVIEW, user=7):
+            with request_scope(priority=INTERACTIVE, user=8):
+                # 外側で設定した値が優先される
+                self.assertEqual(current_request().priority, REVIEW)
+                self.assertEqual(current_request().user, "7")
+            async with scheduler.slot("claude"):
+                # スコープのレビュー優先度ではチャット用の枠に入れない
+                with self.assertRaises(QueueTimeout):
+                    async with scheduler.slot("claude"):
+                        pass
+                async with scheduler.slot("claude", priority=INTERACTIVE):
+                    self.assertEqual(scheduler.stats()["claude"]["in_flight"], 2)
+
+        self.assertEqual(scheduler.stats()["claude"]["in_flight"], 0)
+
+    async def test_disabled_does_not_limit(self):
+        scheduler = AdmissionScheduler(SchedulerConfig(enabled=False, max_concurrency=1))
+
+        async with scheduler.slot("claude"):
+            async with scheduler.slot("claude"):
+                pass
+
+        self.assertEqual(scheduler.stats(), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+"""
+Semantic Cache Tests
+"""
+
+import unittest
+
+from ai_assistant.services.fake_provider import FakeProviderConfig, FakeProviderTransport
+from ai_assistant.services.providers import ProviderClientConfig
+from ai_assistant.services.semantic_cache import SemanticCache, SemanticCacheConfig
+from ai_assistant.services.sister_ai import SisterAI
+
+QUESTION = "Django REST framework でページネーションを設定する方法を教えて"
+
+
+class SemanticCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = SemanticCache(SemanticCacheConfig(enabled=True))
+        self.namespace = self.cache.namespace("default", "system")
+
+    def test_near_duplicate_hits(self):
+        self.cache.store(self.namespace, QUESTION, "answer")
+
+        self.assertEqual(self.cache.lookup(self.namespace, QUESTION + "？"), "answer")
+
+    def test_different_question_misses(self):
+        self.cache.store(self.namespace, QUESTION, "answer")
+
+        self.assertIsNone(self.cache.lookup(self.namespace, "Celery のワーカーを複数のキューに分ける方法は？"))
+
+    def test_namespaces_are_separate(self):
+        self.cache.store(self.namespace, QUESTION, "answer")
+
+        self.assertIsNone(self.cache.lookup(self.cache.namespace("default", "other"), QUESTION))
+
+    def test_expired_entries_miss(self):
+        cache = SemanticCache(SemanticCacheConfig(enabled=True, ttl=-1))
+        cache.store(self.namespace, QUESTION, "answer")
+
+        self.assertIsNone(cache.lookup(self.namespace, QUESTION))
+
+    def test_accepts_by_context_type_and_length(self):
+        self.assertTrue(self.cache.accepts("default", QUESTION))
+        self.assertFalse(self.cache.accepts("code_review", QUESTION))
+        self.assertFalse(self.cache.accepts("default", "ありがとう"))
+
+    def test_follow_up_detection(self):
+        self.assertTrue(self.cache.is_follow_up("それをもう少し詳しく教えて"))
+        self.assertTrue(self.cache.is_follow_up("Can you explain that again please?"))
+        self.assertFalse(self.cache.is_follow_up(QUESTION))
+        # 単語の一部は続きの質問とみなさない
+        self.assertFalse(self.cache.is_follow_up("How do I configure itertools in Python?"))
+
+
+class SisterAISemanticCacheTests(unittest.IsolatedAsyncioTestCase):
+    """respond() を通して、会話の途中でも単独の質問はキャッシュから返すこと"""
+
+    async def asyncSetUp(self):
+        self.transport = FakeProviderTransport(FakeProviderConfig(latency="fixed", latency_median=0,
+                                                                  tokens_per_second=0, seed=1))
+        self.sister_ai = SisterAI(
+            anthropic_api_key="fake",
+            client_config=ProviderClientConfig(transport=self.transport, prewarm_connections=0),
+            semantic_cache=SemanticCache(SemanticCacheConfig(enabled=True)),
+        )
+
+    async def asyncTearDown(self):
+        await self.sister_ai.clients.aclose()
+
+    async def test_standalone_question_mid_conversation_hits_cache(self):
+        first = await self.sister_ai.respond(QUESTION, session_id="s1")
+        await self.sister_ai.respond("今日は何の作業から始めようかな", session_id="s2")
+
+        second = await self.sister_ai.respond(QUESTION + "？", session_id="s2")
+
+        self.assertFalse(first.cached)
+        self.assertTrue(second.cached)
+        self.assertEqual(second.text, first.text)
+        self.assertEqual(self.transport.provider.requests, 2)
+
+    async def test_follow_up_question_calls_provider(self):
+        await self.sister_ai.respond("それをもう少し詳しく教えてほしいな、お願い", session_id="s1")
+        await self.sister_ai.respond(QUESTION, session_id="s2")
+
+        follow_up = await self.sister_ai.respond("それをもう少し詳しく教えてほしいな、お願い", session_id="s2")
+
+        self.assertFalse(follow_up.cached)
+        self.assertEqual(self.transport.provider.requests, 3)
+
+    async def test_use_cache_false_skips_cache(self):
+        await self.sister_ai.respond(QUESTION, session_id="s1")
+
+        result = await self.sister_ai.respond(QUESTION, session_id="s2", use_cache=False)
+
+        self.assertFalse(result.cached)
+
+
+if __name__ == "__main__":
+    unittest.main()
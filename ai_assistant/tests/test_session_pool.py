@@ -0,0 +1,111 @@
+"""
+Session State Pool Tests
+"""
+
+import unittest
+from datetime import datetime
+
+from ai_assistant.services.session_pool import SessionStatePool
+from ai_assistant.services.sister_ai import ChatMessage
+
+
+def message(content: str, role: str = "user") -> ChatMessage:
+    return ChatMessage(role=role, content=content, timestamp=datetime.now())
+
+
+class FakeStore:
+    """ワーカー間で共有する ChatMessage テーブルの代わり"""
+
+    def __init__(self):
+        self.messages = []
+        self.loads = 0
+
+    def load(self, session_id, limit):
+        self.loads += 1
+        return self.messages[-limit:]
+
+    def count(self, session_id):
+        return len(self.messages)
+
+    def save(self, pool, session_id, *messages):
+        self.messages.extend(messages)
+        pool.record_saved(session_id, len(messages))
+
+
+class SessionStatePoolTests(unittest.IsolatedAsyncioTestCase):
+
+    def make_pool(self, store, **kwargs):
+        return SessionStatePool(loader=store.load, version_loader=store.count, **kwargs)
+
+    async def test_miss_restores_history(self):
+        store = FakeStore()
+        store.messages = [message("a"), message("b", "assistant")]
+        pool = self.make_pool(store)
+
+        state = await pool.get("s1")
+
+        self.assertEqual([m.content for m in state.history()], ["a", "b"])
+        self.assertEqual(pool.stats()["misses"], 1)
+
+    async def test_own_saves_keep_the_cached_state(self):
+        store = FakeStore()
+        pool = self.make_pool(store)
+
+        state = await pool.get("s1")
+        turn = [message("q"), message("r", "assistant")]
+        for m in turn:
+            pool.append(state, m)
+        store.save(pool, "s1", *turn)
+
+        self.assertIs(await pool.get("s1"), state)
+        self.assertEqual(store.loads, 1)
+        self.assertEqual(pool.stats()["hits"], 1)
+
+    async def test_turns_saved_by_another_worker_are_reloaded(self):
+        store = FakeStore()
+        worker_a, worker_b = self.make_pool(store), self.make_pool(store)
+
+        for pool, text in ((worker_a, "one"), (worker_b, "two")):
+            state = await pool.get("s1")
+            turn = [message(text), message(f"re:{text}", "assistant")]
+            for m in turn:
+                pool.append(state, m)
+            store.save(pool, "s1", *turn)
+
+        state = await worker_a.get("s1")
+
+        self.assertEqual([m.content for m in state.history()], ["one", "re:one", "two", "re:two"])
+        self.assertEqual(worker_a.stats()["reloads"], 1)
+
+    async def test_version_failure_falls_back_to_cached_state(self):
+        store = FakeStore()
+        pool = self.make_pool(store)
+        state = await pool.get("s1")
+
+        def broken(session_id):
+            raise RuntimeError("db down")
+        pool.version_loader = broken
+
+        self.assertIs(await pool.get("s1"), state)
+
+    async def test_evicts_least_recently_used_over_session_limit(self):
+        pool = SessionStatePool(max_sessions=2)
+        for session_id in ("s1", "s2"):
+            await pool.get(session_id)
+        await pool.get("s1")
+        await pool.get("s3")
+
+        self.assertIsNone(pool.peek("s2"))
+        self.assertIsNotNone(pool.peek("s1"))
+        self.assertEqual(pool.stats()["evictions"], 1)
+
+    async def test_expired_state_is_dropped(self):
+        pool = SessionStatePool(ttl=60)
+        state = await pool.get("s1")
+        state.last_access -= 61
+
+        self.assertIsNone(pool.peek("s1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+"""
+Single Flight Tests
+"""
+
+import asyncio
+import threading
+import unittest
+
+from ai_assistant.services.singleflight import SingleFlight, SingleFlightConfig
+
+
+class Call:
+    """呼ばれた回数を数え、release されるまで返らない呼び出し"""
+
+    def __init__(self, result="answer", error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.started = asyncio.Event()
+        self.released = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        self.started.set()
+        await self.released.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlightTests(unittest.IsolatedAsyncioTestCase):
+
+    async def test_concurrent_joiners_share_one_call(self):
+        flight = SingleFlight()
+        call = Call()
+
+        tasks = [asyncio.ensure_future(flight.do("key", call)) for _ in range(3)]
+        await call.started.wait()
+        self.assertEqual(flight.in_flight(), 1)
+        call.released.set()
+        results = await asyncio.gather(*tasks)
+
+        self.assertEqual(call.calls, 1)
+        self.assertEqual(results, [("answer", False), ("answer", True), ("answer", True)])
+        self.assertEqual(flight.in_flight(), 0)
+
+    async def test_different_keys_run_separately(self):
+        flight = SingleFlight()
+        first, second = Call("a"), Call("b")
+        first.released.set()
+        second.released.set()
+
+        results = await asyncio.gather(flight.do("a", first), flight.do("b", second))
+
+        self.assertEqual(results, [("a", False), ("b", False)])
+        self.assertEqual((first.calls, second.calls), (1, 1))
+
+    async def test_finished_call_is_not_reused(self):
+        flight = SingleFlight()
+        call = Call()
+        call.released.set()
+
+        await flight.do("key", call)
+        result = await flight.do("key", call)
+
+        self.assertEqual(result, ("answer", False))
+        self.assertEqual(call.calls, 2)
+
+    async def test_error_reaches_every_joiner(self):
+        flight = SingleFlight()
+        call = Call(error=RuntimeError("provider down"))
+
+        tasks = [asyncio.ensure_future(flight.do("key", call)) for _ in range(2)]
+        await call.started.wait()
+        call.released.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        self.assertEqual(call.calls, 1)
+        self.assertTrue(all(isinstance(r, RuntimeError) for r in results))
+        self.assertEqual(flight.in_flight(), 0)
+
+    async def test_cancelled_leader_keeps_call_for_joiners(self):
+        flight = SingleFlight()
+        call = Call()
+
+        leader = asyncio.ensure_future(flight.do("key", call))
+        await call.started.wait()
+        joiner = asyncio.ensure_future(flight.do("key", call))
+        await asyncio.sleep(0)
+        leader.cancel()
+        call.released.set()
+
+        self.assertEqual(await joiner, ("answer", True))
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
+        self.assertEqual(call.calls, 1)
+
+    async def test_joiner_on_another_event_loop(self):
+        flight = SingleFlight()
+        call = Call()
+        results = []
+
+        leader = asyncio.ensure_future(flight.do("key", call))
+        await call.started.wait()
+        thread = threading.Thread(target=lambda: results.append(asyncio.run(flight.do("key", call))))
+        thread.start()
+        # 別スレッドのイベントループが待機者として加わるのを待つ
+        await asyncio.sleep(0.05)
+        call.released.set()
+        await leader
+        await asyncio.to_thread(thread.join)
+
+        self.assertEqual(results, [("answer", True)])
+        self.assertEqual(call.calls, 1)
+
+    async def test_disabled_calls_every_time(self):
+        flight = SingleFlight(SingleFlightConfig(enabled=False))
+        call = Call()
+        call.released.set()
+
+        results = await asyncio.gather(flight.do("key", call), flight.do("key", call))
+
+        self.assertEqual(results, [("answer", False), ("answer", False)])
+        self.assertEqual(call.calls, 2)
+        self.assertEqual(flight.in_flight(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+"""
+Sister AI Tests
+"""
+
+import unittest
+from unittest import mock
+
+from ai_assistant.services.fake_provider import FakeProviderConfig, FakeProviderTransport
+from ai_assistant.services.hedging import HedgingConfig
+from ai_assistant.services.providers import ProviderClientConfig
+from ai_assistant.services.sister_ai import ChatResult, SisterAI
+
+
+async def interrupted_stream(self, message, system_prompt, history=None, result=None):
+    """最初の差分を返した後に切れるストリーム"""
+    yield "お兄ちゃん、"
+    raise ConnectionError("connection reset")
+
+
+class ChatStreamTests(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        transport = FakeProviderTransport(FakeProviderConfig(latency="fixed", latency_median=0, tokens_per_second=0))
+        self.sister_ai = SisterAI(
+            openai_api_key="fake",
+            anthropic_api_key="fake",
+            client_config=ProviderClientConfig(transport=transport, prewarm_connections=0),
+            hedging=HedgingConfig(enabled=True, initial_delay=1.0),
+        )
+
+    async def asyncTearDown(self):
+        await self.sister_ai.clients.aclose()
+
+    async def collect(self, result):
+        return [delta async for delta in self.sister_ai.chat_stream("質問だよ", result=result)]
+
+    async def test_hedged_stream_completes(self):
+        result = ChatResult(text="")
+
+        deltas = await self.collect(result)
+
+        self.assertTrue(deltas)
+        self.assertEqual(result.provider, "claude")
+        self.assertFalse(result.hedged)
+
+    async def test_hedged_stream_interrupted_after_first_delta_records_call(self):
+        result = ChatResult(text="")
+
+        with mock.patch.object(SisterAI, "_stream_claude_api", interrupted_stream):
+            deltas = await self.collect(result)
+
+        # 送った差分は差し替えず、エラー応答も足さない
+        self.assertEqual(deltas, ["お兄ちゃん、"])
+        self.assertEqual(result.text, "お兄ちゃん、")
+        self.assertEqual(result.provider, "claude")
+
+    async def test_sequential_stream_interrupted_after_first_delta_records_call(self):
+        self.sister_ai.hedger.config.enabled = False
+        result = ChatResult(text="")
+
+        with mock.patch.object(SisterAI, "_stream_claude_api", interrupted_stream):
+            deltas = await self.collect(result)
+
+        self.assertEqual(deltas, ["お兄ちゃん、"])
+        self.assertEqual(result.provider, "claude")
+
+
+if __name__ == "__main__":
+    unittest.main()
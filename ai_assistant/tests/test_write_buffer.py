@@ -0,0 +1,140 @@
+"""
+Write Behind Buffer Tests
+"""
+
+import threading
+import unittest
+from unittest import mock
+
+from ai_assistant.services.write_buffer import WriteBehindBuffer, WriteBufferConfig
+
+
+class Writer:
+    """書き込まれた行を記録し、fail_times 回だけ失敗する writer"""
+
+    def __init__(self, fail_times=0):
+        self.batches = []
+        self.fail_times = fail_times
+        self.written = threading.Event()
+
+    def __call__(self, kind, rows):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("database is locked")
+        self.batches.append((kind, [row["n"] for row in rows]))
+        self.written.set()
+
+
+def buffer(writer, **overrides) -> WriteBehindBuffer:
+    # 書き込みスレッドが勝手に書き込まないよう、しきい値は大きくしておく
+    config = dict(batch_size=100, flush_interval=3600, max_buffered=1000)
+    config.update(overrides)
+    return WriteBehindBuffer(writer, WriteBufferConfig(**config))
+
+
+class WriteBehindBufferTests(unittest.TestCase):
+
+    def make(self, writer, **overrides):
+        buffer_ = buffer(writer, **overrides)
+        self.addCleanup(buffer_.close)
+        return buffer_
+
+    def test_add_only_buffers(self):
+        writer = Writer()
+        buffer_ = self.make(writer)
+        for n in range(3):
+            buffer_.add("usage", {"n": n})
+
+        self.assertEqual(writer.batches, [])
+        self.assertEqual(buffer_.pending(), 3)
+
+    def test_flush_groups_by_kind_in_batches(self):
+        writer = Writer()
+        buffer_ = self.make(writer, batch_size=3)
+        # 書き込みスレッドを起こさず、このスレッドの flush() だけで書き込む
+        with mock.patch.object(buffer_._wake, "set"):
+            for n in range(4):
+                buffer_.add("usage" if n % 2 == 0 else "interaction", {"n": n})
+
+            self.assertEqual(buffer_.flush(), 4)
+
+        self.assertEqual(writer.batches, [("usage", [0, 2]), ("interaction", [1]), ("interaction", [3])])
+        self.assertEqual(buffer_.pending(), 0)
+        self.assertEqual(buffer_.flush(), 0)
+
+    def test_batch_size_wakes_writer_thread(self):
+        writer = Writer()
+        buffer_ = self.make(writer, batch_size=2)
+        buffer_.add("usage", {"n": 0})
+        buffer_.add("usage", {"n": 1})
+
+        self.assertTrue(writer.written.wait(timeout=2))
+        self.assertEqual(writer.batches, [("usage", [0, 1])])
+
+    def test_flush_interval_writes_partial_batch(self):
+        writer = Writer()
+        buffer_ = self.make(writer, flush_interval=0.01)
+        buffer_.add("usage", {"n": 0})
+
+        self.assertTrue(writer.written.wait(timeout=2))
+        self.assertEqual(writer.batches, [("usage", [0])])
+
+    def test_failed_rows_are_requeued_in_order(self):
+        writer = Writer(fail_times=1)
+        buffer_ = self.make(writer)
+        for n in range(3):
+            buffer_.add("usage", {"n": n})
+
+        self.assertEqual(buffer_.flush(), 0)
+        self.assertEqual(buffer_.pending(), 3)
+        buffer_.add("usage", {"n": 3})
+
+        self.assertEqual(buffer_.flush(), 4)
+        self.assertEqual(writer.batches, [("usage", [0, 1, 2, 3])])
+
+    def test_overflow_drops_oldest_rows(self):
+        writer = Writer()
+        buffer_ = self.make(writer, max_buffered=3)
+        for n in range(5):
+            buffer_.add("usage", {"n": n})
+
+        self.assertEqual(buffer_.pending(), 3)
+        buffer_.flush()
+        self.assertEqual(writer.batches, [("usage", [2, 3, 4])])
+
+    def test_requeue_respects_max_buffered(self):
+        writer = Writer(fail_times=1)
+        buffer_ = self.make(writer, max_buffered=3, batch_size=2)
+        for n in range(3):
+            buffer_.add("usage", {"n": n})
+
+        buffer_.flush()  # [0, 1] の書き込みに失敗して戻す
+        self.assertEqual(buffer_.pending(), 3)
+        buffer_.add("usage", {"n": 3})
+
+        buffer_.flush()
+        self.assertEqual(writer.batches, [("usage", [1, 2]), ("usage", [3])])
+
+    def test_close_flushes_and_later_rows_write_immediately(self):
+        writer = Writer()
+        buffer_ = self.make(writer)
+        buffer_.add("usage", {"n": 0})
+
+        buffer_.close()
+        self.assertEqual(writer.batches, [("usage", [0])])
+        buffer_.add("usage", {"n": 1})
+        self.assertEqual(writer.batches, [("usage", [0]), ("usage", [1])])
+
+    def test_disabled_writes_each_row(self):
+        writer = Writer()
+        buffer_ = self.make(writer, enabled=False)
+        buffer_.add("usage", {"n": 0})
+        buffer_.add("usage", {"n": 1})
+
+        self.assertEqual(writer.batches, [("usage", [0]), ("usage", [1])])
+        self.assertEqual(buffer_.pending(), 0)
+        self.assertIsNone(buffer_._thread)
+
+
+if __name__ == "__main__":
+    unittest.main()
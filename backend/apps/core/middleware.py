@@ -0,0 +1,59 @@
+"""
+Core Middleware
+リクエストごとのメトリクス（ビュー単位のレイテンシとDBクエリ数）
+"""
+
+import time
+
+from django.db import connection
+
+from ai_assistant.services import metrics
+
+
+class QueryCounter:
+    """リクエスト中に実行したクエリの数と時間（connection.execute_wrapper 用）"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started_at
+
+
+class RequestMetricsMiddleware:
+    """ビューごとのレイテンシ・DBクエリ数・DB時間をヒストグラムに記録
+
+    ビューはURLのルート（'api/v1/sister/chat/' など）で区別し、
+    どのURLにも一致しなかったリクエストは1つにまとめる。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryCounter()
+        started_at = time.perf_counter()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started_at
+
+        view = view_label(request)
+        metrics.observe("django_request_latency_seconds", elapsed, view=view, method=request.method,
+                        status=f"{response.status_code // 100}xx")
+        metrics.observe("django_request_db_queries", queries.count, view=view)
+        metrics.observe("django_request_db_seconds", queries.duration, view=view)
+        return response
+
+
+def view_label(request) -> str:
+    """メトリクスのラベルにするビュー名（パラメーターを含まないルート）"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unmatched>'
+    return match.route or match.view_name or '<unknown>'
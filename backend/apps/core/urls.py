@@ -14,4 +14,5 @@ urlpatterns = [
     path('chat/', views.chat_page, name='chat'),
     path('code-review/', views.code_review_page, name='code_review'),
     path('api/status/', views.api_status, name='api_status'),
+    path('metrics/', views.metrics, name='metrics'),
 ]
\ No newline at end of file
@@ -5,10 +5,14 @@ Core Views
 
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.models import User
-from apps.sister_assistant.models import ChatSession, CodeReview, ProjectSuggestion
+from ai_assistant.services import metrics as ai_metrics
+from apps.sister_assistant.services import get_dashboard_stats
+import hmac
+import ipaddress
 import json
 
 
@@ -24,28 +28,8 @@ def home(request):
 @login_required
 def dashboard(request):
     """ダッシュボード"""
-    user = request.user
-    
-    # ユーザーの統計情報を取得
-    chat_sessions_count = ChatSession.objects.filter(user=user).count()
-    code_reviews_count = CodeReview.objects.filter(user=user).count()
-    suggestions_count = ProjectSuggestion.objects.filter(user=user).count()
-    
-    # 最新のアクティビティ
-    recent_chats = ChatSession.objects.filter(user=user)[:5]
-    recent_reviews = CodeReview.objects.filter(user=user)[:5]
-    recent_suggestions = ProjectSuggestion.objects.filter(user=user)[:5]
-    
-    context = {
-        'stats': {
-            'chat_sessions': chat_sessions_count,
-            'code_reviews': code_reviews_count,
-            'suggestions': suggestions_count,
-        },
-        'recent_chats': recent_chats,
-        'recent_reviews': recent_reviews,
-        'recent_suggestions': recent_suggestions,
-    }
+    # ユーザーの統計情報と最新のアクティビティ（キャッシュ済み。最新の一覧は辞書のリスト）
+    context = get_dashboard_stats(request.user.pk)
     
     return render(request, 'core/dashboard.html', context)
 
@@ -73,4 +57,35 @@ def api_status(request):
             'suggestions': True,
             'real_time': True,
         }
-    })
\ No newline at end of file
+    })
+
+
+def _is_internal_request(request) -> bool:
+    """METRICS_ALLOWED_NETWORKS から直接来たリクエストか（nginx などのプロキシ経由は外部扱い）"""
+    if 'X-Forwarded-For' in request.headers or 'X-Real-IP' in request.headers:
+        return False
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network, strict=False)
+               for network in settings.METRICS_ALLOWED_NETWORKS)
+
+
+@require_http_methods(["GET"])
+def metrics(request):
+    """Prometheus形式のメトリクス
+
+    METRICS_AUTH_TOKEN を設定した場合は Bearer トークンが必要。
+    設定していない場合は内部ネットワークからの直接のリクエストにだけ返す。
+    """
+    if not settings.METRICS_ENABLED:
+        return HttpResponse(status=404)
+    token = settings.METRICS_AUTH_TOKEN
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponse(status=401)
+    elif not _is_internal_request(request):
+        return HttpResponse(status=403)
+    body, content_type = ai_metrics.exposition()
+    return HttpResponse(body, content_type=content_type)
@@ -4,31 +4,101 @@ Sister Assistant Admin
 """
 
 from django.contrib import admin
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils.html import format_html
+from apps.core.pagination import EstimatedCountPaginator
 from .models import (
     ChatSession, ChatMessage, CodeReview, ProjectSuggestion,
-    SisterPersonalityConfig, UserInteraction, AIModelUsage
+    SisterPersonalityConfig, UserInteraction, AIModelUsage,
+    AIModelPrice, AIModelUsageDaily
 )
 
 
+class ChoicesListFilter(admin.SimpleListFilter):
+    """options の選択肢を固定で出すフィルター
+
+    choices のないフィールドを list_filter に書くと、一覧を開くたびにテーブル全体の
+    DISTINCT で選択肢を集めるので、件数の多いテーブルではこちらを使う。
+    """
+    options = ()
+    lookup = 'exact'
+    
+    def lookups(self, request, model_admin):
+        return self.options
+    
+    def queryset(self, request, queryset):
+        if self.value() is None:
+            return queryset
+        return queryset.filter(**{f'{self.parameter_name}__{self.lookup}': self.value()})
+
+
+class AIModelListFilter(ChoicesListFilter):
+    title = 'AIモデル'
+    parameter_name = 'ai_model'
+    options = AIModelUsage.MODEL_CHOICES
+    lookup = 'startswith'  # 日付付きのモデル名もまとめる
+
+
+class FeatureListFilter(ChoicesListFilter):
+    title = '機能'
+    parameter_name = 'feature_used'
+    options = UserInteraction.INTERACTION_TYPE
+
+
+class RatingListFilter(ChoicesListFilter):
+    title = 'ユーザー評価'
+    parameter_name = 'user_rating'
+    options = [(str(rating), str(rating)) for rating in range(1, 6)]
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """件数の多いテーブルの一覧（推定件数でページ分けし、全件数は数えない）
+
+    date_hierarchy は階層を表示するたびにテーブル全体の DISTINCT で日付を集めるので使わず、
+    選択肢が固定の DateFieldListFilter で期間を絞る。
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
 @admin.register(ChatSession)
-class ChatSessionAdmin(admin.ModelAdmin):
+class ChatSessionAdmin(LargeTableAdmin):
     list_display = ['title', 'user', 'created_at', 'updated_at', 'is_active', 'message_count']
     list_filter = ['is_active', 'created_at', 'updated_at']
     search_fields = ['title', 'user__username']
     readonly_fields = ['id', 'created_at', 'updated_at']
+    list_select_related = ['user']
+    date_hierarchy = 'updated_at'
+    
+    def get_queryset(self, request):
+        # 相関サブクエリにして、表示するページの行の分だけ数える
+        message_counts = (
+            ChatMessage.objects
+            .filter(session=OuterRef('pk'))
+            .order_by()
+            .values('session')
+            .annotate(count=Count('id'))
+            .values('count')
+        )
+        return super().get_queryset(request).annotate(
+            message_total=Coalesce(Subquery(message_counts, output_field=IntegerField()), 0)
+        )
     
     def message_count(self, obj):
-        return obj.messages.count()
+        return obj.message_total
     message_count.short_description = 'メッセージ数'
 
 
 @admin.register(ChatMessage)
-class ChatMessageAdmin(admin.ModelAdmin):
+class ChatMessageAdmin(LargeTableAdmin):
     list_display = ['session_title', 'role', 'content_preview', 'timestamp', 'ai_model']
-    list_filter = ['role', 'ai_model', 'timestamp']
+    list_filter = ['role', AIModelListFilter, ('timestamp', admin.DateFieldListFilter)]
     search_fields = ['content', 'session__title']
     readonly_fields = ['id', 'timestamp']
+    list_select_related = ['session']
+    raw_id_fields = ['session']
+    ordering = ['-timestamp']
     
     def session_title(self, obj):
         return obj.session.title
@@ -41,10 +111,11 @@ class ChatMessageAdmin(admin.ModelAdmin):
 
 @admin.register(CodeReview)
 class CodeReviewAdmin(admin.ModelAdmin):
-    list_display = ['title', 'user', 'language', 'status', 'created_at', 'tokens_used']
-    list_filter = ['language', 'status', 'created_at']
+    list_display = ['title', 'user', 'language', 'status', 'created_at', 'tokens_used', 'served_from_cache']
+    list_filter = ['language', 'status', 'served_from_cache', 'created_at']
     search_fields = ['title', 'user__username']
     readonly_fields = ['id', 'created_at', 'completed_at']
+    list_select_related = ['user']
     
     fieldsets = (
         ('基本情報', {
@@ -59,7 +130,7 @@ class CodeReviewAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
         ('メタデータ', {
-            'fields': ('created_at', 'completed_at', 'ai_model', 'tokens_used'),
+            'fields': ('created_at', 'completed_at', 'ai_model', 'tokens_used', 'served_from_cache'),
             'classes': ('collapse',)
         }),
     )
@@ -71,6 +142,7 @@ class ProjectSuggestionAdmin(admin.ModelAdmin):
     list_filter = ['suggestion_type', 'priority', 'is_implemented', 'created_at']
     search_fields = ['title', 'description', 'user__username']
     readonly_fields = ['id', 'created_at']
+    list_select_related = ['user']
     
     fieldsets = (
         ('基本情報', {
@@ -104,7 +176,7 @@ class SisterPersonalityConfigAdmin(admin.ModelAdmin):
             'description': '各パラメータは0.0〜1.0の範囲で設定してください'
         }),
         ('学習設定', {
-            'fields': ('learn_from_interactions', 'remember_preferences')
+            'fields': ('learn_from_interactions', 'remember_preferences', 'use_response_cache')
         }),
         ('メタデータ', {
             'fields': ('created_at', 'updated_at'),
@@ -114,11 +186,13 @@ class SisterPersonalityConfigAdmin(admin.ModelAdmin):
 
 
 @admin.register(UserInteraction)
-class UserInteractionAdmin(admin.ModelAdmin):
+class UserInteractionAdmin(LargeTableAdmin):
     list_display = ['user', 'interaction_type', 'content_preview', 'user_rating', 'timestamp']
-    list_filter = ['interaction_type', 'user_rating', 'timestamp']
+    list_filter = ['interaction_type', RatingListFilter, ('timestamp', admin.DateFieldListFilter)]
     search_fields = ['user__username', 'content', 'response']
     readonly_fields = ['id', 'timestamp']
+    list_select_related = ['user']
+    raw_id_fields = ['user']
     
     def content_preview(self, obj):
         return obj.content[:50] + '...' if len(obj.content) > 50 else obj.content
@@ -126,14 +200,37 @@ class UserInteractionAdmin(admin.ModelAdmin):
 
 
 @admin.register(AIModelUsage)
-class AIModelUsageAdmin(admin.ModelAdmin):
+class AIModelUsageAdmin(LargeTableAdmin):
+    """1回ごとの利用記録（日や月ごとの利用量は日次集計の画面で見る）"""
     list_display = ['user', 'model_name', 'feature_used', 'total_tokens', 'cost_estimate', 'timestamp']
-    list_filter = ['model_name', 'feature_used', 'timestamp']
+    list_filter = ['model_name', FeatureListFilter, ('timestamp', admin.DateFieldListFilter)]
     search_fields = ['user__username']
     readonly_fields = ['timestamp']
+    list_select_related = ['user']
+    raw_id_fields = ['user']
+
+
+@admin.register(AIModelUsageDaily)
+class AIModelUsageDailyAdmin(admin.ModelAdmin):
+    """日次集計（celery beat の rollup_ai_usage が作り直すので閲覧のみ）"""
+    list_display = ['date', 'user', 'model_name', 'feature_used', 'calls', 'total_tokens', 'cost_estimate']
+    list_filter = ['model_name', 'feature_used']
+    search_fields = ['user__username']
+    date_hierarchy = 'date'
+    list_select_related = ['user']
     
-    def get_queryset(self, request):
-        return super().get_queryset(request).select_related('user')
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(AIModelPrice)
+class AIModelPriceAdmin(admin.ModelAdmin):
+    list_display = ['model_name', 'input_price', 'output_price', 'updated_at']
+    list_editable = ['input_price', 'output_price']
+    readonly_fields = ['updated_at']
 
 
 # カスタム管理画面の設定
@@ -4,4 +4,7 @@ from django.apps import AppConfig
 class SisterAssistantConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.sister_assistant'
-    verbose_name = '紗良アシスタント'
\ No newline at end of file
+    verbose_name = '紗良アシスタント'
+
+    def ready(self):
+        from . import signals  # noqa: F401
\ No newline at end of file
@@ -0,0 +1,131 @@
+"""
+Sister Assistant Benchmarking
+負荷試験・マイクロベンチマークの集計、結果の保存とベースラインとの比較
+"""
+
+import json
+import os
+import platform
+import subprocess
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Sequence
+
+import django
+
+
+@dataclass
+class Comparison:
+    """ベースラインと比べた1つの指標"""
+    key: str
+    baseline: float
+    current: float
+    higher_is_better: bool
+    threshold: float
+
+    @property
+    def change(self) -> float:
+        """ベースラインからの変化率（ベースラインが0の場合は変化があれば +100% とみなす）"""
+        if self.baseline == 0:
+            return 0.0 if self.current == 0 else 1.0
+        return (self.current - self.baseline) / abs(self.baseline)
+
+    @property
+    def regressed(self) -> bool:
+        change = -self.change if self.higher_is_better else self.change
+        return change > self.threshold
+
+
+def percentile(values: Sequence[float], p: float) -> float:
+    """線形補間のパーセンタイル（p は 0〜100）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def describe(values: Sequence[float], digits: int = 2) -> Dict[str, float]:
+    """平均・p50・p95・p99・最大"""
+    if not values:
+        return {}
+    return {
+        'mean': round(sum(values) / len(values), digits),
+        'p50': round(percentile(values, 50), digits),
+        'p95': round(percentile(values, 95), digits),
+        'p99': round(percentile(values, 99), digits),
+        'max': round(max(values), digits),
+    }
+
+
+def environment() -> Dict[str, Any]:
+    """結果を比べるときに必要な実行環境"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def default_output_path(prefix: str) -> Path:
+    return Path(f"{prefix}-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json")
+
+
+def save_results(path: Path, results: Dict[str, Any]):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(results, ensure_ascii=False, indent=2) + '\n', encoding='utf-8')
+
+
+def load_results(path: Path) -> Dict[str, Any]:
+    return json.loads(Path(path).read_text(encoding='utf-8'))
+
+
+def flatten(data: Dict[str, Any], prefix: str = '') -> Dict[str, float]:
+    """入れ子の結果を 'chat.latency_ms.p95' のようなキーの数値にする"""
+    flat: Dict[str, float] = {}
+    for key, value in data.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{name}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = float(value)
+    return flat
+
+
+def compare_results(current: Dict[str, Any], baseline: Dict[str, Any], watched: Dict[str, bool],
+                    threshold: float) -> List[Comparison]:
+    """watched の末尾に一致する指標をベースラインと比べる（値は「大きい方が良い」か）"""
+    current_flat = flatten(current)
+    baseline_flat = flatten(baseline)
+    comparisons = []
+    for key, value in current_flat.items():
+        if key not in baseline_flat:
+            continue
+        for suffix, higher_is_better in watched.items():
+            if key == suffix or key.endswith(f'.{suffix}'):
+                comparisons.append(Comparison(key, baseline_flat[key], value, higher_is_better, threshold))
+                break
+    return comparisons
+
+
+def format_comparison(comparisons: Iterable[Comparison]) -> List[str]:
+    lines = []
+    for comparison in comparisons:
+        mark = 'REGRESSED' if comparison.regressed else ''
+        lines.append(
+            f'{comparison.key:<48} {comparison.baseline:>12.2f} -> {comparison.current:>12.2f} '
+            f'({comparison.change:+.1%}) {mark}'.rstrip()
+        )
+    return lines
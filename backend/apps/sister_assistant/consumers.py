@@ -0,0 +1,119 @@
+"""
+Sister Assistant Consumers
+紗良とのリアルタイムチャット用WebSocketコンシューマー
+"""
+
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from ai_assistant.services.rate_limit import RateLimitExceeded
+from ai_assistant.services.scheduler import request_scope
+from ai_assistant.services.sister_ai import ChatResult
+
+from .services import (
+    get_or_create_chat_session,
+    get_personality_profile,
+    get_rate_limiter,
+    get_sister_ai,
+    record_ai_usage,
+    save_chat_exchange,
+    user_group_name,
+    uses_response_cache,
+)
+from .throttling import estimate_request_tokens, rate_limit_payload
+
+logger = logging.getLogger(__name__)
+
+
+class SisterChatConsumer(AsyncJsonWebsocketConsumer):
+    """紗良の応答をトークン単位でお兄ちゃんに届けるコンシューマー
+    
+    チャット応答の差分はこの接続に直接送り、ユーザーごとのグループには
+    チャネルレイヤー経由で他プロセス（バックグラウンドジョブなど）からの
+    通知を受け取るために参加する。
+    """
+    
+    async def connect(self):
+        user = self.scope.get("user")
+        if not user or not user.is_authenticated:
+            await self.close()
+            return
+        
+        self.group_name = user_group_name(user.id)
+        self.stream_task = None
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+    
+    async def disconnect(self, code):
+        if getattr(self, "stream_task", None):
+            self.stream_task.cancel()
+        if hasattr(self, "group_name"):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+    
+    async def receive_json(self, content, **kwargs):
+        message = (content.get("message") or "").strip()
+        if content.get("type", "chat") != "chat" or not message:
+            await self.send_json({"type": "sister_error", "error": "invalid_message"})
+            return
+        
+        try:
+            # Redisへの問い合わせでイベントループを止めないよう、スレッドで実行する
+            await sync_to_async(get_rate_limiter().acquire, thread_sensitive=False)(
+                self.scope["user"].pk, estimate_request_tokens(content)
+            )
+        except RateLimitExceeded as e:
+            await self.send_json({**rate_limit_payload(e), "type": "sister_error"})
+            return
+        
+        # 前の応答がまだ流れていれば打ち切る
+        if self.stream_task and not self.stream_task.done():
+            self.stream_task.cancel()
+        
+        self.stream_task = asyncio.create_task(
+            self._stream_response(message, content.get("context") or {}, content.get("session_id"))
+        )
+    
+    async def _stream_response(self, message, context, session_id=None):
+        """紗良の応答を差分ごとに送信"""
+        sister_ai = get_sister_ai()
+        result = ChatResult(text="")
+        try:
+            session = await database_sync_to_async(get_or_create_chat_session)(self.scope["user"], session_id)
+            session_id = str(session.id)
+            use_cache = await database_sync_to_async(uses_response_cache)(self.scope["user"])
+            profile = await database_sync_to_async(get_personality_profile)(self.scope["user"])
+            
+            await self.send_json({"type": "sister_start", "session_id": session_id})
+            with request_scope(user=self.scope["user"].pk):
+                async for delta in sister_ai.chat_stream(message, context, session_id=session_id,
+                                                         use_cache=use_cache, profile=profile, result=result):
+                    await self.send_json({"type": "sister_delta", "delta": delta})
+            
+            # done を受け取ったクライアントが切断するとこのタスクはキャンセルされるので、
+            # 保存を先に済ませ、キャンセルされても保存自体は打ち切らない
+            await asyncio.shield(self._save_exchange(session, message, result, context))
+            await self.send_json({"type": "sister_done", "message": result.text, "session_id": session_id})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Chat stream consumer error: {e}")
+            await self.send_json({"type": "sister_error", "error": "stream_failed"})
+    
+    async def _save_exchange(self, session, message, result, context):
+        """やり取りと利用記録を保存"""
+        await database_sync_to_async(save_chat_exchange)(session, message, result, context)
+        await database_sync_to_async(record_ai_usage)(
+            self.scope["user"].pk, "chat", result, message, str(session.id), context
+        )
+    
+    async def sister_response(self, event):
+        """チャネルレイヤー経由で届いたイベントを転送"""
+        await self.send_json({**event, "type": "sister_response"})
+    
+    async def code_review_done(self, event):
+        """バックグラウンドのコードレビューが終わったことを通知"""
+        await self.send_json(event)
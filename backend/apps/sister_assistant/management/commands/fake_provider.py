@@ -0,0 +1,49 @@
+"""
+擬似プロバイダーのHTTPサーバーを起動する
+SISTER_AI_PROVIDER_BACKEND=fake_server の負荷試験で、Django/Celeryワーカーとは別のプロセスとして動かす
+"""
+
+import asyncio
+from dataclasses import replace
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ai_assistant.services.fake_provider import FakeProviderConfig, FakeProviderServer
+
+
+class Command(BaseCommand):
+    help = 'Claude/OpenAI互換の擬似プロバイダーを起動（設定は SISTER_AI_FAKE_PROVIDER、オプションで上書き）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', choices=['fixed', 'uniform', 'lognormal'])
+        parser.add_argument('--latency-median', type=float, help='seconds')
+        parser.add_argument('--latency-p99', type=float, help='seconds')
+        parser.add_argument('--tokens-per-second', type=float)
+        parser.add_argument('--response-tokens', type=int)
+        parser.add_argument('--error-rate', type=float)
+        parser.add_argument('--rate-limit-rate', type=float)
+        parser.add_argument('--seed', type=int)
+
+    def handle(self, *args, **options):
+        config = FakeProviderConfig(**settings.SISTER_AI_FAKE_PROVIDER)
+        overrides = {
+            name: options[name]
+            for name in ('latency', 'latency_median', 'latency_p99', 'tokens_per_second',
+                         'response_tokens', 'error_rate', 'rate_limit_rate', 'seed')
+            if options[name] is not None
+        }
+        config = replace(config, **overrides)
+
+        server = FakeProviderServer(config, host=options['host'], port=options['port'])
+        self.stdout.write(
+            f'Fake provider on http://{server.host}:{server.port} '
+            f'(latency={config.latency} median={config.latency_median}s p99={config.latency_p99}s, '
+            f'{config.tokens_per_second} tokens/s, errors={config.error_rate}, 429={config.rate_limit_rate})'
+        )
+        try:
+            asyncio.run(server.serve_forever())
+        except KeyboardInterrupt:
+            pass
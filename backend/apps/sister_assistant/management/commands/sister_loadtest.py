@@ -0,0 +1,425 @@
+"""
+紗良APIの負荷試験
+sister-chat.js が呼ぶエンドポイント（チャットのWebSocketを含む）に、擬似プロバイダーを相手に並行してリクエストを送り、
+エンドポイントごとのスループット・レイテンシ・最初のトークンまでの時間・DBクエリ数をJSONに保存する
+
+Djangoのテストクライアントでビューをプロセス内から呼ぶので、ミドルウェア・DRF・DB・キャッシュまで含めて計測できる
+（HTTPサーバーとネットワークは含まない）。計測用のユーザー（loadtest-*）とそのデータは終了時に削除する。
+"""
+
+import asyncio
+import contextvars
+import json
+import queue
+import random
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.db.backends.signals import connection_created
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from ...benchmarking import (
+    compare_results,
+    default_output_path,
+    describe,
+    environment,
+    format_comparison,
+    load_results,
+    save_results,
+)
+from ...consumers import SisterChatConsumer
+from ...services import flush_telemetry_buffer
+
+ENDPOINTS = ('chat', 'chat_stream', 'code_review', 'suggestion', 'history')
+DEFAULT_MIX = 'chat=35,chat_stream=20,code_review=15,suggestion=10,history=20'
+
+# ベースラインと比べる指標（値は「大きい方が良い」か）
+WATCHED = {
+    'throughput_rps': True,
+    'latency_ms.p50': False,
+    'latency_ms.p95': False,
+    'latency_ms.p99': False,
+    'ttft_ms.p95': False,
+    'db_queries.mean': False,
+    'error_rate': False,
+}
+
+CHAT_TOPICS = [
+    'Djangoのクエリ最適化', 'Pythonの非同期処理', 'Reactの状態管理', 'Gitのブランチ戦略',
+    'Dockerのイメージサイズ', 'テストの書き方', 'N+1問題', 'キャッシュの設計',
+]
+
+# リクエストごとのDBクエリ数（sync_to_async/async_to_sync をまたいでも同じカウンターを使う）
+_query_counter: contextvars.ContextVar = contextvars.ContextVar('loadtest_queries', default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    counter = _query_counter.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def _install_query_counter(connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+class Command(BaseCommand):
+    help = '紗良APIの負荷試験（擬似プロバイダー相手に実行し、結果をJSONに保存）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='計測するリクエスト数')
+        parser.add_argument('--warmup', type=int, default=20, help='計測前に捨てるリクエスト数')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--users', type=int, default=10, help='リクエストを分散させるユーザー数')
+        parser.add_argument('--mix', default=DEFAULT_MIX, help=f'エンドポイントの比率（{", ".join(ENDPOINTS)}）')
+        parser.add_argument('--repeat-ratio', type=float, default=0.0,
+                            help='同じ内容を繰り返し送る割合（キャッシュが効く場合の計測用）')
+        parser.add_argument('--review-lines', type=int, default=120, help='レビューするコードの行数')
+        parser.add_argument('--review-async', action='store_true',
+                            help='レビューをCeleryに任せる（202までを計測。ワーカーが必要）')
+        parser.add_argument('--provider', choices=['fake', 'fake_server', 'live'], default='fake')
+        parser.add_argument('--latency-median', type=float, help='擬似プロバイダーの遅延の中央値 (seconds)')
+        parser.add_argument('--tokens-per-second', type=float, help='擬似プロバイダーの生成速度')
+        parser.add_argument('--error-rate', type=float, help='擬似プロバイダーのエラー率')
+        parser.add_argument('--rate-limit', action='store_true', help='レート制限を有効のまま計測する')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='結果のJSON（省略時は loadtest-<日時>.json）')
+        parser.add_argument('--baseline', help='比較するベースラインのJSON')
+        parser.add_argument('--max-regression', type=float, default=0.1,
+                            help='ベースラインからこの割合を超えて悪化したら失敗にする')
+        parser.add_argument('--max-error-rate', type=float, default=0.1,
+                            help='エラーの割合がこれを超えたら失敗にする（設定の誤りで計測になっていない場合など）')
+        parser.add_argument('--keep-data', action='store_true', help='計測用のユーザーとそのデータを削除しない')
+
+    def handle(self, *args, **options):
+        if options['provider'] == 'live':
+            self.stderr.write('Warning: running against live providers consumes real API quota.')
+        self._configure(options)
+
+        mix = self._parse_mix(options['mix'])
+        rng = random.Random(options['seed'])
+        self.host = self._allowed_host()
+        users = self._users(options['users'])
+        try:
+            results = self._measure(users, mix, rng, options)
+        finally:
+            if not options['keep_data']:
+                self._cleanup(users)
+
+        output = Path(options['output']) if options['output'] else default_output_path('loadtest')
+        save_results(output, results)
+        self.stdout.write(f'Results saved to {output}')
+
+        self._check_errors(results['summary'], options)
+        if options['baseline']:
+            self._compare(results, options['baseline'], options['max_regression'])
+
+    def _measure(self, users: List[User], mix: Dict[str, float], rng: random.Random,
+                 options: Dict[str, Any]) -> Dict[str, Any]:
+        connection_created.connect(_install_query_counter)
+        for connection in connections.all():
+            _install_query_counter(connection)
+
+        plan = [(rng.choices(list(mix), weights=list(mix.values()))[0], index)
+                for index in range(options['warmup'] + options['requests'])]
+        warmup, measured = plan[:options['warmup']], plan[options['warmup']:]
+
+        if warmup:
+            self.stdout.write(f'Warming up ({len(warmup)} requests)...')
+            self._run(warmup, users, options, rng)
+        self.stdout.write(f"Running {len(measured)} requests with concurrency {options['concurrency']}...")
+        started = time.perf_counter()
+        records = self._run(measured, users, options, rng)
+        duration = time.perf_counter() - started
+
+        results = {
+            'meta': {
+                **environment(),
+                'options': {key: options[key] for key in (
+                    'requests', 'warmup', 'concurrency', 'users', 'mix', 'repeat_ratio', 'review_lines',
+                    'review_async', 'provider', 'rate_limit', 'seed',
+                )},
+                'fake_provider': settings.SISTER_AI_FAKE_PROVIDER if options['provider'] != 'live' else None,
+            },
+            'summary': self._summarize(records, duration),
+            'endpoints': {
+                name: self._summarize([r for r in records if r['endpoint'] == name], duration)
+                for name in mix if any(r['endpoint'] == name for r in records)
+            },
+        }
+        self._report(results)
+        return results
+
+    def _configure(self, options: Dict[str, Any]):
+        """計測用に設定を上書き（SisterAI やレート制限を作る前に行う）"""
+        settings.SISTER_AI_PROVIDER_BACKEND = options['provider']
+        overrides = {
+            'latency_median': options['latency_median'],
+            'tokens_per_second': options['tokens_per_second'],
+            'error_rate': options['error_rate'],
+        }
+        settings.SISTER_AI_FAKE_PROVIDER = {
+            **settings.SISTER_AI_FAKE_PROVIDER,
+            **{key: value for key, value in overrides.items() if value is not None},
+        }
+        settings.SISTER_AI_REVIEW_ASYNC = options['review_async']
+        if not options['rate_limit']:
+            settings.SISTER_AI_RATE_LIMIT_ENABLED = False
+
+    def _parse_mix(self, mix: str) -> Dict[str, float]:
+        weights = {}
+        for part in mix.split(','):
+            name, _, weight = part.partition('=')
+            name = name.strip()
+            if name not in ENDPOINTS:
+                raise CommandError(f'Unknown endpoint in --mix: {name} (choose from {", ".join(ENDPOINTS)})')
+            try:
+                weights[name] = float(weight or 1)
+            except ValueError:
+                raise CommandError(f'Invalid weight in --mix: {part}')
+        if not any(weights.values()):
+            raise CommandError('--mix needs at least one endpoint with a positive weight')
+        return weights
+
+    def _check_errors(self, summary: Dict[str, Any], options: Dict[str, Any]):
+        """失敗したリクエストが多すぎる場合は計測になっていないので失敗にする（レート制限の429は除く）"""
+        codes = summary['status_codes']
+        failed = sum(
+            count for code, count in codes.items()
+            if not code.startswith('2') and not (options['rate_limit'] and code == '429')
+        )
+        if summary['requests'] and failed / summary['requests'] > options['max_error_rate']:
+            raise CommandError(
+                f"{failed} of {summary['requests']} requests failed (status codes: {codes}); "
+                'the results do not measure the endpoints'
+            )
+
+    def _allowed_host(self) -> str:
+        """テストクライアントの Host（既定の testserver は ALLOWED_HOSTS に含まれず400になる）"""
+        for host in settings.ALLOWED_HOSTS:
+            if host != '*':
+                return host.lstrip('.') or 'localhost'
+        return 'localhost'
+
+    def _users(self, count: int) -> List[User]:
+        users = []
+        for index in range(count):
+            user, created = User.objects.get_or_create(username=f'loadtest-{index}')
+            if created:
+                user.set_unusable_password()
+                user.save(update_fields=['password'])
+            users.append(user)
+        return users
+
+    def _cleanup(self, users: List[User]):
+        """計測用のユーザーと、そのセッション・メッセージ・レビュー・利用記録を削除"""
+        # バッファに残っている利用記録を先に書き込んでから消す
+        flush_telemetry_buffer()
+        deleted, _ = User.objects.filter(pk__in=[user.pk for user in users]).delete()
+        self.stdout.write(f'Cleaned up {deleted} loadtest rows')
+
+    def _run(self, plan: List, users: List[User], options: Dict[str, Any], rng: random.Random) -> List[Dict]:
+        work: "queue.Queue" = queue.Queue()
+        for item in plan:
+            repeat = rng.random() < options['repeat_ratio']
+            work.put((*item, repeat))
+        records: List[Dict] = []
+        lock = threading.Lock()
+
+        def worker():
+            client = APIClient(SERVER_NAME=self.host)
+            try:
+                while True:
+                    try:
+                        endpoint, index, repeat = work.get_nowait()
+                    except queue.Empty:
+                        return
+                    user = users[index % len(users)]
+                    record = self._request(client, endpoint, index, user, repeat, options)
+                    with lock:
+                        records.append(record)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, options['concurrency']))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return records
+
+    def _request(self, client: APIClient, endpoint: str, index: int, user: User, repeat: bool,
+                 options: Dict[str, Any]) -> Dict[str, Any]:
+        close_old_connections()
+        counter = [0]
+        token = _query_counter.set(counter)
+        record: Dict[str, Any] = {'endpoint': endpoint, 'status': None, 'ttft': None, 'error': False}
+        key = 0 if repeat else index + 1
+        started = time.perf_counter()
+        try:
+            if endpoint == 'chat_stream':
+                status, ttft = async_to_sync(self._stream_chat)(user, self._chat_message(key))
+                record['ttft'] = ttft
+            else:
+                client.force_authenticate(user)
+                response = self._call(client, endpoint, key, options)
+                status = response.status_code
+            record['status'] = status
+            record['error'] = not isinstance(status, int) or status >= 400
+        except Exception as e:
+            record['status'] = type(e).__name__
+            record['error'] = True
+        finally:
+            record['latency'] = time.perf_counter() - started
+            record['queries'] = counter[0]
+            _query_counter.reset(token)
+        return record
+
+    def _call(self, client: APIClient, endpoint: str, key: int, options: Dict[str, Any]):
+        if endpoint == 'chat':
+            return client.post(reverse('sister_assistant:chat'), {
+                'message': self._chat_message(key),
+                'context': {'page': '/chat/'},
+            }, format='json')
+        if endpoint == 'code_review':
+            return client.post(reverse('sister_assistant:code_review'), {
+                'code': self._review_code(key, options['review_lines']),
+                'language': 'python',
+                'title': f'loadtest-{key}.py',
+            }, format='json')
+        if endpoint == 'suggestion':
+            return client.post(reverse('sister_assistant:suggestion'), {
+                'project_info': {
+                    'name': f'loadtest-project-{key}',
+                    'description': 'お兄ちゃんのWebサービス',
+                    'technologies': ['Django', 'PostgreSQL', 'Redis', 'Celery'],
+                    'team_size': 3,
+                },
+            }, format='json')
+        return client.get(reverse('sister_assistant:history'), {'limit': 50})
+
+    async def _stream_chat(self, user: User, message: str):
+        """WebSocketでチャットを送り、(結果, 最初の差分までの秒数) を返す（接続時間は含めない）
+
+        channels.testing は daphne が必要なので、コンシューマーとASGIのwebsocketイベントを直接やり取りする
+        （クエリ数のカウンターを引き継ぐため、アプリケーションは現在のコンテキストで動かす）。
+        """
+        inbox: "asyncio.Queue" = asyncio.Queue()
+        outbox: "asyncio.Queue" = asyncio.Queue()
+        scope = {'type': 'websocket', 'path': '/ws/sister/chat/', 'headers': [], 'subprotocols': [], 'user': user}
+        application = asyncio.create_task(SisterChatConsumer.as_asgi()(scope, inbox.get, outbox.put))
+        timeout = settings.SISTER_AI_HTTP_READ_TIMEOUT
+
+        async def receive() -> Dict[str, Any]:
+            return await asyncio.wait_for(outbox.get(), timeout)
+
+        try:
+            await inbox.put({'type': 'websocket.connect'})
+            if (await receive())['type'] != 'websocket.accept':
+                return 'ws_rejected', None
+
+            started = time.perf_counter()
+            await inbox.put({'type': 'websocket.receive', 'text': json.dumps({'type': 'chat', 'message': message})})
+            ttft = None
+            while True:
+                output = await receive()
+                if output['type'] != 'websocket.send':
+                    return 'ws_closed', ttft
+                event = json.loads(output['text'])
+                if event['type'] == 'sister_delta' and ttft is None:
+                    ttft = time.perf_counter() - started
+                if event['type'] == 'sister_done':
+                    return 200, ttft
+                if event['type'] == 'sister_error':
+                    return 429 if event.get('error') == 'rate_limited' else 500, ttft
+        finally:
+            await inbox.put({'type': 'websocket.disconnect', 'code': 1000})
+            try:
+                await asyncio.wait_for(application, timeout)
+            except asyncio.TimeoutError:
+                application.cancel()
+
+    def _chat_message(self, key: int) -> str:
+        topic = CHAT_TOPICS[key % len(CHAT_TOPICS)]
+        return f'{topic}について教えて（#{key}）'
+
+    def _review_code(self, key: int, lines: int) -> str:
+        # レビューキャッシュはコメントと空白を無視して比べるので、コードそのものを変える
+        body = ['import json', '', f'BATCH_ID = {key}', '']
+        function = 0
+        while len(body) < lines:
+            body.extend([
+                f'def handler_{function}(payload):',
+                f'    """handler {function}"""',
+                '    data = json.loads(payload)',
+                '    total = 0',
+                '    for item in data.get("items", []):',
+                f'        total += item.get("value", 0) * {function + 1}',
+                '    return total',
+                '',
+            ])
+            function += 1
+        return '\n'.join(body[:lines]) + '\n'
+
+    def _summarize(self, records: List[Dict], duration: float) -> Dict[str, Any]:
+        latencies = [r['latency'] * 1000 for r in records]
+        ttfts = [r['ttft'] * 1000 for r in records if r['ttft'] is not None]
+        errors = sum(1 for r in records if r['error'])
+        summary = {
+            'requests': len(records),
+            'errors': errors,
+            'error_rate': round(errors / len(records), 4) if records else 0.0,
+            'status_codes': dict(Counter(str(r['status']) for r in records)),
+            'throughput_rps': round(len(records) / duration, 2) if duration else 0.0,
+            'latency_ms': describe(latencies),
+            'db_queries': describe([r['queries'] for r in records]),
+        }
+        if ttfts:
+            summary['ttft_ms'] = describe(ttfts)
+        return summary
+
+    def _report(self, results: Dict[str, Any]):
+        summary = results['summary']
+        self.stdout.write(
+            f"\n{summary['requests']} requests, {summary['errors']} errors, "
+            f"{summary['throughput_rps']} req/s"
+        )
+        header = f"{'endpoint':<12} {'n':>5} {'err':>4} {'rps':>7} {'p50':>8} {'p95':>8} {'p99':>8} " \
+                 f"{'ttft95':>8} {'queries':>8}"
+        self.stdout.write(header)
+        for name, stats in results['endpoints'].items():
+            latency = stats['latency_ms']
+            self.stdout.write(
+                f"{name:<12} {stats['requests']:>5} {stats['errors']:>4} {stats['throughput_rps']:>7.2f} "
+                f"{latency.get('p50', 0):>8.1f} {latency.get('p95', 0):>8.1f} {latency.get('p99', 0):>8.1f} "
+                f"{stats.get('ttft_ms', {}).get('p95', 0):>8.1f} {stats['db_queries'].get('mean', 0):>8.1f}"
+            )
+
+    def _compare(self, results: Dict[str, Any], baseline_path: str, max_regression: float):
+        baseline = load_results(Path(baseline_path))
+        comparisons = compare_results(
+            {'summary': results['summary'], 'endpoints': results['endpoints']},
+            {'summary': baseline.get('summary', {}), 'endpoints': baseline.get('endpoints', {})},
+            WATCHED,
+            max_regression,
+        )
+        self.stdout.write(f'\nCompared with {baseline_path} (commit {baseline["meta"].get("git_commit")}):')
+        for line in format_comparison(comparisons):
+            self.stdout.write(line)
+        regressions = [c for c in comparisons if c.regressed]
+        if regressions:
+            raise CommandError(
+                f'{len(regressions)} metric(s) regressed by more than {max_regression:.0%}: '
+                + ', '.join(c.key for c in regressions)
+            )
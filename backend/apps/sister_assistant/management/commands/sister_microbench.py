@@ -0,0 +1,237 @@
+"""
+SisterAI 内部処理のマイクロベンチマーク
+システムプロンプトの組み立て、プロジェクト情報の整形、履歴のシリアライズ・切り詰め、ChatMessage の生成を
+履歴の長さごとに計測し、1メッセージあたりのメモリと合わせてJSONに保存する（--baseline で前回と比較）
+"""
+
+import asyncio
+import gc
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ai_assistant.services.prompt_templates import PersonalityProfile
+from ai_assistant.services.session_pool import ConversationState, SessionStatePool, estimate_message_bytes
+from ai_assistant.services.sister_ai import CLAUDE_MODEL, MAX_OUTPUT_TOKENS, ChatMessage, SisterAI
+
+from ...benchmarking import (
+    compare_results,
+    default_output_path,
+    environment,
+    format_comparison,
+    load_results,
+    save_results,
+)
+
+DEFAULT_SIZES = '10,1000,100000'
+
+# ベースラインと比べる指標（値は「大きい方が良い」か）
+WATCHED = {
+    'time_us.median': False,
+    'per_message_us': False,
+    'bytes_per_message': False,
+}
+
+USER_MESSAGE = 'お兄ちゃん、このクエリが遅いんだけどどうしたらいい？ select_related と prefetch_related の違いも教えて。'
+ASSISTANT_MESSAGE = (
+    'お兄ちゃん、N+1問題が起きてるみたいだよ！外部キーをたどるなら select_related、'
+    '逆参照や多対多なら prefetch_related を使うといいよ。'
+) * 2
+
+
+class Command(BaseCommand):
+    help = 'SisterAI 内部処理のマイクロベンチマーク（結果をJSONに保存し、ベースラインと比較）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default=DEFAULT_SIZES, help='履歴のメッセージ数（カンマ区切り）')
+        parser.add_argument('--repeat', type=int, default=5, help='計測の繰り返し回数')
+        parser.add_argument('--min-time', type=float, default=0.05, help='1回の計測の最短時間 (seconds)')
+        parser.add_argument('--filter', action='append', default=[], help='名前にこの文字列を含むものだけ実行')
+        parser.add_argument('--output', help='結果のJSON（省略時は microbench-<日時>.json）')
+        parser.add_argument('--baseline', help='比較するベースラインのJSON')
+        parser.add_argument('--max-regression', type=float, default=0.1,
+                            help='ベースラインからこの割合を超えて悪化したら失敗にする')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        except ValueError:
+            raise CommandError(f"Invalid --sizes: {options['sizes']}")
+        self.repeat = max(1, options['repeat'])
+        self.min_time = options['min_time']
+        self.filters = options['filter']
+
+        self.ai = SisterAI()
+        self.results: Dict[str, Dict[str, Any]] = {}
+
+        self._bench_prompts()
+        for size in sizes:
+            self._bench_history(size)
+
+        results = {
+            'meta': {
+                **environment(),
+                'options': {'sizes': sizes, 'repeat': self.repeat, 'min_time': self.min_time},
+            },
+            'benchmarks': self.results,
+        }
+        output = Path(options['output']) if options['output'] else default_output_path('microbench')
+        save_results(output, results)
+        self.stdout.write(f'Results saved to {output}')
+
+        if options['baseline']:
+            self._compare(results, options['baseline'], options['max_regression'])
+
+    def _bench_prompts(self):
+        ai = self.ai
+        profile = PersonalityProfile.from_values(0.95, 0.95, 0.2, 0.5, custom_name='さら', preferred_language='en')
+        for context_type in ('default', 'code_review', 'improvement_suggestion'):
+            context = {'type': context_type} if context_type != 'default' else None
+            self._time(f'build_system_prompt[{context_type}]', lambda c=context: ai._build_system_prompt(c))
+        self._time('build_system_prompt[profile]', lambda: ai._build_system_prompt({'type': 'code_review'}, profile))
+
+        def render_cold():
+            ai.prompts.invalidate()
+            return ai.prompts.render('code_review', profile)
+
+        self._time('build_system_prompt[cold]', render_cold)
+
+        small = {'name': 'sister-saas', 'language': 'Python', 'framework': 'Django', 'team_size': 3, 'stage': 'beta'}
+        large = {f'module_{i}': f'{i}番目のモジュールの説明。' * 8 for i in range(200)}
+        self._time('format_project_info[small]', lambda: ai._format_project_info(small))
+        self._time('format_project_info[large]', lambda: ai._format_project_info(large))
+
+    def _bench_history(self, size: int):
+        contents = [f'{USER_MESSAGE if i % 2 == 0 else ASSISTANT_MESSAGE} #{i}' for i in range(size)]
+        started = datetime(2024, 1, 1, 9, 0)
+        timestamps = [started + timedelta(seconds=i) for i in range(size)]
+
+        def allocate() -> List[ChatMessage]:
+            return [
+                ChatMessage(role='user' if i % 2 == 0 else 'assistant', content=contents[i], timestamp=timestamps[i])
+                for i in range(size)
+            ]
+
+        def allocate_with_content() -> List[ChatMessage]:
+            # 本文と日時も含めた1メッセージあたりのメモリを測るため、文字列もここで作る
+            return [
+                ChatMessage(
+                    role='user' if i % 2 == 0 else 'assistant',
+                    content=f'{USER_MESSAGE if i % 2 == 0 else ASSISTANT_MESSAGE} #{i}',
+                    timestamp=started + timedelta(seconds=i),
+                )
+                for i in range(size)
+            ]
+
+        name = f'chat_message_alloc[{size}]'
+        if self._time(name, allocate, size):
+            messages = allocate()
+            self.results[name]['bytes_per_message'] = round(self._memory(allocate_with_content) / size, 1)
+            self.results[name]['estimated_bytes_per_message'] = round(
+                sum(estimate_message_bytes(message) for message in messages) / size, 1
+            )
+        messages = allocate()
+
+        def append_all() -> ConversationState:
+            state = ConversationState(session_id='bench', max_messages=size)
+            for message in messages:
+                state.append(message)
+            return state
+
+        # メッセージ本体は共有しているので、こちらは deque と状態オブジェクトの分だけになる
+        name = f'history_append[{size}]'
+        if self._time(name, append_all, size):
+            self.results[name]['bytes_per_message'] = round(self._memory(append_all) / size, 1)
+
+        pool = SessionStatePool(max_messages=size, max_bytes=1 << 40)
+        state = asyncio.run(pool.get('bench'))
+        for message in messages:
+            pool.append(state, message)
+        self.ai.sessions = pool
+        self._time(f'get_chat_history[{size}]', lambda: self.ai.get_chat_history(limit=size, session_id='bench'), size)
+
+        builder = self.ai.context_builder
+        system_prompt = self.ai._build_system_prompt()
+        self._time(
+            f'history_trim[{size}]',
+            lambda: builder.build(CLAUDE_MODEL, system_prompt, messages, USER_MESSAGE, MAX_OUTPUT_TOKENS),
+            size,
+        )
+
+    def _time(self, name: str, fn: Callable[[], Any], messages: Optional[int] = None) -> bool:
+        """1回あたりの実行時間を計測（短い処理は min_time を超えるまでまとめて実行）"""
+        if self.filters and not any(f in name for f in self.filters):
+            return False
+
+        number = 1
+        while True:
+            elapsed = self._run(fn, number)
+            if elapsed >= self.min_time or number >= 1 << 20:
+                break
+            number *= max(2, min(10, int(self.min_time / max(elapsed, 1e-9)) + 1))
+        runs = [elapsed / number] + [self._run(fn, number) / number for _ in range(self.repeat - 1)]
+        runs_us = [run * 1e6 for run in runs]
+
+        median = statistics.median(runs_us)
+        result: Dict[str, Any] = {
+            'time_us': {
+                'min': round(min(runs_us), 3),
+                'median': round(median, 3),
+                'mean': round(statistics.fmean(runs_us), 3),
+            },
+            'ops_per_sec': round(1e6 / median, 1) if median else None,
+            'loops': number,
+        }
+        if messages:
+            result['messages'] = messages
+            result['per_message_us'] = round(median / messages, 4)
+        self.results[name] = result
+
+        per_message = f" ({result['per_message_us']:.4f} us/message)" if messages else ''
+        self.stdout.write(f'{name:<44} {median:>14.3f} us{per_message}')
+        return True
+
+    def _run(self, fn: Callable[[], Any], number: int) -> float:
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            started = time.perf_counter()
+            for _ in range(number):
+                fn()
+            return time.perf_counter() - started
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def _memory(self, factory: Callable[[], Any]) -> int:
+        """factory が返すオブジェクトが保持しているメモリ (bytes)"""
+        gc.collect()
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            retained = factory()
+            after = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        del retained
+        return after - before
+
+    def _compare(self, results: Dict[str, Any], baseline_path: str, max_regression: float):
+        baseline = load_results(Path(baseline_path))
+        comparisons = compare_results(
+            results['benchmarks'], baseline.get('benchmarks', {}), WATCHED, max_regression,
+        )
+        self.stdout.write(f'\nCompared with {baseline_path} (commit {baseline["meta"].get("git_commit")}):')
+        for line in format_comparison(comparisons):
+            self.stdout.write(line)
+        regressions = [c for c in comparisons if c.regressed]
+        if regressions:
+            raise CommandError(
+                f'{len(regressions)} benchmark(s) regressed by more than {max_regression:.0%}: '
+                + ', '.join(c.key for c in regressions)
+            )
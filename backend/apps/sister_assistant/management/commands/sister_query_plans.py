@@ -0,0 +1,96 @@
+"""
+よく実行するクエリの実行計画を確認する
+チャット履歴・ダッシュボード・レビューの処理を実際に呼んで発行されたSQLを記録し、それぞれ想定した
+複合インデックスを使っているかを EXPLAIN で調べ、使っていなければ失敗にする（マイグレーション後やインデックスを変えたときに実行）
+"""
+
+import uuid
+from typing import Any, Callable, List, Tuple
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from ... import views
+from ...models import ChatSession, CodeReview
+from ...services import compute_dashboard_stats, find_previous_review, load_session_history
+
+
+def hot_paths(user: User, session: ChatSession) -> List[Tuple[str, Callable[[], Any], Tuple[str, ...]]]:
+    """(名前, 処理, 使うはずのインデックス名)"""
+    request = APIRequestFactory().get('/api/v1/sister/history/')
+    force_authenticate(request, user=user)
+    review = CodeReview(user=user, title='views.py', language='python', created_at=timezone.now())
+    return [
+        ('history',
+         lambda: views.history(request),
+         ('chatsession_user_active_idx', 'chatmessage_session_ts_idx')),
+        ('load_session_history',
+         lambda: load_session_history(str(session.id), 20),
+         ('chatmessage_session_ts_idx',)),
+        ('dashboard',
+         lambda: compute_dashboard_stats(user.pk),
+         ('chatsession_user_updated_idx', 'codereview_user_created_idx', 'suggestion_user_created_idx')),
+        ('find_previous_review',
+         lambda: find_previous_review(review),
+         ('codereview_user_title_done_idx',)),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'よく実行するクエリが想定したインデックスを使っているか、実行計画で確認する'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filter', action='append', default=[], help='名前にこの文字列を含むものだけ確認')
+
+    def handle(self, *args, **options):
+        filters = options['filter']
+        failures = []
+        # 確認用のユーザーとセッションを作って処理を呼ぶので、最後にロールバックする
+        with transaction.atomic():
+            user = User.objects.create(username=f'query-plans-{uuid.uuid4().hex[:12]}')
+            session = ChatSession.objects.create(user=user)
+            self._prepare()
+
+            for name, call, indexes in hot_paths(user, session):
+                if filters and not any(f in name for f in filters):
+                    continue
+                plan = self._explain_calls(call)
+                missing = [index for index in indexes if index not in plan]
+                self.stdout.write(f"{'FAIL' if missing else 'OK  '} {name:<24} {', '.join(indexes)}")
+                if missing or options['verbosity'] >= 2:
+                    for line in plan.splitlines():
+                        self.stdout.write(f'       {line}')
+                if missing:
+                    failures.append(f"{name} ({', '.join(missing)})")
+
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError(f'{len(failures)} path(s) not using the expected index: ' + ', '.join(failures))
+
+    def _prepare(self):
+        if connection.vendor == 'postgresql':
+            # 行数の少ないテーブルでは全件走査の方が安く見積もられるので、
+            # インデックスが使えるかどうかだけを見るために走査を選ばせない（ロールバックで元に戻る）
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def _explain_calls(self, call: Callable[[], Any]) -> str:
+        """処理が発行したSELECTの実行計画をまとめて返す"""
+        with CaptureQueriesContext(connection) as captured:
+            call()
+        plans = []
+        prefix = connection.ops.explain_query_prefix()
+        with connection.cursor() as cursor:
+            for query in captured.captured_queries:
+                sql = query['sql']
+                if not sql.lstrip().upper().startswith('SELECT'):
+                    continue
+                cursor.execute(f'{prefix} {sql}')
+                plans.append(sql)
+                plans.extend(' '.join(str(column) for column in row) for row in cursor.fetchall())
+        return '\n'.join(plans)
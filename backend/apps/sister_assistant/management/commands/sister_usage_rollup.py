@@ -0,0 +1,31 @@
+"""
+AI利用量の日次集計を作り直す
+導入時や料金表を変えたときに、celery beat の対象（直近数日）より前の分までまとめて集計する
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ...services import reprice_usage, update_usage_rollups
+
+
+class Command(BaseCommand):
+    help = 'AIModelUsage から日次集計（AIModelUsageDaily）を作り直す'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=31, help='集計し直す日数（今日を含む）')
+        parser.add_argument('--reprice', action='store_true', help='先に利用記録の料金を今の料金表で計算し直す')
+
+    def handle(self, *args, **options):
+        days = options['days']
+        if days < 1:
+            raise CommandError('--days must be at least 1')
+
+        if options['reprice']:
+            updated = reprice_usage(timezone.localdate() - timedelta(days=days - 1))
+            self.stdout.write(f'Repriced {updated} usage records')
+
+        count = update_usage_rollups(days)
+        self.stdout.write(f'Rolled up {days} day(s) into {count} rows')
@@ -4,15 +4,20 @@ Sister Assistant Models
 """
 
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth.models import User
 from django.utils import timezone
 import uuid
 
 
 class ChatSession(models.Model):
-    """チャットセッション"""
+    """チャットセッション
+
+    ユーザーでの絞り込みは Meta.indexes の (user, ...) の複合インデックスを使うので、
+    user には単独のインデックスを作らない（ほかのユーザーごとのモデルも同じ）。
+    """
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_sessions')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_sessions', db_index=False)
     title = models.CharField(max_length=200, default='新しいチャット')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -20,6 +25,13 @@ class ChatSession(models.Model):
     
     class Meta:
         ordering = ['-updated_at']
+        indexes = [
+            models.Index(fields=['updated_at']),
+            models.Index(fields=['user', '-updated_at'], name='chatsession_user_updated_idx'),
+            # 使用中のセッションを探す（get_or_create_chat_session・history）
+            models.Index(fields=['user', '-updated_at'], condition=Q(is_active=True),
+                         name='chatsession_user_active_idx'),
+        ]
         verbose_name = 'チャットセッション'
         verbose_name_plural = 'チャットセッション'
     
@@ -36,7 +48,8 @@ class ChatMessage(models.Model):
     ]
     
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    session = models.ForeignKey(ChatSession, on_delete=models.CASCADE, related_name='messages')
+    # セッションでの絞り込みは (session, timestamp) の複合インデックスを使うので、単独のインデックスは作らない
+    session = models.ForeignKey(ChatSession, on_delete=models.CASCADE, related_name='messages', db_index=False)
     role = models.CharField(max_length=20, choices=ROLE_CHOICES)
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
@@ -49,11 +62,18 @@ class ChatMessage(models.Model):
     
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # 管理画面の日付での絞り込み・新しい順の一覧用
+            models.Index(fields=['timestamp']),
+            # セッションの履歴（古い順・新しい順どちらも）
+            models.Index(fields=['session', 'timestamp'], name='chatmessage_session_ts_idx'),
+        ]
         verbose_name = 'チャットメッセージ'
         verbose_name_plural = 'チャットメッセージ'
     
     def __str__(self):
-        return f"{self.session.title} - {self.role}: {self.content[:50]}..."
+        # セッションを読み込まないよう、タイトルではなくIDを出す
+        return f"{self.session_id} - {self.role}: {self.content[:50]}..."
 
 
 class CodeReview(models.Model):
@@ -77,7 +97,7 @@ class CodeReview(models.Model):
     ]
     
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='code_reviews')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='code_reviews', db_index=False)
     title = models.CharField(max_length=200)
     language = models.CharField(max_length=20, choices=LANGUAGE_CHOICES, default='python')
     original_code = models.TextField()
@@ -90,9 +110,16 @@ class CodeReview(models.Model):
     completed_at = models.DateTimeField(null=True, blank=True)
     ai_model = models.CharField(max_length=50, blank=True)
     tokens_used = models.IntegerField(default=0)
+    served_from_cache = models.BooleanField(default=False, help_text='キャッシュ済みの結果を返したか')
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='codereview_user_created_idx'),
+            # 同じファイルの前回のレビュー（find_previous_review）
+            models.Index(fields=['user', 'title', '-created_at'], condition=Q(status='completed'),
+                         name='codereview_user_title_done_idx'),
+        ]
         verbose_name = 'コードレビュー'
         verbose_name_plural = 'コードレビュー'
     
@@ -104,6 +131,12 @@ class CodeReview(models.Model):
         self.status = 'completed'
         self.completed_at = timezone.now()
         self.save()
+    
+    def mark_failed(self):
+        """レビュー失敗をマーク"""
+        self.status = 'failed'
+        self.completed_at = timezone.now()
+        self.save()
 
 
 class ProjectSuggestion(models.Model):
@@ -126,7 +159,7 @@ class ProjectSuggestion(models.Model):
     ]
     
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='project_suggestions')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='project_suggestions', db_index=False)
     title = models.CharField(max_length=200)
     description = models.TextField()
     suggestion_type = models.CharField(max_length=20, choices=SUGGESTION_TYPE)
@@ -146,6 +179,7 @@ class ProjectSuggestion(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [models.Index(fields=['user', '-created_at'], name='suggestion_user_created_idx')]
         verbose_name = 'プロジェクト提案'
         verbose_name_plural = 'プロジェクト提案'
     
@@ -171,6 +205,7 @@ class SisterPersonalityConfig(models.Model):
     # 学習設定
     learn_from_interactions = models.BooleanField(default=True)
     remember_preferences = models.BooleanField(default=True)
+    use_response_cache = models.BooleanField(default=True, help_text='似た質問への応答キャッシュを使う')
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -209,6 +244,9 @@ class UserInteraction(models.Model):
     
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['timestamp']),
+        ]
         verbose_name = 'ユーザーインタラクション'
         verbose_name_plural = 'ユーザーインタラクション'
     
@@ -239,6 +277,10 @@ class AIModelUsage(models.Model):
     
     class Meta:
         ordering = ['-timestamp']
+        # 日次集計は直近の期間だけを読み直すので、日時で範囲を絞れるようにする（管理画面の日付の絞り込みにも使う）
+        indexes = [
+            models.Index(fields=['timestamp']),
+        ]
         verbose_name = 'AIモデル使用統計'
         verbose_name_plural = 'AIモデル使用統計'
     
@@ -247,4 +289,55 @@ class AIModelUsage(models.Model):
     
     @property
     def total_tokens(self):
-        return self.tokens_input + self.tokens_output
\ No newline at end of file
+        return self.tokens_input + self.tokens_output
+
+
+class AIModelPrice(models.Model):
+    """AI モデルの料金表（AIModelUsage.cost_estimate の計算に使う）"""
+    model_name = models.CharField(max_length=50, unique=True, choices=AIModelUsage.MODEL_CHOICES)
+    input_price = models.DecimalField(max_digits=10, decimal_places=4, default=0,
+                                      help_text='入力100万トークンあたりの料金 (USD)')
+    output_price = models.DecimalField(max_digits=10, decimal_places=4, default=0,
+                                       help_text='出力100万トークンあたりの料金 (USD)')
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['model_name']
+        verbose_name = 'AIモデル料金'
+        verbose_name_plural = 'AIモデル料金'
+    
+    def __str__(self):
+        return f"{self.model_name} ({self.input_price} / {self.output_price})"
+
+
+class AIModelUsageDaily(models.Model):
+    """AI モデル使用統計の日次集計（ユーザー・モデル・機能・日ごと）"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ai_usage_daily', db_index=False)
+    model_name = models.CharField(max_length=50, choices=AIModelUsage.MODEL_CHOICES)
+    feature_used = models.CharField(max_length=50)
+    date = models.DateField()
+    
+    calls = models.IntegerField(default=0)
+    tokens_input = models.BigIntegerField(default=0)
+    tokens_output = models.BigIntegerField(default=0)
+    cost_estimate = models.DecimalField(max_digits=14, decimal_places=6, default=0)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-date', 'user', 'model_name', 'feature_used']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'model_name', 'feature_used', 'date'], name='unique_ai_usage_daily',
+            ),
+        ]
+        indexes = [models.Index(fields=['date'])]
+        verbose_name = 'AIモデル使用統計（日次）'
+        verbose_name_plural = 'AIモデル使用統計（日次）'
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.model_name} - {self.feature_used} - {self.date}"
+    
+    @property
+    def total_tokens(self):
+        return self.tokens_input + self.tokens_output
@@ -0,0 +1,12 @@
+"""
+Sister Assistant WebSocket Routing
+紗良アシスタント機能のWebSocketルーティング
+"""
+
+from django.urls import path
+
+from . import consumers
+
+websocket_urlpatterns = [
+    path('ws/sister/chat/', consumers.SisterChatConsumer.as_asgi()),
+]
@@ -0,0 +1,601 @@
+"""
+Sister Assistant Services
+Django設定と紗良AIサービスをつなぐヘルパー
+"""
+
+import atexit
+import calendar
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import close_old_connections, connection, transaction
+from django.db.models import CharField, Count, DecimalField, ExpressionWrapper, F, Sum, Value, Window
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from ai_assistant.services.sister_ai import (
+    ChatMessage as SisterChatMessage,
+    ChatResult,
+    ReviewResult,
+    SisterAI,
+    get_sister_ai as _get_sister_ai,
+)
+from ai_assistant.services.circuit_breaker import CircuitBreakerConfig
+from ai_assistant.services.context_builder import ContextBuilder
+from ai_assistant.services.fake_provider import FakeProviderConfig, FakeProviderTransport
+from ai_assistant.services.hedging import HedgingConfig
+from ai_assistant.services.prompt_templates import PersonalityProfile
+from ai_assistant.services.providers import ProviderClientConfig
+from ai_assistant.services.rate_limit import RateLimitConfig, RateLimiter
+from ai_assistant.services.review_cache import ReviewCache, ReviewCacheConfig
+from ai_assistant.services.review_chunks import ReviewChunkingConfig
+from ai_assistant.services.review_diff import IncrementalReviewConfig
+from ai_assistant.services.scheduler import SchedulerConfig
+from ai_assistant.services.semantic_cache import SemanticCache, SemanticCacheConfig
+from ai_assistant.services.session_pool import SessionStatePool
+from ai_assistant.services.singleflight import SingleFlightConfig
+from ai_assistant.services.write_buffer import WriteBehindBuffer, WriteBufferConfig
+
+from .models import (
+    AIModelPrice,
+    AIModelUsage,
+    AIModelUsageDaily,
+    ChatMessage,
+    ChatSession,
+    CodeReview,
+    ProjectSuggestion,
+    SisterPersonalityConfig,
+    UserInteraction,
+)
+
+_session_pool = None
+_rate_limiter = None
+_telemetry_buffer = None
+
+# 利用記録の種類ごとの保存先
+TELEMETRY_MODELS = {
+    'usage': AIModelUsage,
+    'interaction': UserInteraction,
+}
+
+# ダッシュボードに出す一覧: (モデル, 件数のキー, 最新の一覧のキー, 並び順の日時, 一覧に含める項目)
+DASHBOARD_SECTIONS = (
+    (ChatSession, 'chat_sessions', 'recent_chats', 'updated_at', ()),
+    (CodeReview, 'code_reviews', 'recent_reviews', 'created_at', ('status', 'language')),
+    (ProjectSuggestion, 'suggestions', 'recent_suggestions', 'created_at', ('priority', 'suggestion_type')),
+)
+DASHBOARD_RECENT_LIMIT = 5
+
+# プロンプトに反映する紗良設定の項目
+PROFILE_FIELDS = (
+    'friendliness', 'technical_depth', 'helpfulness', 'casualness',
+    'custom_name', 'custom_greeting', 'preferred_language',
+)
+
+
+def load_session_history(session_id: str, limit: int) -> List[SisterChatMessage]:
+    """ChatMessage から最新 limit 件の会話履歴を古い順に復元"""
+    rows = (
+        ChatMessage.objects
+        .filter(session_id=session_id, role__in=['user', 'assistant'])
+        .order_by('-timestamp')
+        .values_list('role', 'content', 'timestamp', 'metadata')[:limit]
+    )
+    return [
+        SisterChatMessage(role=role, content=content, timestamp=timestamp, metadata=metadata or None)
+        for role, content, timestamp, metadata in reversed(list(rows))
+    ]
+
+
+def count_session_messages(session_id: str) -> int:
+    """セッションの永続化済みの会話メッセージ数（ワーカーごとのプールの履歴が古くないかの確認用）"""
+    return ChatMessage.objects.filter(session_id=session_id, role__in=['user', 'assistant']).count()
+
+
+def get_session_pool() -> SessionStatePool:
+    """ワーカープロセス共通のセッションプールを取得"""
+    global _session_pool
+    if _session_pool is None:
+        _session_pool = SessionStatePool(
+            loader=sync_to_async(load_session_history),
+            version_loader=sync_to_async(count_session_messages),
+            max_sessions=settings.SISTER_AI_SESSION_MAX_SESSIONS,
+            max_bytes=settings.SISTER_AI_SESSION_MAX_BYTES,
+            ttl=settings.SISTER_AI_SESSION_TTL,
+            max_messages=settings.SISTER_AI_SESSION_MAX_MESSAGES,
+        )
+    return _session_pool
+
+
+def get_rate_limiter() -> RateLimiter:
+    """ワーカープロセス共通のレート制限を取得"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter(RateLimitConfig(
+            enabled=settings.SISTER_AI_RATE_LIMIT_ENABLED,
+            redis_url=settings.REDIS_URL if settings.SISTER_AI_RATE_LIMIT_SHARED else None,
+            user_requests_per_minute=settings.SISTER_AI_RATE_LIMIT_USER_REQUESTS,
+            user_tokens_per_minute=settings.SISTER_AI_RATE_LIMIT_USER_TOKENS,
+            global_requests_per_minute=settings.SISTER_AI_RATE_LIMIT_GLOBAL_REQUESTS,
+            global_tokens_per_minute=settings.SISTER_AI_RATE_LIMIT_GLOBAL_TOKENS,
+        ))
+    return _rate_limiter
+
+
+def get_provider_client_config() -> ProviderClientConfig:
+    """プロバイダーのHTTPクライアント設定（擬似プロバイダーを使う場合はその接続先も）"""
+    client_config = ProviderClientConfig(
+        max_connections=settings.SISTER_AI_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.SISTER_AI_HTTP_MAX_KEEPALIVE,
+        connect_timeout=settings.SISTER_AI_HTTP_CONNECT_TIMEOUT,
+        read_timeout=settings.SISTER_AI_HTTP_READ_TIMEOUT,
+        prewarm_connections=settings.SISTER_AI_HTTP_PREWARM_CONNECTIONS,
+    )
+    backend = settings.SISTER_AI_PROVIDER_BACKEND
+    if backend == 'fake':
+        client_config.transport = FakeProviderTransport(FakeProviderConfig(**settings.SISTER_AI_FAKE_PROVIDER))
+    elif backend == 'fake_server':
+        url = settings.SISTER_AI_FAKE_PROVIDER_URL.rstrip('/')
+        client_config.anthropic_base_url = url
+        client_config.openai_base_url = f'{url}/v1'
+    return client_config
+
+
+def provider_api_key(key: str) -> Optional[str]:
+    """擬似プロバイダーではAPIキーがなくても両方のプロバイダーを有効にする"""
+    if settings.SISTER_AI_PROVIDER_BACKEND != 'live':
+        return key or 'fake'
+    return key or None
+
+
+def get_sister_ai() -> SisterAI:
+    """設定済みのAPIキーでSister AIを取得"""
+    return _get_sister_ai(
+        openai_api_key=provider_api_key(settings.OPENAI_API_KEY),
+        anthropic_api_key=provider_api_key(settings.ANTHROPIC_API_KEY),
+        session_pool=get_session_pool(),
+        context_builder=ContextBuilder(
+            budgets=settings.SISTER_AI_CONTEXT_BUDGETS,
+            default_budget=settings.SISTER_AI_CONTEXT_DEFAULT_BUDGET,
+        ),
+        client_config=get_provider_client_config(),
+        hedging=HedgingConfig(
+            enabled=settings.SISTER_AI_HEDGING_ENABLED,
+            percentile=settings.SISTER_AI_HEDGING_PERCENTILE,
+            initial_delay=settings.SISTER_AI_HEDGING_INITIAL_DELAY,
+            min_delay=settings.SISTER_AI_HEDGING_MIN_DELAY,
+            max_delay=settings.SISTER_AI_HEDGING_MAX_DELAY,
+        ),
+        circuit_breaker=CircuitBreakerConfig(
+            enabled=settings.SISTER_AI_CIRCUIT_BREAKER_ENABLED,
+            window=settings.SISTER_AI_CIRCUIT_BREAKER_WINDOW,
+            min_calls=settings.SISTER_AI_CIRCUIT_BREAKER_MIN_CALLS,
+            error_rate_threshold=settings.SISTER_AI_CIRCUIT_BREAKER_ERROR_RATE,
+            slow_call_threshold=settings.SISTER_AI_CIRCUIT_BREAKER_SLOW_CALL,
+            open_duration=settings.SISTER_AI_CIRCUIT_BREAKER_OPEN_DURATION,
+            redis_url=settings.REDIS_URL if settings.SISTER_AI_CIRCUIT_BREAKER_SHARED else None,
+        ),
+        review_cache=ReviewCache(cache, ReviewCacheConfig(
+            enabled=settings.SISTER_AI_REVIEW_CACHE_ENABLED,
+            ttl=settings.SISTER_AI_REVIEW_CACHE_TTL,
+            normalize=settings.SISTER_AI_REVIEW_CACHE_NORMALIZE,
+            max_entry_bytes=settings.SISTER_AI_REVIEW_CACHE_MAX_ENTRY_BYTES,
+        )),
+        semantic_cache=SemanticCache(SemanticCacheConfig(
+            enabled=settings.SISTER_AI_SEMANTIC_CACHE_ENABLED,
+            threshold=settings.SISTER_AI_SEMANTIC_CACHE_THRESHOLD,
+            ttl=settings.SISTER_AI_SEMANTIC_CACHE_TTL,
+            max_entries=settings.SISTER_AI_SEMANTIC_CACHE_MAX_ENTRIES,
+            max_bytes=settings.SISTER_AI_SEMANTIC_CACHE_MAX_BYTES,
+        )),
+        singleflight=SingleFlightConfig(
+            enabled=settings.SISTER_AI_SINGLEFLIGHT_ENABLED,
+            redis_url=settings.REDIS_URL if settings.SISTER_AI_SINGLEFLIGHT_SHARED else None,
+            lock_ttl=settings.SISTER_AI_SINGLEFLIGHT_LOCK_TTL,
+        ),
+        review_chunking=ReviewChunkingConfig(
+            enabled=settings.SISTER_AI_REVIEW_CHUNKING_ENABLED,
+            threshold_tokens=settings.SISTER_AI_REVIEW_CHUNK_THRESHOLD,
+            max_chunk_tokens=settings.SISTER_AI_REVIEW_CHUNK_MAX_TOKENS,
+            max_parallel=settings.SISTER_AI_REVIEW_CHUNK_PARALLEL,
+        ),
+        incremental_review=IncrementalReviewConfig(
+            enabled=settings.SISTER_AI_REVIEW_INCREMENTAL_ENABLED,
+            min_tokens=settings.SISTER_AI_REVIEW_INCREMENTAL_MIN_TOKENS,
+            max_changed_ratio=settings.SISTER_AI_REVIEW_INCREMENTAL_MAX_CHANGED_RATIO,
+        ),
+        prompt_cache=cache,
+        scheduler=SchedulerConfig(
+            enabled=settings.SISTER_AI_SCHEDULER_ENABLED,
+            max_concurrency=settings.SISTER_AI_SCHEDULER_MAX_CONCURRENCY,
+            provider_limits=settings.SISTER_AI_SCHEDULER_PROVIDER_LIMITS,
+            reserved_interactive=settings.SISTER_AI_SCHEDULER_RESERVED_INTERACTIVE,
+            max_wait=settings.SISTER_AI_SCHEDULER_MAX_WAIT,
+        ),
+    )
+
+
+def personality_cache_key(user_id) -> str:
+    return f'sister_ai:personality:{user_id}'
+
+
+def get_personality_settings(user) -> Dict[str, Any]:
+    """お兄ちゃんの紗良設定（キャッシュ済み。保存時に破棄される。設定がなければ空）"""
+    key = personality_cache_key(user.pk)
+    values = cache.get(key)
+    if values is None:
+        values = (
+            SisterPersonalityConfig.objects
+            .filter(user=user)
+            .values(*PROFILE_FIELDS, 'use_response_cache')
+            .first()
+        ) or {}
+        cache.set(key, values, settings.SISTER_AI_PERSONALITY_CACHE_TTL)
+    return values
+
+
+def get_personality_profile(user) -> Optional[PersonalityProfile]:
+    """システムプロンプトに反映する性格設定（設定がなければ None）"""
+    values = get_personality_settings(user)
+    if not values:
+        return None
+    return PersonalityProfile.from_values(**{field: values[field] for field in PROFILE_FIELDS})
+
+
+def uses_response_cache(user) -> bool:
+    """お兄ちゃんが類似応答キャッシュを使う設定か（設定がなければ使う）"""
+    return get_personality_settings(user).get('use_response_cache', True) is not False
+
+
+def dashboard_stats_cache_key(user_id) -> str:
+    return f'sister_ai:dashboard:{user_id}'
+
+
+def _dashboard_section_query(user_id, model, timestamp: str, fields: Sequence[str]):
+    """最新の数件と、その各行に付けたユーザーの全件数（union できるよう列をそろえる）"""
+    extra = [F(field) for field in fields] + [Value('', output_field=CharField())] * (2 - len(fields))
+    return (
+        model.objects
+        .filter(user_id=user_id)
+        .annotate(
+            section=Value(model._meta.model_name, output_field=CharField()),
+            item_id=F('id'),
+            item_title=F('title'),
+            item_at=F(timestamp),
+            extra_1=extra[0],
+            extra_2=extra[1],
+            total=Window(Count('id')),
+        )
+        .values('section', 'item_id', 'item_title', 'item_at', 'extra_1', 'extra_2', 'total')
+        .order_by('-item_at')[:DASHBOARD_RECENT_LIMIT]
+    )
+
+
+def compute_dashboard_stats(user_id) -> Dict[str, Any]:
+    """ダッシュボードの件数と最新の一覧をまとめて取得
+
+    各一覧の行に件数を付けて union するので、対応しているDB（PostgreSQL）では1回のクエリで済む。
+    """
+    queries = [
+        _dashboard_section_query(user_id, model, timestamp, fields)
+        for model, _, _, timestamp, fields in DASHBOARD_SECTIONS
+    ]
+    if connection.features.supports_slicing_ordering_in_compound:
+        rows = list(queries[0].union(*queries[1:], all=True))
+    else:
+        rows = [row for query in queries for row in query]
+
+    snapshot: Dict[str, Any] = {'stats': {}}
+    for model, count_key, recent_key, timestamp, fields in DASHBOARD_SECTIONS:
+        section = sorted(
+            (row for row in rows if row['section'] == model._meta.model_name),
+            key=lambda row: row['item_at'], reverse=True,
+        )
+        snapshot['stats'][count_key] = section[0]['total'] if section else 0
+        snapshot[recent_key] = [
+            {
+                'id': row['item_id'],
+                'title': row['item_title'],
+                timestamp: row['item_at'],
+                **{field: row[f'extra_{i}'] for i, field in enumerate(fields, 1)},
+            }
+            for row in section
+        ]
+    return snapshot
+
+
+def get_dashboard_stats(user_id) -> Dict[str, Any]:
+    """ダッシュボードの件数と最新の一覧（キャッシュ済み。チャット・レビュー・提案の保存・削除時に破棄され、
+    チャットのメッセージの保存では最新のチャットの一覧だけを更新する）"""
+    key = dashboard_stats_cache_key(user_id)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = compute_dashboard_stats(user_id)
+        cache.set(key, snapshot, settings.DASHBOARD_STATS_CACHE_TTL)
+    return snapshot
+
+
+def touch_dashboard_chat(session: ChatSession):
+    """メッセージの保存で更新日時だけが変わったセッションを、キャッシュ済みの最新の一覧の先頭に移す
+
+    件数は変わらないので、チャットのたびにダッシュボード全体を計算し直さないようにする。
+    """
+    key = dashboard_stats_cache_key(session.user_id)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        return
+    recent = [chat for chat in snapshot['recent_chats'] if chat['id'] != session.pk]
+    recent.insert(0, {'id': session.pk, 'title': session.title, 'updated_at': session.updated_at})
+    snapshot['recent_chats'] = recent[:DASHBOARD_RECENT_LIMIT]
+    cache.set(key, snapshot, settings.DASHBOARD_STATS_CACHE_TTL)
+
+
+def default_review_title(language: str) -> str:
+    """タイトルが指定されなかったレビューのタイトル"""
+    return f'{language} code review'
+
+
+def find_previous_review(review: CodeReview) -> Optional[Dict[str, Any]]:
+    """同じタイトル（ファイル）で前回完了したレビュー（タイトル未指定なら探さない）"""
+    if review.title == default_review_title(review.language):
+        return None
+    return (
+        CodeReview.objects
+        .filter(user_id=review.user_id, title=review.title, language=review.language,
+                status='completed', created_at__lt=review.created_at)
+        .exclude(id=review.id)
+        .order_by('-created_at')
+        .values('original_code', 'review_result', 'suggestions')
+        .first()
+    )
+
+
+async def perform_code_review(review: CodeReview, previous: Optional[Dict[str, Any]] = None) -> ReviewResult:
+    """コードレビューを実行（前回のレビューがあれば差分だけをレビュー）"""
+    sister_ai = get_sister_ai()
+    if previous:
+        return await sister_ai.review_changes(
+            review.original_code, review.language,
+            previous['original_code'], previous['review_result'], previous['suggestions'],
+        )
+    return await sister_ai.review_code(review.original_code, review.language)
+
+
+def user_group_name(user_id) -> str:
+    """お兄ちゃんごとの通知用チャネルグループ名"""
+    return f"sister_chat_{user_id}"
+
+
+def notify_user(user_id, event: Dict[str, Any]):
+    """チャネルレイヤー経由で接続中のWebSocketにイベントを送る（同期コード用）"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    async_to_sync(channel_layer.group_send)(user_group_name(user_id), event)
+
+
+def get_or_create_chat_session(user, session_id: Optional[str] = None) -> ChatSession:
+    """お兄ちゃんのチャットセッションを取得（なければ作成）"""
+    if session_id:
+        try:
+            return ChatSession.objects.get(id=session_id, user=user)
+        except (ChatSession.DoesNotExist, ValidationError):
+            pass
+
+    session = ChatSession.objects.filter(user=user, is_active=True).first()
+    return session or ChatSession.objects.create(user=user)
+
+
+def save_chat_exchange(session: ChatSession, message: str, response: ChatResult,
+                       context: Optional[Dict[str, Any]] = None):
+    """ユーザーのメッセージと紗良の応答を保存（応答にはモデル・トークン数・所要時間の内訳も残す）"""
+    ChatMessage.objects.bulk_create([
+        ChatMessage(session=session, role='user', content=message, metadata=context or {}),
+        ChatMessage(
+            session=session,
+            role='assistant',
+            content=response.text,
+            metadata={'telemetry': response.telemetry()},
+            ai_model=response.model or None,
+            tokens_used=response.tokens_used,
+            response_time=response.latency,
+        ),
+    ])
+    # 並び順 (-updated_at) を更新
+    session.save(update_fields=['updated_at'])
+    # このワーカーのプールには応答時に追加済みなので、保存した分だけ版を進める
+    get_session_pool().record_saved(str(session.id), 2)
+
+
+def usage_model_name(model: str) -> str:
+    """AIModelUsage.model_name の値（日付付きのモデル名は選択肢の名前にまとめる）"""
+    for name, _ in AIModelUsage.MODEL_CHOICES:
+        if model == name or model.startswith(f'{name}-'):
+            return name
+    return model
+
+
+def model_prices_cache_key() -> str:
+    return 'sister_ai:model_prices'
+
+
+def get_model_prices() -> Dict[str, Tuple[Decimal, Decimal]]:
+    """モデルごとの100万トークンあたりの料金（入力, 出力）（キャッシュ済み。料金表の保存時に破棄される）"""
+    key = model_prices_cache_key()
+    prices = cache.get(key)
+    if prices is None:
+        prices = {
+            name: (input_price, output_price)
+            for name, input_price, output_price in
+            AIModelPrice.objects.values_list('model_name', 'input_price', 'output_price')
+        }
+        cache.set(key, prices, None)
+    return prices
+
+
+def estimate_cost(model_name: str, tokens_input: int, tokens_output: int,
+                  prices: Optional[Dict[str, Tuple[Decimal, Decimal]]] = None) -> Decimal:
+    """料金表から1回分の料金を見積もる（料金表にないモデルは0）"""
+    if prices is None:
+        prices = get_model_prices()
+    if model_name not in prices:
+        return Decimal(0)
+    input_price, output_price = prices[model_name]
+    cost = (input_price * tokens_input + output_price * tokens_output) / 1_000_000
+    return cost.quantize(Decimal('0.000001'))
+
+
+def write_telemetry_rows(kind: str, rows: List[Dict[str, Any]]):
+    """バッファにたまった利用記録をまとめて保存（AIModelUsage には料金を入れる）"""
+    model = TELEMETRY_MODELS[kind]
+    if kind == 'usage':
+        prices = get_model_prices()
+        for row in rows:
+            row['cost_estimate'] = estimate_cost(row['model_name'], row['tokens_input'], row['tokens_output'], prices)
+    model.objects.bulk_create([model(**row) for row in rows])
+
+
+def get_telemetry_buffer() -> WriteBehindBuffer:
+    """ワーカープロセス共通の利用記録バッファを取得（プロセス終了時に残りを書き込む）"""
+    global _telemetry_buffer
+    if _telemetry_buffer is None:
+        _telemetry_buffer = WriteBehindBuffer(
+            write_telemetry_rows,
+            WriteBufferConfig(
+                enabled=settings.SISTER_AI_TELEMETRY_BUFFER_ENABLED,
+                redis_url=settings.REDIS_URL if settings.SISTER_AI_TELEMETRY_BUFFER_SHARED else None,
+                batch_size=settings.SISTER_AI_TELEMETRY_BATCH_SIZE,
+                flush_interval=settings.SISTER_AI_TELEMETRY_FLUSH_INTERVAL,
+                max_buffered=settings.SISTER_AI_TELEMETRY_MAX_BUFFERED,
+            ),
+            release=close_old_connections,
+        )
+        atexit.register(_telemetry_buffer.close)
+    return _telemetry_buffer
+
+
+def flush_telemetry_buffer():
+    """ためている利用記録を書き込む（Celeryのワーカープロセス終了時など、atexit が呼ばれない場合用）"""
+    if _telemetry_buffer is not None:
+        _telemetry_buffer.close()
+
+
+def record_ai_usage(user_id, feature: str, result: Union[ChatResult, ReviewResult], content: str,
+                    session_id: str = '', context: Optional[Dict[str, Any]] = None):
+    """AIへのリクエスト1回分の利用記録（AIModelUsage と UserInteraction）を積む
+
+    書き込みはバッファがまとめて bulk_create するので、リクエストの処理時間にはほぼ影響しない。
+    キャッシュや共有した結果などプロバイダーを呼ばなかった場合は AIModelUsage を残さない。
+    """
+    buffer = get_telemetry_buffer()
+    if result.model and result.tokens_used:
+        buffer.add('usage', {
+            'user_id': user_id,
+            'model_name': usage_model_name(result.model),
+            'tokens_input': result.input_tokens,
+            'tokens_output': result.output_tokens,
+            'feature_used': feature,
+            'session_id': session_id,
+        })
+    buffer.add('interaction', {
+        'user_id': user_id,
+        'interaction_type': feature,
+        'content': content,
+        'response': result.text,
+        'session_id': session_id,
+        'context_data': context or {},
+    })
+
+
+def update_usage_rollups(days: int = 2) -> int:
+    """直近 days 日（今日を含む）の AIModelUsage を集計し直して日次集計に保存し、集計の行数を返す
+
+    対象の日の集計は毎回作り直すので、何度実行しても結果は同じで、
+    バッファ経由で遅れて書き込まれた利用記録も次の実行で反映される。
+    """
+    start = timezone.localdate() - timedelta(days=max(1, days) - 1)
+    since = timezone.make_aware(datetime.combine(start, time.min))
+    rows = (
+        AIModelUsage.objects
+        .filter(timestamp__gte=since)
+        .annotate(date=TruncDate('timestamp'))
+        .values('user_id', 'model_name', 'feature_used', 'date')
+        .annotate(
+            total_calls=Count('id'),
+            total_input=Sum('tokens_input'),
+            total_output=Sum('tokens_output'),
+            total_cost=Sum('cost_estimate'),
+        )
+        .order_by()
+    )
+    daily = [
+        AIModelUsageDaily(
+            user_id=row['user_id'],
+            model_name=row['model_name'],
+            feature_used=row['feature_used'],
+            date=row['date'],
+            calls=row['total_calls'],
+            tokens_input=row['total_input'],
+            tokens_output=row['total_output'],
+            cost_estimate=row['total_cost'],
+        )
+        for row in rows
+    ]
+    with transaction.atomic():
+        AIModelUsageDaily.objects.filter(date__gte=start).delete()
+        AIModelUsageDaily.objects.bulk_create(daily, batch_size=1000)
+    return len(daily)
+
+
+def reprice_usage(since: date) -> int:
+    """since 以降の AIModelUsage の料金を今の料金表で計算し直し、更新した行数を返す
+
+    料金表を登録・変更する前の利用記録に料金を入れる場合に使う（日次集計は別途作り直す）。
+    """
+    usages = AIModelUsage.objects.filter(timestamp__gte=timezone.make_aware(datetime.combine(since, time.min)))
+    updated = 0
+    for model_name, (input_price, output_price) in get_model_prices().items():
+        cost = (
+            F('tokens_input') * Value(input_price / 1_000_000)
+            + F('tokens_output') * Value(output_price / 1_000_000)
+        )
+        updated += usages.filter(model_name=model_name).update(
+            cost_estimate=ExpressionWrapper(cost, output_field=DecimalField(max_digits=10, decimal_places=6)),
+        )
+    return updated
+
+
+def usage_summary(start: date, end: date, by: Sequence[str] = ('model_name',),
+                  user_id=None) -> List[Dict[str, Any]]:
+    """日次集計から期間 [start, end] の利用回数・トークン数・料金を by の項目ごとに合計
+
+    by には user / model_name / feature_used / date を指定できる。
+    生の利用記録は読まないので、今日の分は最後に集計した時点までになる。
+    """
+    usages = AIModelUsageDaily.objects.filter(date__range=(start, end))
+    if user_id is not None:
+        usages = usages.filter(user_id=user_id)
+    return list(
+        usages
+        .values(*by)
+        .annotate(
+            total_calls=Sum('calls'),
+            total_input=Sum('tokens_input'),
+            total_output=Sum('tokens_output'),
+            total_cost=Sum('cost_estimate'),
+        )
+        .order_by(*by)
+    )
+
+
+def monthly_usage(year: int, month: int, by: Sequence[str] = ('model_name',),
+                  user_id=None) -> List[Dict[str, Any]]:
+    """1か月分の利用量と料金（usage_summary を月の初日から末日で呼ぶ）"""
+    last_day = calendar.monthrange(year, month)[1]
+    return usage_summary(date(year, month, 1), date(year, month, last_day), by, user_id)
@@ -0,0 +1,47 @@
+"""
+Sister Assistant Signals
+紗良設定・料金表・ダッシュボードの元データの変更をキャッシュに反映するシグナルハンドラー
+"""
+
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import AIModelPrice, ChatSession, CodeReview, ProjectSuggestion, SisterPersonalityConfig
+from .services import dashboard_stats_cache_key, model_prices_cache_key, personality_cache_key, touch_dashboard_chat
+
+
+@receiver(post_save, sender=SisterPersonalityConfig)
+@receiver(post_delete, sender=SisterPersonalityConfig)
+def invalidate_personality_cache(sender, instance, **kwargs):
+    """保存・削除された紗良設定のキャッシュを破棄
+
+    描画済みのプロンプトは設定の内容のハッシュをキーにしているので、
+    ここで設定のキャッシュを消せば次のリクエストから新しいプロンプトが使われる。
+    """
+    cache.delete(personality_cache_key(instance.user_id))
+
+
+@receiver(post_save, sender=AIModelPrice)
+@receiver(post_delete, sender=AIModelPrice)
+def invalidate_model_prices_cache(sender, instance, **kwargs):
+    """料金表のキャッシュを破棄（以後に書き込む利用記録から新しい料金で計算する）"""
+    cache.delete(model_prices_cache_key())
+
+
+@receiver(post_save, sender=ChatSession)
+@receiver(post_delete, sender=ChatSession)
+@receiver(post_save, sender=CodeReview)
+@receiver(post_delete, sender=CodeReview)
+@receiver(post_save, sender=ProjectSuggestion)
+@receiver(post_delete, sender=ProjectSuggestion)
+def invalidate_dashboard_stats(sender, instance, update_fields=None, **kwargs):
+    """件数や最新の一覧が変わるので、そのユーザーのダッシュボードのキャッシュを破棄
+
+    チャットのメッセージの保存（セッションの updated_at だけの更新）では件数が変わらないので、
+    破棄せずに最新のチャットの一覧だけを更新する。
+    """
+    if sender is ChatSession and update_fields == frozenset({'updated_at'}):
+        touch_dashboard_chat(instance)
+        return
+    cache.delete(dashboard_stats_cache_key(instance.user_id))
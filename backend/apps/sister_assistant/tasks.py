@@ -0,0 +1,102 @@
+"""
+Sister Assistant Tasks
+紗良アシスタントのバックグラウンドジョブ（Celery）
+"""
+
+import asyncio
+import logging
+from typing import Optional
+
+from celery import shared_task
+from django.conf import settings
+from celery.signals import worker_process_init, worker_process_shutdown
+
+from ai_assistant.services.scheduler import BACKGROUND, request_scope
+from ai_assistant.services.sister_ai import CANNED_RESPONSES
+
+from .models import CodeReview
+from .services import (
+    find_previous_review,
+    flush_telemetry_buffer,
+    get_sister_ai,
+    notify_user,
+    perform_code_review,
+    record_ai_usage,
+    update_usage_rollups,
+)
+
+logger = logging.getLogger(__name__)
+
+_event_loop = None
+
+
+def run_async(coro):
+    """ワーカープロセスで使い回すイベントループでコルーチンを実行
+
+    ループ単位で保持しているAPIクライアントとHTTPコネクションを
+    タスクをまたいで再利用するため、タスクごとにループを作らない。
+    """
+    global _event_loop
+    if _event_loop is None or _event_loop.is_closed():
+        _event_loop = asyncio.new_event_loop()
+    return _event_loop.run_until_complete(coro)
+
+
+@shared_task(acks_late=True, ignore_result=True)
+def run_code_review(review_id: str):
+    """保留中のコードレビューを実行して結果を保存し、お兄ちゃんに通知"""
+    review = CodeReview.objects.filter(id=review_id, status='pending').first()
+    if review is None:
+        # 処理済み（再配信された場合など）
+        return
+
+    try:
+        # キューに積まれたレビューはチャットや画面からのレビューより後回しにする
+        with request_scope(BACKGROUND, user=review.user_id):
+            result = run_async(perform_code_review(review, find_previous_review(review)))
+    except Exception as e:
+        logger.error(f"Code review job failed ({review_id}): {e}")
+        review.mark_failed()
+    else:
+        review.review_result = result.text
+        review.suggestions = result.suggestions
+        review.served_from_cache = result.cached
+        review.ai_model = result.model
+        review.tokens_used = result.tokens_used
+        if result.text in CANNED_RESPONSES:
+            review.mark_failed()
+        else:
+            review.mark_completed()
+        record_ai_usage(review.user_id, 'code_review', result, review.title,
+                        context={'review_id': str(review.id), 'language': review.language})
+
+    notify_user(review.user_id, {
+        'type': 'code_review_done',
+        'review_id': str(review.id),
+        'status': review.status,
+        'cached': review.served_from_cache,
+    })
+
+
+@worker_process_init.connect
+def warm_up_provider_connections(**kwargs):
+    """子プロセスの起動時に、使い回すイベントループでAIプロバイダーへの接続を張っておく"""
+    try:
+        run_async(get_sister_ai().clients.warm_up())
+    except Exception as e:
+        logger.warning(f"Provider connection warm-up failed: {e}")
+
+
+@worker_process_shutdown.connect
+def flush_usage_records(**kwargs):
+    """プリフォークの子プロセスは atexit を通らずに終了するので、ここで利用記録を書き込む"""
+    flush_telemetry_buffer()
+    if _event_loop is not None and not _event_loop.is_closed():
+        run_async(get_sister_ai().clients.aclose())
+
+
+@shared_task(ignore_result=True)
+def rollup_ai_usage(days: Optional[int] = None):
+    """直近の AIModelUsage を日次集計に反映（celery beat で定期的に実行）"""
+    count = update_usage_rollups(days or settings.SISTER_AI_USAGE_ROLLUP_DAYS)
+    logger.info(f"AI usage rollup updated ({count} rows)")
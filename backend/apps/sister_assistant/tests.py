@@ -0,0 +1,202 @@
+"""
+Sister Assistant Tests
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import AIModelPrice, AIModelUsage, AIModelUsageDaily, ChatMessage, ChatSession, CodeReview, UserInteraction
+from .services import (
+    dashboard_stats_cache_key,
+    get_dashboard_stats,
+    monthly_usage,
+    reprice_usage,
+    update_usage_rollups,
+    usage_summary,
+    write_telemetry_rows,
+)
+
+
+class QueryPlanTests(TestCase):
+    """よく実行する処理のクエリが想定した複合インデックスを使っているか"""
+
+    def test_hot_paths_use_expected_indexes(self):
+        out = StringIO()
+        # 使っていなければ CommandError になる
+        call_command('sister_query_plans', stdout=out)
+        self.assertNotIn('FAIL', out.getvalue())
+
+
+class LargeTableAdminTests(TestCase):
+    """件数の多いテーブルの管理画面がテーブル全体を走査するクエリを出さないか"""
+
+    def setUp(self):
+        user = User.objects.create_superuser(username='admin', password='x')
+        session = ChatSession.objects.create(user=user, title='chat')
+        ChatMessage.objects.create(session=session, role='user', content='こんにちは')
+        UserInteraction.objects.create(user=user, interaction_type='chat', content='こんにちは')
+        AIModelUsage.objects.create(user=user, model_name='claude-3-sonnet', feature_used='chat')
+        self.client.force_login(user)
+
+    def test_changelists_do_not_collect_distinct_dates(self):
+        for model in ('chatmessage', 'userinteraction', 'aimodelusage'):
+            url = reverse(f'admin:sister_assistant_{model}_changelist')
+            for params in ({}, {'timestamp__gte': (timezone.now() - timedelta(days=7)).isoformat()}):
+                with self.subTest(model=model, params=params), CaptureQueriesContext(connection) as captured:
+                    response = self.client.get(url, params)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertContains(response, 'こんにちは' if model != 'aimodelusage' else 'claude-3-sonnet')
+                    self.assertFalse([q['sql'] for q in captured.captured_queries if 'DISTINCT' in q['sql']])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class DashboardStatsCacheTests(TestCase):
+    """ダッシュボードのキャッシュの破棄と更新"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='dashboard')
+        self.older = ChatSession.objects.create(user=self.user, title='older')
+        self.newer = ChatSession.objects.create(user=self.user, title='newer')
+
+    def test_chat_message_keeps_snapshot_and_reorders_recent_chats(self):
+        get_dashboard_stats(self.user.pk)
+
+        self.older.save(update_fields=['updated_at'])
+
+        snapshot = cache.get(dashboard_stats_cache_key(self.user.pk))
+        self.assertIsNotNone(snapshot)
+        self.assertEqual([chat['title'] for chat in snapshot['recent_chats']], ['older', 'newer'])
+        self.assertEqual(snapshot['stats']['chat_sessions'], 2)
+        with self.assertNumQueries(0):
+            get_dashboard_stats(self.user.pk)
+
+    def test_new_rows_invalidate_snapshot(self):
+        get_dashboard_stats(self.user.pk)
+
+        CodeReview.objects.create(user=self.user, title='views.py', original_code='x = 1')
+
+        self.assertIsNone(cache.get(dashboard_stats_cache_key(self.user.pk)))
+        self.assertEqual(get_dashboard_stats(self.user.pk)['stats']['code_reviews'], 1)
+
+    def test_renaming_session_invalidates_snapshot(self):
+        get_dashboard_stats(self.user.pk)
+
+        self.newer.title = 'renamed'
+        self.newer.save()
+
+        self.assertIsNone(cache.get(dashboard_stats_cache_key(self.user.pk)))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class UsageRollupTests(TestCase):
+    """利用記録の日次集計と料金"""
+
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create(username='alice')
+        self.bob = User.objects.create(username='bob')
+        self.today = timezone.localdate()
+        self.yesterday = self.today - timedelta(days=1)
+        AIModelPrice.objects.create(model_name='claude-3-sonnet', input_price=Decimal('3'), output_price=Decimal('15'))
+
+    def usage(self, user, days_ago=0, model='claude-3-sonnet', feature='chat', tokens=(1000, 100)):
+        write_telemetry_rows('usage', [{
+            'user_id': user.pk,
+            'model_name': model,
+            'tokens_input': tokens[0],
+            'tokens_output': tokens[1],
+            'feature_used': feature,
+            'session_id': '',
+        }])
+        usage = AIModelUsage.objects.latest('id')
+        if days_ago:
+            # timestamp は auto_now_add なので保存後に書き換える
+            AIModelUsage.objects.filter(pk=usage.pk).update(timestamp=usage.timestamp - timedelta(days=days_ago))
+        return usage
+
+    def test_write_prices_usage_from_price_table(self):
+        self.assertEqual(self.usage(self.alice).cost_estimate, Decimal('0.004500'))
+        self.assertEqual(self.usage(self.alice, model='gpt-4').cost_estimate, Decimal('0'))
+
+    def test_rollup_groups_by_user_model_feature_and_day(self):
+        self.usage(self.alice)
+        self.usage(self.alice)
+        self.usage(self.alice, feature='code_review')
+        self.usage(self.alice, days_ago=1)
+        self.usage(self.bob)
+        self.usage(self.bob, days_ago=5)
+
+        self.assertEqual(update_usage_rollups(days=2), 4)
+
+        chat_today = AIModelUsageDaily.objects.get(user=self.alice, feature_used='chat', date=self.today)
+        self.assertEqual((chat_today.calls, chat_today.tokens_input, chat_today.tokens_output), (2, 2000, 200))
+        self.assertEqual(chat_today.cost_estimate, Decimal('0.009'))
+        self.assertTrue(AIModelUsageDaily.objects.filter(user=self.alice, date=self.yesterday).exists())
+        # 対象期間より前の利用記録は集計しない
+        self.assertFalse(AIModelUsageDaily.objects.filter(date__lt=self.yesterday).exists())
+
+    def test_rollup_is_idempotent_and_picks_up_late_rows(self):
+        self.usage(self.alice)
+        update_usage_rollups(days=1)
+        update_usage_rollups(days=1)
+        self.assertEqual(AIModelUsageDaily.objects.get().calls, 1)
+
+        self.usage(self.alice)
+        update_usage_rollups(days=1)
+
+        self.assertEqual(AIModelUsageDaily.objects.get().calls, 2)
+
+    def test_rollup_keeps_days_outside_the_window(self):
+        self.usage(self.alice, days_ago=3)
+        update_usage_rollups(days=4)
+
+        update_usage_rollups(days=1)
+
+        self.assertEqual(AIModelUsageDaily.objects.get().date, self.today - timedelta(days=3))
+
+    def test_usage_summary(self):
+        self.usage(self.alice)
+        self.usage(self.alice, model='gpt-4', tokens=(10, 10))
+        self.usage(self.bob, days_ago=1)
+        update_usage_rollups(days=2)
+
+        by_model = usage_summary(self.yesterday, self.today)
+        self.assertEqual([(row['model_name'], row['total_calls']) for row in by_model],
+                         [('claude-3-sonnet', 2), ('gpt-4', 1)])
+        self.assertEqual(by_model[0]['total_cost'], Decimal('0.009'))
+
+        alice_today = usage_summary(self.today, self.today, by=('feature_used',), user_id=self.alice.pk)
+        self.assertEqual(alice_today, [{
+            'feature_used': 'chat', 'total_calls': 2, 'total_input': 1010, 'total_output': 110,
+            'total_cost': Decimal('0.0045'),
+        }])
+        self.assertEqual(usage_summary(self.today, self.today, user_id=self.bob.pk), [])
+
+        month = monthly_usage(self.today.year, self.today.month, by=('user',), user_id=self.alice.pk)
+        self.assertEqual(month, [{
+            'user': self.alice.pk, 'total_calls': 2, 'total_input': 1010, 'total_output': 110,
+            'total_cost': Decimal('0.0045'),
+        }])
+
+    def test_reprice_usage_applies_current_prices(self):
+        old = self.usage(self.alice, days_ago=3)
+        recent = self.usage(self.alice, model='gpt-4')
+        AIModelPrice.objects.create(model_name='gpt-4', input_price=Decimal('30'), output_price=Decimal('60'))
+
+        self.assertEqual(reprice_usage(self.yesterday), 1)
+
+        recent.refresh_from_db()
+        self.assertEqual(recent.cost_estimate, Decimal('0.036000'))
+        old.refresh_from_db()
+        self.assertEqual(old.cost_estimate, Decimal('0.004500'))
@@ -0,0 +1,57 @@
+"""
+Sister Assistant Throttling
+AI呼び出しを伴うAPIのレート制限
+"""
+
+import json
+from typing import Any, Dict
+
+from django.conf import settings
+from rest_framework.exceptions import Throttled
+
+from ai_assistant.services.context_builder import estimate_tokens
+from ai_assistant.services.rate_limit import RateLimitExceeded
+
+from .services import get_rate_limiter
+
+RATE_LIMIT_MESSAGES = {
+    'user': 'お兄ちゃん、ちょっと話しかけすぎだよ...{seconds}秒待ってからまた話しかけてね。',
+    'global': 'いまみんなからの相談がいっぱいで手が回らないの...{seconds}秒後にもう一回試してね、お兄ちゃん。',
+}
+
+
+def estimate_request_tokens(payload: Any) -> int:
+    """リクエスト内容と応答の見込みから消費するトークン数を概算"""
+    text = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False, default=str)
+    return estimate_tokens(text) + settings.SISTER_AI_RATE_LIMIT_RESPONSE_TOKENS
+
+
+def rate_limit_payload(exc: RateLimitExceeded) -> Dict[str, Any]:
+    """429応答やWebSocketのエラーで返す内容"""
+    return {
+        'error': 'rate_limited',
+        'scope': exc.scope,
+        'limit': exc.dimension,
+        'retry_after': exc.retry_after_seconds,
+        'message': RATE_LIMIT_MESSAGES[exc.scope].format(seconds=exc.retry_after_seconds),
+    }
+
+
+class RateLimited(Throttled):
+    """Retry-After ヘッダー付きの構造化された429"""
+
+    def __init__(self, exc: RateLimitExceeded):
+        super().__init__(wait=exc.retry_after_seconds)
+        self.detail = rate_limit_payload(exc)
+
+
+def charge_rate_limit(request):
+    """ユーザーごと・全体のリクエスト数と推定トークン数で制限する（超えたら429）
+
+    DRFのスロットルはビューより先に動き、不正なリクエストでも枠を消費してしまうので、
+    各ビューで入力を検証してから呼ぶ。
+    """
+    try:
+        get_rate_limiter().acquire(request.user.pk, estimate_request_tokens(request.data))
+    except RateLimitExceeded as e:
+        raise RateLimited(e)
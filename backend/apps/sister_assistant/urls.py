@@ -0,0 +1,17 @@
+"""
+Sister Assistant URLs
+紗良アシスタント機能のAPI URL設定
+"""
+
+from django.urls import path
+from . import views
+
+app_name = 'sister_assistant'
+
+urlpatterns = [
+    path('sister/chat/', views.chat, name='chat'),
+    path('sister/code-review/', views.code_review, name='code_review'),
+    path('sister/code-review/<uuid:review_id>/', views.code_review_detail, name='code_review_detail'),
+    path('sister/suggestion/', views.suggestion, name='suggestion'),
+    path('sister/history/', views.history, name='history'),
+]
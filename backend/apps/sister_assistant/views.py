@@ -0,0 +1,173 @@
+"""
+Sister Assistant Views
+紗良アシスタント機能のAPIビュー
+"""
+
+import json
+import logging
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from rest_framework import status
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+
+from ai_assistant.services.scheduler import request_scope
+
+from .models import ChatMessage, ChatSession, CodeReview
+from .services import (
+    default_review_title,
+    find_previous_review,
+    get_or_create_chat_session,
+    get_personality_profile,
+    get_sister_ai,
+    perform_code_review,
+    record_ai_usage,
+    save_chat_exchange,
+    uses_response_cache,
+)
+from .tasks import run_code_review
+from .throttling import charge_rate_limit
+
+logger = logging.getLogger(__name__)
+
+
+@api_view(['POST'])
+def chat(request):
+    """紗良とのチャット"""
+    message = (request.data.get('message') or '').strip()
+    if not message:
+        return Response({'error': 'message is required'}, status=status.HTTP_400_BAD_REQUEST)
+    charge_rate_limit(request)
+
+    context = request.data.get('context') or {}
+    session = get_or_create_chat_session(request.user, request.data.get('session_id'))
+
+    sister_ai = get_sister_ai()
+    with request_scope(user=request.user.pk):
+        result = async_to_sync(sister_ai.respond)(
+            message, context, session_id=str(session.id),
+            use_cache=uses_response_cache(request.user),
+            profile=get_personality_profile(request.user),
+        )
+    save_chat_exchange(session, message, result, context)
+    record_ai_usage(request.user.pk, 'chat', result, message, str(session.id), context)
+
+    return Response({'response': result.text, 'session_id': str(session.id)})
+
+
+@api_view(['POST'])
+def code_review(request):
+    """コードレビュー"""
+    code = request.data.get('code') or ''
+    if not code.strip():
+        return Response({'error': 'code is required'}, status=status.HTTP_400_BAD_REQUEST)
+    charge_rate_limit(request)
+
+    language = request.data.get('language') or 'python'
+    review = CodeReview.objects.create(
+        user=request.user,
+        title=request.data.get('title') or default_review_title(language),
+        language=language,
+        original_code=code,
+    )
+
+    if settings.SISTER_AI_REVIEW_ASYNC:
+        # 結果は GET sister/code-review/<id>/ かWebSocketの code_review_done で受け取る
+        transaction.on_commit(lambda: run_code_review.delay(str(review.id)))
+        return Response({'review_id': str(review.id), 'status': review.status}, status=status.HTTP_202_ACCEPTED)
+
+    with request_scope(user=request.user.pk):
+        result = async_to_sync(perform_code_review)(review, find_previous_review(review))
+    review.review_result = result.text
+    review.suggestions = result.suggestions
+    review.served_from_cache = result.cached
+    review.ai_model = result.model
+    review.tokens_used = result.tokens_used
+    review.mark_completed()
+    record_ai_usage(request.user.pk, 'code_review', result, review.title,
+                    context={'review_id': str(review.id), 'language': language})
+
+    return Response({
+        'response': result.text,
+        'suggestions': result.suggestions,
+        'review_id': str(review.id),
+        'cached': result.cached,
+    })
+
+
+@api_view(['GET'])
+def code_review_detail(request, review_id):
+    """コードレビューの状態と結果"""
+    review = (
+        CodeReview.objects
+        .filter(id=review_id, user=request.user)
+        .values('id', 'status', 'review_result', 'suggestions', 'served_from_cache', 'created_at', 'completed_at')
+        .first()
+    )
+    if review is None:
+        return Response({'error': 'not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    return Response({
+        'review_id': str(review['id']),
+        'status': review['status'],
+        'response': review['review_result'],
+        'suggestions': review['suggestions'],
+        'cached': review['served_from_cache'],
+        'created_at': review['created_at'].isoformat(),
+        'completed_at': review['completed_at'].isoformat() if review['completed_at'] else None,
+    })
+
+
+@api_view(['POST'])
+def suggestion(request):
+    """プロジェクト改善提案"""
+    project_info = request.data.get('project_info')
+    if not isinstance(project_info, dict) or not project_info:
+        return Response({'error': 'project_info is required'}, status=status.HTTP_400_BAD_REQUEST)
+    charge_rate_limit(request)
+
+    sister_ai = get_sister_ai()
+    with request_scope(user=request.user.pk):
+        result = async_to_sync(sister_ai.suggest)(project_info)
+    record_ai_usage(request.user.pk, 'suggestion', result, json.dumps(project_info, ensure_ascii=False))
+
+    return Response({'response': result.text})
+
+
+@api_view(['GET'])
+def history(request):
+    """チャット履歴"""
+    session_id = request.query_params.get('session_id')
+    sessions = ChatSession.objects.filter(user=request.user)
+    try:
+        session = sessions.filter(id=session_id).first() if session_id else sessions.filter(is_active=True).first()
+    except ValidationError:
+        session = None
+    if session is None:
+        return Response({'history': [], 'session_id': None})
+
+    try:
+        limit = min(int(request.query_params.get('limit', 50)), 200)
+    except ValueError:
+        limit = 50
+
+    messages = (
+        ChatMessage.objects
+        .filter(session=session)
+        .order_by('-timestamp')
+        .values('role', 'content', 'timestamp', 'metadata')[:limit]
+    )
+    history = [
+        {
+            'role': msg['role'],
+            'content': msg['content'],
+            'timestamp': msg['timestamp'].isoformat(),
+            'metadata': msg['metadata'],
+        }
+        for msg in reversed(list(messages))
+    ]
+
+    return Response({'history': history, 'session_id': str(session.id)})
@@ -0,0 +1,10 @@
+#!/bin/sh
+# 前回起動時のメトリクスが集計に残らないよう、マルチプロセス用のディレクトリを空にしてから起動する
+set -e
+
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
+exec "$@"
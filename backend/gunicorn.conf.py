@@ -0,0 +1,18 @@
+"""
+Gunicorn Configuration
+ASGIワーカー（uvicorn）で起動し、ワーカー内のイベントループでAPIクライアントの接続を共有する
+"""
+
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', '3'))
+worker_class = 'uvicorn.workers.UvicornWorker'
+
+
+def child_exit(server, worker):
+    """終了したワーカーのメトリクスを集計から外す（PROMETHEUS_MULTIPROC_DIR を設定した場合）"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,2 +1,7 @@
 # Sister SaaS Project
-# お兄ちゃんと紗良の開発ごっこプロジェクト
\ No newline at end of file
+# お兄ちゃんと紗良の開発ごっこプロジェクト
+
+# Django起動時にCeleryアプリを読み込み、@shared_task をこのアプリに紐付ける
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
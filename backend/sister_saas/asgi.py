@@ -0,0 +1,48 @@
+"""
+Sister SaaS ASGI Configuration
+HTTPとWebSocketの両方を受け付けるASGIアプリケーション
+"""
+
+import logging
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sister_saas.settings')
+
+# Djangoの初期化をルーティングの読み込みより先に行う
+django_asgi_app = get_asgi_application()
+
+from channels.auth import AuthMiddlewareStack  # noqa: E402
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from channels.security.websocket import AllowedHostsOriginValidator  # noqa: E402
+
+from apps.sister_assistant.routing import websocket_urlpatterns  # noqa: E402
+from apps.sister_assistant.services import get_sister_ai  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+
+async def lifespan(scope, receive, send):
+    """サーバーの起動時にAIプロバイダーへの接続を張り、終了時に閉じる（ASGI lifespan）"""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await get_sister_ai().clients.warm_up()
+            except Exception as e:
+                logger.warning(f"Provider connection warm-up failed: {e}")
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await get_sister_ai().clients.aclose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+application = ProtocolTypeRouter({
+    'http': django_asgi_app,
+    'websocket': AllowedHostsOriginValidator(
+        AuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+    ),
+    'lifespan': lifespan,
+})
@@ -0,0 +1,14 @@
+"""
+Sister SaaS Celery Configuration
+バックグラウンドジョブ（コードレビューなど）用のCeleryアプリケーション
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sister_saas.settings')
+
+app = Celery('sister_saas')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
@@ -47,6 +47,7 @@ LOCAL_APPS = [
 INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
 MIDDLEWARE = [
+    'apps.core.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -174,6 +175,137 @@ ANTHROPIC_API_KEY = config('ANTHROPIC_API_KEY', default='')
 SISTER_NAME = "紗良"
 SISTER_PERSONALITY = "お兄ちゃん思いで技術的なサポートをしてくれる妹キャラクター"
 
+# 会話状態プール（ChatSessionごとの履歴をワーカー内に保持）
+SISTER_AI_SESSION_MAX_SESSIONS = config('SISTER_AI_SESSION_MAX_SESSIONS', default=1000, cast=int)
+SISTER_AI_SESSION_MAX_BYTES = config('SISTER_AI_SESSION_MAX_BYTES', default=64 * 1024 * 1024, cast=int)
+SISTER_AI_SESSION_TTL = config('SISTER_AI_SESSION_TTL', default=1800, cast=int)  # seconds
+SISTER_AI_SESSION_MAX_MESSAGES = config('SISTER_AI_SESSION_MAX_MESSAGES', default=50, cast=int)
+
+# プロンプトのトークン予算（モデル名→入力トークン数、未指定のモデルは既定値）
+SISTER_AI_CONTEXT_BUDGETS = {}
+SISTER_AI_CONTEXT_DEFAULT_BUDGET = config('SISTER_AI_CONTEXT_DEFAULT_BUDGET', default=4000, cast=int)
+
+# プロバイダーAPIのHTTPコネクションプール（ワーカーごと）
+SISTER_AI_HTTP_MAX_CONNECTIONS = config('SISTER_AI_HTTP_MAX_CONNECTIONS', default=100, cast=int)
+SISTER_AI_HTTP_MAX_KEEPALIVE = config('SISTER_AI_HTTP_MAX_KEEPALIVE', default=20, cast=int)
+SISTER_AI_HTTP_CONNECT_TIMEOUT = config('SISTER_AI_HTTP_CONNECT_TIMEOUT', default=5.0, cast=float)  # seconds
+SISTER_AI_HTTP_READ_TIMEOUT = config('SISTER_AI_HTTP_READ_TIMEOUT', default=60.0, cast=float)  # seconds
+SISTER_AI_HTTP_PREWARM_CONNECTIONS = config('SISTER_AI_HTTP_PREWARM_CONNECTIONS', default=2, cast=int)
+
+# 負荷試験用の擬似プロバイダー（live: 本物のAPI / fake: プロセス内 / fake_server: manage.py fake_provider で起動したサーバー）
+SISTER_AI_PROVIDER_BACKEND = config('SISTER_AI_PROVIDER_BACKEND', default='live')
+SISTER_AI_FAKE_PROVIDER_URL = config('SISTER_AI_FAKE_PROVIDER_URL', default='http://127.0.0.1:8765')
+SISTER_AI_FAKE_PROVIDER = {
+    'latency': config('SISTER_AI_FAKE_LATENCY', default='lognormal'),  # fixed / uniform / lognormal
+    'latency_median': config('SISTER_AI_FAKE_LATENCY_MEDIAN', default=0.8, cast=float),  # seconds
+    'latency_p99': config('SISTER_AI_FAKE_LATENCY_P99', default=3.0, cast=float),  # seconds
+    'tokens_per_second': config('SISTER_AI_FAKE_TOKENS_PER_SECOND', default=60.0, cast=float),
+    'response_tokens': config('SISTER_AI_FAKE_RESPONSE_TOKENS', default=200, cast=int),
+    'error_rate': config('SISTER_AI_FAKE_ERROR_RATE', default=0.0, cast=float),
+    'rate_limit_rate': config('SISTER_AI_FAKE_RATE_LIMIT_RATE', default=0.0, cast=float),
+}
+
+# ヘッジリクエスト（Claudeが遅い時にOpenAIも並行して呼ぶ）
+SISTER_AI_HEDGING_ENABLED = config('SISTER_AI_HEDGING_ENABLED', default=False, cast=bool)
+SISTER_AI_HEDGING_PERCENTILE = config('SISTER_AI_HEDGING_PERCENTILE', default=0.95, cast=float)
+SISTER_AI_HEDGING_INITIAL_DELAY = config('SISTER_AI_HEDGING_INITIAL_DELAY', default=3.0, cast=float)  # seconds
+SISTER_AI_HEDGING_MIN_DELAY = config('SISTER_AI_HEDGING_MIN_DELAY', default=0.5, cast=float)  # seconds
+SISTER_AI_HEDGING_MAX_DELAY = config('SISTER_AI_HEDGING_MAX_DELAY', default=15.0, cast=float)  # seconds
+
+# プロバイダーのサーキットブレーカー（SHARED でRedis経由でワーカー間共有）
+SISTER_AI_CIRCUIT_BREAKER_ENABLED = config('SISTER_AI_CIRCUIT_BREAKER_ENABLED', default=True, cast=bool)
+SISTER_AI_CIRCUIT_BREAKER_SHARED = config('SISTER_AI_CIRCUIT_BREAKER_SHARED', default=False, cast=bool)
+SISTER_AI_CIRCUIT_BREAKER_WINDOW = config('SISTER_AI_CIRCUIT_BREAKER_WINDOW', default=60.0, cast=float)  # seconds
+SISTER_AI_CIRCUIT_BREAKER_MIN_CALLS = config('SISTER_AI_CIRCUIT_BREAKER_MIN_CALLS', default=10, cast=int)
+SISTER_AI_CIRCUIT_BREAKER_ERROR_RATE = config('SISTER_AI_CIRCUIT_BREAKER_ERROR_RATE', default=0.5, cast=float)
+SISTER_AI_CIRCUIT_BREAKER_SLOW_CALL = config('SISTER_AI_CIRCUIT_BREAKER_SLOW_CALL', default=20.0, cast=float)  # seconds
+SISTER_AI_CIRCUIT_BREAKER_OPEN_DURATION = config(
+    'SISTER_AI_CIRCUIT_BREAKER_OPEN_DURATION', default=30.0, cast=float
+)  # seconds
+
+# プロバイダー呼び出しのアドミッション制御（上限はワーカープロセスごと）
+SISTER_AI_SCHEDULER_ENABLED = config('SISTER_AI_SCHEDULER_ENABLED', default=True, cast=bool)
+SISTER_AI_SCHEDULER_MAX_CONCURRENCY = config('SISTER_AI_SCHEDULER_MAX_CONCURRENCY', default=16, cast=int)
+SISTER_AI_SCHEDULER_PROVIDER_LIMITS = {}  # {'claude': 16, 'openai': 8} のようにプロバイダー別に指定
+SISTER_AI_SCHEDULER_RESERVED_INTERACTIVE = config('SISTER_AI_SCHEDULER_RESERVED_INTERACTIVE', default=4, cast=int)
+SISTER_AI_SCHEDULER_MAX_WAIT = config('SISTER_AI_SCHEDULER_MAX_WAIT', default=30.0, cast=float)  # seconds
+
+# AI呼び出しのレート制限（1分あたり、0で無効。SHAREDでRedisを使い全ワーカー合計で数える）
+SISTER_AI_RATE_LIMIT_ENABLED = config('SISTER_AI_RATE_LIMIT_ENABLED', default=True, cast=bool)
+SISTER_AI_RATE_LIMIT_SHARED = config('SISTER_AI_RATE_LIMIT_SHARED', default=True, cast=bool)
+SISTER_AI_RATE_LIMIT_USER_REQUESTS = config('SISTER_AI_RATE_LIMIT_USER_REQUESTS', default=20, cast=int)
+SISTER_AI_RATE_LIMIT_USER_TOKENS = config('SISTER_AI_RATE_LIMIT_USER_TOKENS', default=40000, cast=int)
+SISTER_AI_RATE_LIMIT_GLOBAL_REQUESTS = config('SISTER_AI_RATE_LIMIT_GLOBAL_REQUESTS', default=600, cast=int)
+SISTER_AI_RATE_LIMIT_GLOBAL_TOKENS = config('SISTER_AI_RATE_LIMIT_GLOBAL_TOKENS', default=1000000, cast=int)
+SISTER_AI_RATE_LIMIT_RESPONSE_TOKENS = config('SISTER_AI_RATE_LIMIT_RESPONSE_TOKENS', default=800, cast=int)  # 応答の見込み
+
+# コードレビュー結果キャッシュ（CACHES の default を使用）
+SISTER_AI_REVIEW_CACHE_ENABLED = config('SISTER_AI_REVIEW_CACHE_ENABLED', default=True, cast=bool)
+SISTER_AI_REVIEW_CACHE_TTL = config('SISTER_AI_REVIEW_CACHE_TTL', default=7 * 24 * 3600, cast=int)  # seconds
+SISTER_AI_REVIEW_CACHE_NORMALIZE = config('SISTER_AI_REVIEW_CACHE_NORMALIZE', default=True, cast=bool)
+SISTER_AI_REVIEW_CACHE_MAX_ENTRY_BYTES = config('SISTER_AI_REVIEW_CACHE_MAX_ENTRY_BYTES', default=64 * 1024, cast=int)
+
+# 似た質問への応答キャッシュ（ワーカー内のMinHashインデックス）
+SISTER_AI_SEMANTIC_CACHE_ENABLED = config('SISTER_AI_SEMANTIC_CACHE_ENABLED', default=False, cast=bool)
+SISTER_AI_SEMANTIC_CACHE_THRESHOLD = config('SISTER_AI_SEMANTIC_CACHE_THRESHOLD', default=0.8, cast=float)
+SISTER_AI_SEMANTIC_CACHE_TTL = config('SISTER_AI_SEMANTIC_CACHE_TTL', default=3600, cast=int)  # seconds
+SISTER_AI_SEMANTIC_CACHE_MAX_ENTRIES = config('SISTER_AI_SEMANTIC_CACHE_MAX_ENTRIES', default=2000, cast=int)
+SISTER_AI_SEMANTIC_CACHE_MAX_BYTES = config('SISTER_AI_SEMANTIC_CACHE_MAX_BYTES', default=16 * 1024 * 1024, cast=int)
+
+# 同じ内容の同時リクエストを1回のAI呼び出しにまとめる（SHAREDでワーカー間もRedisでまとめる）
+SISTER_AI_SINGLEFLIGHT_ENABLED = config('SISTER_AI_SINGLEFLIGHT_ENABLED', default=True, cast=bool)
+SISTER_AI_SINGLEFLIGHT_SHARED = config('SISTER_AI_SINGLEFLIGHT_SHARED', default=False, cast=bool)
+SISTER_AI_SINGLEFLIGHT_LOCK_TTL = config('SISTER_AI_SINGLEFLIGHT_LOCK_TTL', default=120, cast=int)  # seconds
+
+# お兄ちゃんごとの紗良設定のキャッシュ（保存時に破棄。描画済みプロンプトは設定の内容で共有する）
+SISTER_AI_PERSONALITY_CACHE_TTL = config('SISTER_AI_PERSONALITY_CACHE_TTL', default=3600, cast=int)  # seconds
+
+# ダッシュボードの件数と最新の一覧のキャッシュ（チャット・レビュー・提案の保存・削除時に破棄）
+DASHBOARD_STATS_CACHE_TTL = config('DASHBOARD_STATS_CACHE_TTL', default=300, cast=int)  # seconds
+
+# コードレビューはCeleryの専用キューで処理する（Falseでリクエスト内で処理）
+SISTER_AI_REVIEW_ASYNC = config('SISTER_AI_REVIEW_ASYNC', default=True, cast=bool)
+SISTER_AI_REVIEW_QUEUE = config('SISTER_AI_REVIEW_QUEUE', default='code_review')
+
+# 大きなコードは関数・クラス単位に分割して並行にレビューする（トークン数は概算）
+SISTER_AI_REVIEW_CHUNKING_ENABLED = config('SISTER_AI_REVIEW_CHUNKING_ENABLED', default=True, cast=bool)
+SISTER_AI_REVIEW_CHUNK_THRESHOLD = config('SISTER_AI_REVIEW_CHUNK_THRESHOLD', default=2000, cast=int)
+SISTER_AI_REVIEW_CHUNK_MAX_TOKENS = config('SISTER_AI_REVIEW_CHUNK_MAX_TOKENS', default=1500, cast=int)
+SISTER_AI_REVIEW_CHUNK_PARALLEL = config('SISTER_AI_REVIEW_CHUNK_PARALLEL', default=4, cast=int)
+
+# 同じタイトルの前回のレビューがあれば差分だけをレビューする
+SISTER_AI_REVIEW_INCREMENTAL_ENABLED = config('SISTER_AI_REVIEW_INCREMENTAL_ENABLED', default=True, cast=bool)
+SISTER_AI_REVIEW_INCREMENTAL_MIN_TOKENS = config('SISTER_AI_REVIEW_INCREMENTAL_MIN_TOKENS', default=1000, cast=int)
+SISTER_AI_REVIEW_INCREMENTAL_MAX_CHANGED_RATIO = config(
+    'SISTER_AI_REVIEW_INCREMENTAL_MAX_CHANGED_RATIO', default=0.5, cast=float
+)
+
+# AIの利用記録（AIModelUsage・UserInteraction）はためてから bulk_create する
+# （件数か間隔で書き込む。SHAREDでRedisのリストにため、どのワーカーからでも書き込む）
+SISTER_AI_TELEMETRY_BUFFER_ENABLED = config('SISTER_AI_TELEMETRY_BUFFER_ENABLED', default=True, cast=bool)
+SISTER_AI_TELEMETRY_BUFFER_SHARED = config('SISTER_AI_TELEMETRY_BUFFER_SHARED', default=False, cast=bool)
+SISTER_AI_TELEMETRY_BATCH_SIZE = config('SISTER_AI_TELEMETRY_BATCH_SIZE', default=200, cast=int)
+SISTER_AI_TELEMETRY_FLUSH_INTERVAL = config('SISTER_AI_TELEMETRY_FLUSH_INTERVAL', default=5.0, cast=float)  # seconds
+SISTER_AI_TELEMETRY_MAX_BUFFERED = config('SISTER_AI_TELEMETRY_MAX_BUFFERED', default=10000, cast=int)
+
+# AI利用量の日次集計（AIModelUsageDaily）。celery beat で INTERVAL ごとに直近 DAYS 日分を集計し直す
+# （日付が変わった直後に書き込まれた前日分も拾えるよう、DAYS は2以上にする）
+SISTER_AI_USAGE_ROLLUP_INTERVAL = config('SISTER_AI_USAGE_ROLLUP_INTERVAL', default=600, cast=int)  # seconds
+SISTER_AI_USAGE_ROLLUP_DAYS = config('SISTER_AI_USAGE_ROLLUP_DAYS', default=2, cast=int)
+
+# メトリクス（/metrics/ でPrometheus形式で公開。TOKEN を設定すると Authorization: Bearer が必要）
+# TOKEN が空のときは、ALLOWED_NETWORKS からプロキシを通さずに来たリクエストにだけ公開する
+# 複数のワーカープロセスの値を合計する場合は、各プロセスの起動前に環境変数
+# PROMETHEUS_MULTIPROC_DIR に共有の空ディレクトリを設定する（Dockerイメージでは設定済み。
+# 終了したワーカーの分は gunicorn.conf.py の child_exit フックで外す）
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_AUTH_TOKEN = config('METRICS_AUTH_TOKEN', default='')
+METRICS_ALLOWED_NETWORKS = config(
+    'METRICS_ALLOWED_NETWORKS',
+    default='127.0.0.0/8,::1/128,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16,fc00::/7',
+    cast=lambda v: [s.strip() for s in v.split(',') if s.strip()],
+)
+
 # Celery Configuration
 CELERY_BROKER_URL = REDIS_URL
 CELERY_RESULT_BACKEND = REDIS_URL
@@ -181,6 +313,16 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_TASK_ROUTES = {
+    'apps.sister_assistant.tasks.run_code_review': {'queue': SISTER_AI_REVIEW_QUEUE},
+}
+CELERY_BEAT_SCHEDULE = {
+    'rollup-ai-usage': {
+        'task': 'apps.sister_assistant.tasks.rollup_ai_usage',
+        'schedule': SISTER_AI_USAGE_ROLLUP_INTERVAL,
+        'options': {'expires': SISTER_AI_USAGE_ROLLUP_INTERVAL},
+    },
+}
 
 # Logging
 LOGGING = {
@@ -17,6 +17,10 @@ function sisterChat() {
         ],
         isTyping: false,
         socket: null,
+        reconnectAttempts: 0,
+        awaitingSocketReply: false,
+        streamingMessage: null,
+        sessionId: null,
 
         init() {
             this.initWebSocket();
@@ -52,6 +56,21 @@ function sisterChat() {
             // Show typing indicator
             this.showTyping();
 
+            // WebSocketが使える時はストリーミングで受け取る
+            if (this.socket && this.socket.readyState === WebSocket.OPEN) {
+                this.awaitingSocketReply = true;
+                this.socket.send(JSON.stringify({
+                    type: 'chat',
+                    message: messageContent,
+                    session_id: this.sessionId,
+                    context: {
+                        page: window.location.pathname,
+                        timestamp: new Date().toISOString()
+                    }
+                }));
+                return;
+            }
+
             try {
                 // Send message to backend
                 const response = await this.sendToSister(messageContent);
@@ -96,6 +115,7 @@ function sisterChat() {
                 },
                 body: JSON.stringify({
                     message: message,
+                    session_id: this.sessionId,
                     context: {
                         page: window.location.pathname,
                         timestamp: new Date().toISOString()
@@ -103,11 +123,18 @@ function sisterChat() {
                 })
             });
 
+            if (response.status === 429) {
+                // 話しかけすぎの場合は紗良からの返事として待ち時間を伝える
+                const data = await response.json();
+                return data.message;
+            }
+
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
 
             const data = await response.json();
+            this.sessionId = data.session_id || this.sessionId;
             return data.response;
         },
 
@@ -153,6 +180,7 @@ function sisterChat() {
                 const response = await fetch('/api/v1/sister/history/');
                 if (response.ok) {
                     const data = await response.json();
+                    this.sessionId = data.session_id || this.sessionId;
                     // Load recent history (keep welcome message)
                     if (data.history && data.history.length > 0) {
                         const recentHistory = data.history.slice(-10);
@@ -172,31 +200,93 @@ function sisterChat() {
         },
 
         initWebSocket() {
-            // WebSocket connection for real-time updates
-            if (typeof io !== 'undefined') {
-                this.socket = io('/sister-chat');
-                
-                this.socket.on('sister_response', (data) => {
-                    const sisterMessage = {
+            // WebSocket connection for real-time streaming responses
+            if (typeof WebSocket === 'undefined') return;
+
+            const protocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
+            this.socket = new WebSocket(`${protocol}://${window.location.host}/ws/sister/chat/`);
+            sisterSocket = this.socket;
+
+            this.socket.onmessage = (event) => {
+                const data = JSON.parse(event.data);
+
+                if (data.type === 'sister_start') {
+                    this.streamingMessage = null;
+                    this.sessionId = data.session_id || this.sessionId;
+                } else if (data.type === 'sister_delta') {
+                    if (!this.streamingMessage) {
+                        // 最初のトークンが届いたら入力中表示を差し替える
+                        this.hideTyping();
+                        this.streamingMessage = {
+                            type: 'sister',
+                            content: '',
+                            timestamp: new Date()
+                        };
+                        this.messages.push(this.streamingMessage);
+                    }
+                    this.streamingMessage.content += data.delta;
+                } else if (data.type === 'sister_done') {
+                    this.awaitingSocketReply = false;
+                    if (!this.streamingMessage) {
+                        this.hideTyping();
+                        this.messages.push({
+                            type: 'sister',
+                            content: data.message,
+                            timestamp: new Date()
+                        });
+                    }
+                    this.streamingMessage = null;
+                } else if (data.type === 'sister_error') {
+                    this.awaitingSocketReply = false;
+                    this.hideTyping();
+                    this.streamingMessage = null;
+                    this.messages.push({
+                        type: 'sister',
+                        content: data.message || 'お兄ちゃん、ごめんね...今ちょっと調子が悪いみたい。少し待ってもらえる？',
+                        timestamp: new Date()
+                    });
+                } else if (data.type === 'code_review_done') {
+                    notifyCodeReviewDone(data.review_id);
+                } else if (data.type === 'sister_response') {
+                    this.messages.push({
                         type: 'sister',
                         content: data.message,
                         timestamp: new Date()
-                    };
-                    
-                    this.messages.push(sisterMessage);
-                    this.$nextTick(() => {
-                        this.scrollToBottom();
                     });
-                });
+                }
 
-                this.socket.on('connect', () => {
-                    console.log('Connected to Sister Chat WebSocket');
+                this.$nextTick(() => {
+                    this.scrollToBottom();
                 });
+            };
 
-                this.socket.on('disconnect', () => {
-                    console.log('Disconnected from Sister Chat WebSocket');
-                });
-            }
+            this.socket.onopen = () => {
+                console.log('Connected to Sister Chat WebSocket');
+                this.reconnectAttempts = 0;
+            };
+
+            this.socket.onclose = () => {
+                console.log('Disconnected from Sister Chat WebSocket');
+                // 応答の途中で切れたら入力中表示を消して、途切れたことを伝える
+                if (this.awaitingSocketReply) {
+                    this.awaitingSocketReply = false;
+                    this.hideTyping();
+                    this.messages.push({
+                        type: 'sister',
+                        content: 'お兄ちゃん、ごめんね...接続が切れちゃったみたい。もう一回送ってくれる？',
+                        timestamp: new Date()
+                    });
+                }
+                this.streamingMessage = null;
+                this.scheduleReconnect();
+            };
+        },
+
+        scheduleReconnect() {
+            // 1秒から倍々に待って、最大30秒ごとにつなぎ直す
+            const delay = Math.min(30000, 1000 * 2 ** this.reconnectAttempts);
+            this.reconnectAttempts += 1;
+            setTimeout(() => this.initWebSocket(), delay);
         },
 
         formatTimestamp(timestamp) {
@@ -311,13 +401,81 @@ function requestCodeReview(code, language = 'python') {
         })
     })
     .then(response => response.json())
-    .then(data => data.response)
+    .then(data => {
+        if (data.error === 'rate_limited') {
+            return data.message;
+        }
+        return data.status === 'pending' ? waitForCodeReview(data.review_id) : data.response;
+    })
     .catch(error => {
         console.error('Code review error:', error);
         return 'お兄ちゃん、コードレビューでエラーが発生しちゃった...ごめんね。';
     });
 }
 
+// チャットのWebSocket（レビュー完了の通知も同じ接続で届く）
+let sisterSocket = null;
+// 完了を待っているレビュー（review_id → 結果を取りに行く関数）
+const codeReviewWaiters = new Map();
+
+function notifyCodeReviewDone(reviewId) {
+    const fetchResult = codeReviewWaiters.get(reviewId);
+    if (fetchResult) {
+        fetchResult();
+    }
+}
+
+// レビューはバックグラウンドで処理されるので、終わったら結果を取得する
+// WebSocketがつながっている間は code_review_done の通知を待ち、切れている間だけ結果を確認しに行く
+function waitForCodeReview(reviewId, interval = 1500, timeout = 180000) {
+    return new Promise((resolve, reject) => {
+        const deadline = Date.now() + timeout;
+        let timer = null;
+        let checkedWhileConnected = false;
+
+        const finish = (error, response) => {
+            clearTimeout(timer);
+            codeReviewWaiters.delete(reviewId);
+            if (error) {
+                reject(error);
+            } else {
+                resolve(response);
+            }
+        };
+
+        const fetchResult = () => fetch(`/api/v1/sister/code-review/${reviewId}/`)
+            .then(response => response.json())
+            .then(data => {
+                if (data.status === 'failed' && !data.response) {
+                    finish(new Error('Code review failed'));
+                } else if (data.status !== 'pending') {
+                    finish(null, data.response);
+                }
+            })
+            .catch(error => finish(error));
+
+        const tick = () => {
+            if (!codeReviewWaiters.has(reviewId)) return;
+            if (Date.now() > deadline) {
+                finish(new Error('Code review timed out'));
+                return;
+            }
+            // 最初と、つながり直した直後は通知を取りこぼしていないか一度だけ確認する
+            const connected = sisterSocket !== null && sisterSocket.readyState === WebSocket.OPEN;
+            const check = connected && checkedWhileConnected ? Promise.resolve() : fetchResult();
+            checkedWhileConnected = connected;
+            check.then(() => {
+                if (codeReviewWaiters.has(reviewId)) {
+                    timer = setTimeout(tick, interval);
+                }
+            });
+        };
+
+        codeReviewWaiters.set(reviewId, fetchResult);
+        tick();
+    });
+}
+
 function requestSuggestion(projectInfo) {
     return fetch('/api/v1/sister/suggestion/', {
         method: 'POST',
@@ -330,7 +488,7 @@ function requestSuggestion(projectInfo) {
         })
     })
     .then(response => response.json())
-    .then(data => data.response)
+    .then(data => data.error === 'rate_limited' ? data.message : data.response)
     .catch(error => {
         console.error('Suggestion error:', error);
         return 'お兄ちゃん、提案を考えるのにちょっと時間がかかっちゃう...待ってて。';